@@ -1,39 +1,69 @@
 import logging
-from flask import Flask
+import tempfile
+from flask import Flask, Request, request
 from flask_cors import CORS
+from config import UPLOAD_SPOOL_THRESHOLD
 from routes.metadata_routes import metadata_bp
-from routes.privacy_filter_routes import privacy_filter_bp
-from routes.metadata_removal_routes import metadata_removal_bp
+from routes.privacy_filter_routes import privacy_filter_bp, REDACTION_HEADERS
+from routes.metadata_removal_routes import metadata_removal_bp, REPORT_HEADERS
 from routes.vision_analysis_routes import vision_analysis_bp
+from routes.cache_routes import cache_bp
+from routes.job_routes import jobs_bp
+from routes.upstream_routes import upstream_bp
+from routes.metrics_routes import metrics_bp, init_request_metrics
+from services.logging_service import configure_logging, start_request_logging
+from services.storage_service import start_sweeper
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-def create_app():
+class SpooledUploadRequest(Request):
+    """
+    Keep uploaded files in memory up to UPLOAD_SPOOL_THRESHOLD.
+
+    Werkzeug's default writes anything over 500 KB to a temp file; this keeps
+    typical photos in memory and only spills large uploads to disk.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+
+# Expose the download name, metadata verification and redaction headers to the browser
+EXPOSE_HEADERS = ['Content-Disposition'] + REPORT_HEADERS + REDACTION_HEADERS
+
+def _start_request_logging():
+    start_request_logging(request.headers.get('X-Request-ID'))
+
+def create_app(cors=True):
+    """
+    Build the Flask app.
+
+    Args:
+        cors: Add CORS headers; the ASGI app turns this off because it
+            applies CORS itself around the mounted Flask app
+    """
     app = Flask(__name__)
+    app.request_class = SpooledUploadRequest
 
     # Enable CORS for all routes, allowing requests from http://localhost:3000
     # You can restrict origins if you only trust certain domains
-    CORS(app, resources={r"*": {"origins": "*"}})
+    if cors:
+        CORS(app, resources={r"*": {"origins": "*"}}, expose_headers=EXPOSE_HEADERS)
 
     # Register blueprints
     app.register_blueprint(metadata_bp, url_prefix='/metadata')
     app.register_blueprint(privacy_filter_bp, url_prefix='/privacy')
     app.register_blueprint(metadata_removal_bp, url_prefix='/metadata-removal')
     app.register_blueprint(vision_analysis_bp, url_prefix='/vision')
+    app.register_blueprint(cache_bp, url_prefix='/cache')
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
+    app.register_blueprint(upstream_bp, url_prefix='/upstreams')
+    app.register_blueprint(metrics_bp)
+    init_request_metrics(app)
+
+    app.before_request(_start_request_logging)
+    start_sweeper()
 
     logger.info("Flask app has been created and blueprints have been registered.")
-    logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(name)s - %(message)s',
-    handlers=[
-        logging.FileHandler("debug.log"),
-        logging.StreamHandler()
-    ]
-)
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,285 @@
+"""
+Asyncio-native serving mode.
+
+The I/O-bound routes (vision analysis, LLM risk analysis and the privacy
+filter) are served by coroutines that await Groq and Segmind through async
+HTTP clients, so a request waiting on an upstream holds no thread. Image
+decoding and encoding run on the blocking executor. Every other route is
+served by the Flask app mounted underneath, so paths and payloads are the
+same in both modes.
+
+Run from the backend directory:
+    uvicorn asgi:app --port 5000
+or
+    python asgi.py
+"""
+import io
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from app import EXPOSE_HEADERS, create_app
+from config import WSGI_FALLBACK_WORKERS
+from routes.privacy_filter_routes import output_mimetype, parse_filter_options
+from services.async_service import run_blocking
+from services.blur_service import remove_text_from_image_async
+from services.cache_service import cached_async, content_digest
+from services.exif_service import extract_metadata
+from services.local_privacy_service import remove_text_locally
+from services.logging_service import start_request_logging
+from services.metrics_service import observe_request, request_duration, time_stage
+from services.risk_analysis_service import ENRICHMENT_MODES, assess_metadata_risks_async
+from services.upstream_service import upstreams
+from services.vision_analysis_service import (COMPREHENSIVE_MODES, DEFAULT_COMPREHENSIVE_MODE,
+                                              analyze_image_comprehensive_async, analyze_image_description_async,
+                                              close_async_groq_clients, detect_objects_in_image_async)
+
+logger = logging.getLogger(__name__)
+
+
+def _succeeded(result):
+    # Upstream failures (missing key, rate limits) must not be cached
+    return bool(result) and result.get('success', False)
+
+
+def _error(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+async def _uploaded_file(request):
+    """The uploaded file and its bytes: (upload, data, None) or (None, None, error response)."""
+    with time_stage('upload_parse'):
+        form = await request.form()
+    upload = form.get('file')
+    if upload is None or isinstance(upload, str):
+        logger.error("No file part in request")
+        return None, None, _error('No file uploaded', 400)
+    if not upload.filename:
+        logger.error("Empty filename")
+        return None, None, _error('No selected file', 400)
+    return upload, await upload.read(), None
+
+
+async def get_image_description(request):
+    logger.info("Received request for image description")
+    _, data, error = await _uploaded_file(request)
+    if error:
+        return error
+
+    try:
+        digest = await run_blocking(content_digest, data)
+        result = await cached_async('vision-description', digest, None,
+                                    lambda: analyze_image_description_async(data), is_cacheable=_succeeded)
+        if not result['success']:
+            return _error(result['error'], 500)
+        return JSONResponse({'success': True, 'description': result['description']})
+
+    except Exception as e:
+        logger.error(f"Image description analysis failed: {str(e)}")
+        return _error('Internal server error', 500)
+
+
+async def get_detected_objects(request):
+    logger.info("Received request for object detection")
+    _, data, error = await _uploaded_file(request)
+    if error:
+        return error
+
+    try:
+        digest = await run_blocking(content_digest, data)
+        result = await cached_async('vision-objects', digest, None,
+                                    lambda: detect_objects_in_image_async(data), is_cacheable=_succeeded)
+        if not result['success']:
+            return _error(result['error'], 500)
+        return JSONResponse({
+            'success': True,
+            'objects': result['objects'],
+            'object_count': result['object_count'],
+            'note': result.get('note', '')
+        })
+
+    except Exception as e:
+        logger.error(f"Object detection failed: {str(e)}")
+        return _error('Internal server error', 500)
+
+
+async def get_comprehensive_analysis(request):
+    logger.info("Received request for comprehensive vision analysis")
+    _, data, error = await _uploaded_file(request)
+    if error:
+        return error
+
+    mode = request.query_params.get('mode', DEFAULT_COMPREHENSIVE_MODE)
+    if mode not in COMPREHENSIVE_MODES:
+        logger.error("Invalid comprehensive analysis mode: %s", mode)
+        return _error(f'Invalid mode, expected one of {list(COMPREHENSIVE_MODES)}', 400)
+
+    try:
+        digest = await run_blocking(content_digest, data)
+        result = await cached_async('vision-comprehensive', digest, {'mode': mode},
+                                    lambda: analyze_image_comprehensive_async(data, mode), is_cacheable=_succeeded)
+        if not result['success']:
+            return JSONResponse({
+                'success': False,
+                'errors': result['errors'],
+                'partial_results': {
+                    'description': result.get('description', ''),
+                    'objects': result.get('objects', []),
+                    'object_count': result.get('object_count', 0)
+                }
+            }, status_code=500)
+        return JSONResponse({
+            'success': True,
+            'description': result['description'],
+            'objects': result['objects'],
+            'object_count': result['object_count']
+        })
+
+    except Exception as e:
+        logger.error(f"Comprehensive vision analysis failed: {str(e)}")
+        return _error('Internal server error', 500)
+
+
+async def analyze_metadata(request):
+    logger.info("Received request at /metadata/analyze endpoint.")
+
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type == 'application/json' or content_type.endswith('+json'):
+        try:
+            metadata = json.loads(await request.body())
+            if not isinstance(metadata, dict):
+                raise ValueError(f"expected a JSON object, got {type(metadata).__name__}")
+        except Exception as e:
+            logger.error(f"JSON parsing error: {str(e)}")
+            return _error('Invalid JSON format', 400)
+
+    elif content_type == 'multipart/form-data':
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            logger.error("No valid input provided - missing both file and JSON")
+            return _error('No valid input provided', 400)
+        if not upload.filename:
+            return _error('No selected file', 400)
+        try:
+            data = await upload.read()
+            digest = await run_blocking(content_digest, data)
+            metadata = await cached_async('metadata', digest, None, lambda: run_blocking(extract_metadata, data))
+        except Exception as e:
+            logger.error(f"File processing error: {str(e)}")
+            return _error('File processing failed', 400)
+
+    else:
+        logger.error("No valid input provided - missing both file and JSON")
+        return _error('No valid input provided', 400)
+
+    enrichment = request.query_params.get('enrich')
+    if enrichment is not None and enrichment not in ENRICHMENT_MODES:
+        return _error(f'Invalid enrich mode, expected one of {list(ENRICHMENT_MODES)}', 400)
+
+    try:
+        risk_report = await assess_metadata_risks_async(metadata, enrichment)
+        logger.info("Risk analysis completed successfully")
+        return JSONResponse({'metadata': metadata, 'risk_analysis': risk_report})
+    except Exception as e:
+        logger.error(f"Risk analysis failed: {str(e)}")
+        return _error('Risk analysis failed', 500)
+
+
+def _inline_disposition(filename):
+    # Same disposition Flask's send_file uses for a download_name
+    try:
+        filename.encode('ascii')
+        return f'inline; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"inline; filename*=UTF-8''{quote(filename)}"
+
+
+async def privacy_filter(request):
+    logger.info("Received privacy filter request")
+    upload, data, error = await _uploaded_file(request)
+    if error:
+        return error
+
+    options, error = parse_filter_options(await request.form())
+    if error:
+        return _error(error, 400)
+
+    try:
+        logger.info("Processing image (engine=%s)...", options['engine'])
+        output = io.BytesIO()
+        if options['engine'] == 'local':
+            succeeded = await run_blocking(remove_text_locally, data, output,
+                                           options['threshold'], options['action'])
+        else:
+            succeeded = await remove_text_from_image_async(data, output, options['threshold'])
+        if not succeeded:
+            return _error('Text removal failed', 500)
+
+        output.seek(0)
+        mimetype = await run_blocking(output_mimetype, output)
+        return Response(output.getvalue(), media_type=mimetype,
+                        headers={'Content-Disposition': _inline_disposition(f"processed_{upload.filename}")})
+
+    except Exception as e:
+        logger.error(f"Processing failed: {str(e)}")
+        return _error('Internal server error', 500)
+
+
+def _instrumented(rule, endpoint):
+    """Give an async endpoint the same request metrics and log context as the Flask routes."""
+    request_duration.labels(rule, 'POST', 200)
+
+    async def wrapper(request):
+        start_request_logging(request.headers.get('x-request-id'))
+        start = time.perf_counter()
+        response = await endpoint(request)
+        bytes_in = request.headers.get('content-length')
+        observe_request(rule, request.method, response.status_code, time.perf_counter() - start,
+                        int(bytes_in) if bytes_in and bytes_in.isdigit() else None, len(response.body))
+        return response
+
+    return wrapper
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    for upstream in upstreams.values():
+        await upstream.aclose()
+    await close_async_groq_clients()
+
+
+def create_asgi_app():
+    """
+    Build the ASGI app: native async routes first, the Flask app for the rest.
+    """
+    routes = [
+        Route('/vision/description', _instrumented('/vision/description', get_image_description), methods=['POST']),
+        Route('/vision/objects', _instrumented('/vision/objects', get_detected_objects), methods=['POST']),
+        Route('/vision/comprehensive', _instrumented('/vision/comprehensive', get_comprehensive_analysis), methods=['POST']),
+        Route('/metadata/analyze', _instrumented('/metadata/analyze', analyze_metadata), methods=['POST']),
+        Route('/privacy/filter', _instrumented('/privacy/filter', privacy_filter), methods=['POST']),
+        Mount('/', app=WSGIMiddleware(create_app(cors=False), workers=WSGI_FALLBACK_WORKERS)),
+    ]
+    middleware = [
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                   expose_headers=EXPOSE_HEADERS),
+    ]
+    logger.info("ASGI app has been created; remaining routes are served by the Flask app.")
+    return Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+
+app = create_asgi_app()
+
+if __name__ == '__main__':
+    import uvicorn
+    logger.info("Starting the ASGI app.")
+    uvicorn.run(app, host='127.0.0.1', port=5000)
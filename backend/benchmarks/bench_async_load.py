@@ -0,0 +1,268 @@
+"""
+Concurrent in-flight vision and risk requests one process sustains, per serving mode.
+
+A local stand-in for the Groq API answers every completion after a fixed
+delay, so the numbers measure how the server waits rather than the model.
+Each mode ('sync' is the threaded Flask server, 'async' is asgi:app on
+uvicorn) runs in its own process with the result cache and coalescing off;
+a closed-loop client then keeps N requests in flight, alternating
+/vision/description uploads and /metadata/analyze?enrich=sync. By Little's
+law, in-flight = throughput x upstream delay. Run from the backend directory:
+    python -m benchmarks.bench_async_load [--concurrency 16 64 256 1024] [--duration 10] [--upstream-delay 0.5]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.corpus import make_photo
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+
+RISK_REPORT = {
+    'overall_risk': 'high',
+    'overall_description': 'Exact location and capture time are embedded.',
+    'risks': [{'type': 'location', 'severity': 'high', 'description': 'GPS coordinates',
+               'recommendation': 'Remove GPS data'}],
+}
+
+METADATA = {
+    'Make': 'Privify', 'Model': 'Benchmark Cam 1', 'DateTimeOriginal': '2025:03:11 00:43:00',
+    'GPSInfo': {'GPSLatitudeRef': 'N', 'GPSLatitude': [24.0, 51.0, 36.12],
+                'GPSLongitudeRef': 'E', 'GPSLongitude': [67.0, 0.0, 39.84]},
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _completion(content):
+    return {
+        'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()),
+        'model': 'bench', 'choices': [{'index': 0, 'finish_reason': 'stop',
+                                       'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+    }
+
+
+def serve_upstream(port, delay):
+    """Fake Groq: every chat completion returns after `delay` seconds."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def completions(request):
+        body = await request.json()
+        await asyncio.sleep(delay)
+        if body.get('response_format'):
+            return JSONResponse(_completion(json.dumps(RISK_REPORT)))
+        return JSONResponse(_completion('A benchmark photo of a smooth gradient.'))
+
+    app = Starlette(routes=[Route(COMPLETIONS_PATH, completions, methods=['POST'])])
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+
+def serve_app(mode, port):
+    if mode == 'async':
+        import uvicorn
+        uvicorn.run('asgi:app', host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+    else:
+        from app import create_app
+        create_app().run(host='127.0.0.1', port=port, threaded=True)
+
+
+def _spawn(args, env):
+    return subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_async_load', *args], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+class ProcessSampler:
+    """Peak thread count and resident memory of a server process, from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.threads = 0
+        self.rss_mb = 0.0
+
+    def sample(self):
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('Threads:'):
+                        self.threads = max(self.threads, int(line.split()[1]))
+                    elif line.startswith('VmRSS:'):
+                        self.rss_mb = max(self.rss_mb, int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+
+
+def _multipart(field, filename, data, content_type):
+    boundary = 'benchboundary7MA4YWxkTrZu0gW'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+class KeepAliveConnection:
+    """
+    Minimal HTTP/1.1 client on asyncio streams, one connection per worker.
+
+    httpx's pool scans every connection per request, which on a small
+    machine makes the load generator the bottleneck at high concurrency.
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def post(self, path, content_type, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f'POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: {content_type}\r\n'
+                          f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length, close = None, False
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value == 'close':
+                close = True
+        if length is None:
+            await self.reader.read()
+            close = True
+        else:
+            await self.reader.readexactly(length)
+        if close:
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def _load(port, concurrency, duration, image, sampler):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    upload_type, upload = _multipart('file', 'bench.jpg', image, 'image/jpeg')
+    metadata = json.dumps(METADATA).encode()
+
+    async def worker(index):
+        nonlocal errors
+        connection = KeepAliveConnection('127.0.0.1', port)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                if index % 2:
+                    status = await connection.post('/vision/description', upload_type, upload)
+                else:
+                    status = await connection.post('/metadata/analyze?enrich=sync', 'application/json', metadata)
+                ok = status == 200
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                await connection.close()
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+        await connection.close()
+
+    async def watch():
+        while time.monotonic() < deadline:
+            sampler.sample()
+            await asyncio.sleep(0.25)
+
+    start = time.monotonic()
+    await asyncio.gather(watch(), *(worker(i) for i in range(concurrency)))
+    return latencies, errors, time.monotonic() - start
+
+
+def _run_mode(mode, args, env, image):
+    port = _free_port()
+    server = _spawn(['--serve', mode, '--port', str(port)], env)
+    rows = []
+    try:
+        _wait_for_port(port)
+        for concurrency in args.concurrency:
+            sampler = ProcessSampler(server.pid)
+            latencies, errors, elapsed = asyncio.run(
+                _load(port, concurrency, args.duration, image, sampler))
+            throughput = len(latencies) / elapsed
+            ordered = sorted(latencies) or [float('nan')]
+            rows.append((mode, concurrency, throughput, throughput * args.upstream_delay,
+                         statistics.median(ordered), ordered[int(len(ordered) * 0.99) - 1 if len(ordered) > 1 else 0],
+                         errors, sampler.threads, sampler.rss_mb))
+    finally:
+        server.terminate()
+        server.wait()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256, 1024])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--upstream-delay', type=float, default=0.5)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--serve', choices=['sync', 'async', 'upstream'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == 'upstream':
+        return serve_upstream(args.port, args.upstream_delay)
+    if args.serve:
+        return serve_app(args.serve, args.port)
+
+    upstream_port = _free_port()
+    env = dict(os.environ, GROQ_API_KEY='bench', GROQ_BASE_URL=f'http://127.0.0.1:{upstream_port}',
+               RESULT_CACHE_ENABLED='0', SINGLE_FLIGHT_MODE='off', RISK_MEMO_SIZE='0',
+               UPSTREAM_BREAKER_THRESHOLD='1000000')
+    upstream = _spawn(['--serve', 'upstream', '--port', str(upstream_port),
+                       '--upstream-delay', str(args.upstream_delay)], env)
+
+    buf = io.BytesIO()
+    make_photo(640, 480).save(buf, 'JPEG', quality=85)
+    image = buf.getvalue()
+
+    try:
+        _wait_for_port(upstream_port)
+        print(f"{'mode':>5} {'conc':>5} {'req/s':>8} {'in-flight':>9} {'p50':>8} {'p99':>8} "
+              f"{'errors':>6} {'threads':>7} {'RSS MB':>7}")
+        for mode in args.modes:
+            for row in _run_mode(mode, args, env, image):
+                mode_name, concurrency, throughput, in_flight, p50, p99, errors, threads, rss = row
+                print(f"{mode_name:>5} {concurrency:>5} {throughput:>8.1f} {in_flight:>9.1f} "
+                      f"{p50 * 1000:>6.0f}ms {p99 * 1000:>6.0f}ms {errors:>6} {threads:>7} {rss:>7.0f}")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
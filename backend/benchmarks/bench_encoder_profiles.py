@@ -0,0 +1,68 @@
+"""
+Encode time and output size of each encoder profile, per output format.
+
+The decoded image is handed straight to the removal service's encoder
+(_save_clean), so the numbers isolate what a profile changes. Photos are
+gradients with sensor noise; screenshots are flat UI panels and text, the
+case where PNG's optimize pass is slowest. Extra files, e.g. the samples in
+uploads/, can be added with --files. Run from the backend directory:
+    python -m benchmarks.bench_encoder_profiles [--repeat 3] [--files uploads/*.png]
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+from PIL import Image
+from benchmarks.corpus import make_photo, make_screenshot
+from services.metadata_removal_service import ENCODER_PROFILES, _save_clean
+
+# (label, generator, width, height)
+CASES = [
+    ('photo 12MP', make_photo, 4000, 3000),
+    ('screenshot 5MP', make_screenshot, 2880, 1800),
+]
+
+FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def _encode(img, fmt, profile, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = io.BytesIO()
+        start = time.perf_counter()
+        _save_clean(img, output, fmt, profile=profile)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), output.tell()
+
+
+def _images(args):
+    for label, generate, width, height in CASES:
+        yield label, generate(width, height)
+    for path in args.files:
+        with Image.open(path) as img:
+            yield os.path.basename(path)[:28], img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    parser.add_argument('--files', nargs='*', default=[])
+    args = parser.parse_args()
+
+    print(f"{'image':<30} {'format':>6} {'profile':>9} {'encode':>9} {'MP/s':>7} {'size KiB':>9} {'vs balanced':>11}")
+    for label, img in _images(args):
+        megapixels = img.width * img.height / 1e6
+        for fmt in args.formats:
+            if fmt == 'JPEG' and img.mode == 'RGBA':
+                continue
+            results = {profile: _encode(img, fmt, profile, args.repeat) for profile in ENCODER_PROFILES}
+            baseline = results['balanced'][1]
+            for profile, (seconds, size) in results.items():
+                print(f"{label:<30} {fmt:>6} {profile:>9} {seconds * 1000:>7.0f}ms {megapixels / seconds:>7.1f} "
+                      f"{size / 1024:>9.0f} {(size / baseline - 1) * 100:>+10.1f}%")
+
+
+if __name__ == '__main__':
+    main()
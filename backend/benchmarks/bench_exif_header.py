@@ -0,0 +1,96 @@
+"""
+Scan latency and bytes read for EXIF extraction as uploads grow.
+
+'legacy' is the previous scan path: persist the upload to disk, then reopen
+it with Pillow and call _getexif(). 'header' reads segments from the upload
+stream and stops at the first scan. Run from the backend directory:
+    python -m benchmarks.bench_exif_header [--repeat 20]
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from PIL import Image
+from benchmarks.corpus import make_exif, make_photo
+from services.exif_service import extract_metadata_from_stream, _exif_to_metadata
+
+# (label, width, height, quality) chosen to land near 200 KB, 5 MB and 60 MB
+CASES = [
+    ('200KB', 1200, 900, 85),
+    ('5MB', 3000, 2000, 95),
+    ('60MB', 9000, 6750, 100),
+]
+
+
+class CountingStream(io.RawIOBase):
+    """Seekable wrapper that counts the bytes actually read."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+
+def _legacy(upload, path):
+    upload.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(upload, f)
+    with Image.open(path) as img:
+        return _exif_to_metadata(img._getexif())
+
+
+def _header(upload):
+    upload.seek(0)
+    stream = CountingStream(upload)
+    return extract_metadata_from_stream(stream), stream.bytes_read
+
+
+def _best(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'case':>6} {'bytes':>10} {'legacy':>10} {'header':>10} {'header read':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'upload.jpg')
+        for label, width, height, quality in CASES:
+            upload = io.BytesIO()
+            make_photo(width, height).save(upload, 'JPEG', quality=quality, exif=make_exif())
+
+            metadata, bytes_read = _header(upload)
+            assert metadata == _legacy(upload, path), "header reader disagrees with Pillow"
+
+            legacy = _best(lambda: _legacy(upload, path), args.repeat)
+            header = _best(lambda: _header(upload), args.repeat)
+            print(f"{label:>6} {upload.getbuffer().nbytes:>10} {legacy * 1000:>8.2f}ms {header * 1000:>8.3f}ms {bytes_read:>12}")
+
+
+if __name__ == '__main__':
+    main()
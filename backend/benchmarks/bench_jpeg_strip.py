@@ -0,0 +1,47 @@
+"""
+Compare lossless JPEG segment stripping with the decode/re-encode path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_jpeg_strip [--sizes 12 24 48] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.corpus import PHOTO_SIZES, make_jpeg_bytes
+from services.metadata_removal_service import remove_metadata_from_image
+
+
+def _time_method(input_path, output_path, method, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if not remove_metadata_from_image(input_path, output_path, method):
+            raise RuntimeError(f"{method} removal failed")
+        best = min(best, time.perf_counter() - start)
+    return best, os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=sorted(PHOTO_SIZES))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'MP':>4} {'input':>10} {'lossless':>10} {'reencode':>10} {'speedup':>8} {'out lossless':>13} {'out reencode':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.sizes:
+            width, height = PHOTO_SIZES[mp]
+            input_path = os.path.join(tmp, f"{mp}mp.jpg")
+            with open(input_path, 'wb') as f:
+                f.write(make_jpeg_bytes(width, height, seed=mp))
+
+            lossless, lossless_size = _time_method(input_path, os.path.join(tmp, 'lossless.jpg'), 'lossless', args.repeat)
+            reencode, reencode_size = _time_method(input_path, os.path.join(tmp, 'reencode.jpg'), 'reencode', args.repeat)
+
+            print(f"{mp:>4} {os.path.getsize(input_path):>10} {lossless * 1000:>8.1f}ms {reencode * 1000:>8.1f}ms "
+                  f"{reencode / lossless:>7.0f}x {lossless_size:>13} {reencode_size:>13}")
+
+
+if __name__ == '__main__':
+    main()
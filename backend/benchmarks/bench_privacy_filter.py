@@ -0,0 +1,108 @@
+"""
+Throughput of the local OpenCV text removal engine, and of the remote one.
+
+Local latency is measured per image in this process; throughput runs the
+same corpus across a pool of worker processes, one OpenCV thread each. The
+remote Segmind workflow is paid per call, so it is only measured with
+--remote and SEGMIND_API_KEY set. Run from the backend directory:
+    python -m benchmarks.bench_privacy_filter [--sizes 0.3 2 12] [--images 16] [--workers 4] [--remote]
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.corpus import make_text_photo
+
+# Megapixels -> (width, height) for the text corpus
+TEXT_PHOTO_SIZES = {
+    0.3: (640, 480),
+    2: (1600, 1200),
+    12: (4000, 3000),
+}
+
+
+def _make_corpus(width, height, count):
+    corpus = []
+    for seed in range(count):
+        img, _ = make_text_photo(width, height, seed)
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=92)
+        corpus.append(buf.getvalue())
+    return corpus
+
+
+def _init_worker():
+    import cv2
+    # Parallelism comes from the processes; OpenCV's own threads would compete
+    cv2.setNumThreads(1)
+
+
+def _run_local(data, action='inpaint'):
+    from services.local_privacy_service import remove_text_locally
+    output = io.BytesIO()
+    start = time.perf_counter()
+    if not remove_text_locally(data, output, 0.7, action):
+        raise RuntimeError("Local text removal failed")
+    return time.perf_counter() - start
+
+
+def _run_remote(data):
+    from services.blur_service import remove_text_from_image
+    start = time.perf_counter()
+    ok = remove_text_from_image(data, io.BytesIO(), 0.7)
+    return time.perf_counter() - start if ok else None
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+
+def _throughput(corpus, action, workers):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # Warm the workers up so imports are not counted
+        list(pool.map(_run_local, corpus[:workers], [action] * workers))
+        start = time.perf_counter()
+        list(pool.map(_run_local, corpus, [action] * len(corpus)))
+        return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=sorted(TEXT_PHOTO_SIZES))
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--remote', action='store_true', help="also call the Segmind workflow (paid)")
+    parser.add_argument('--remote-images', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.remote and not os.getenv("SEGMIND_API_KEY"):
+        parser.error("--remote needs SEGMIND_API_KEY")
+
+    print(f"{'MP':>4} {'engine':>14} {'p50':>9} {'p95':>9} {'img/s serial':>13} {f'img/s {args.workers} proc':>13}")
+    for mp in args.sizes:
+        width, height = TEXT_PHOTO_SIZES[mp]
+        corpus = _make_corpus(width, height, args.images)
+
+        for action in ('inpaint', 'blur'):
+            _run_local(corpus[0], action)
+            samples = [_run_local(data, action) for data in corpus]
+            p50, p95 = _percentiles(samples)
+            parallel = _throughput(corpus, action, args.workers)
+            print(f"{mp:>4} {'local ' + action:>14} {p50 * 1000:>7.1f}ms {p95 * 1000:>7.1f}ms "
+                  f"{len(samples) / sum(samples):>13.1f} {parallel:>13.1f}")
+
+        if args.remote:
+            samples = [s for s in (_run_remote(data) for data in corpus[:args.remote_images]) if s is not None]
+            if not samples:
+                print(f"{mp:>4} {'remote':>14} all calls failed")
+                continue
+            p50, p95 = _percentiles(samples)
+            print(f"{mp:>4} {'remote':>14} {p50 * 1000:>7.1f}ms {p95 * 1000:>7.1f}ms "
+                  f"{len(samples) / sum(samples):>13.1f} {'-':>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Peak RSS of metadata removal: legacy per-pixel list copy vs the buffer path.
+
+Each measurement runs in a fresh interpreter so ru_maxrss is not polluted by
+earlier runs. Run from the backend directory:
+    python -m benchmarks.bench_removal_memory [--sizes 12 24] [--format jpg png]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.corpus import PHOTO_SIZES, make_exif, make_photo
+
+
+def _legacy_remove(input_path, output_path):
+    # The pre-buffer implementation, kept verbatim for comparison
+    from PIL import Image
+    with Image.open(input_path) as img:
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        clean_img = Image.new(img.mode, img.size)
+        clean_img.putdata(list(img.getdata()))
+        fmt = 'PNG' if output_path.endswith('.png') else 'JPEG'
+        clean_img.save(output_path, fmt, quality=95, optimize=True)
+
+
+def _peak_rss_kib():
+    # VmHWM belongs to the new address space after exec; ru_maxrss is inherited
+    # from the forking parent and would include the benchmark's own corpus
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _child(variant, input_path, output_path):
+    from services.metadata_removal_service import remove_metadata_from_image
+    baseline = _peak_rss_kib()
+    start = time.perf_counter()
+    if variant == 'legacy':
+        _legacy_remove(input_path, output_path)
+    else:
+        remove_metadata_from_image(input_path, output_path, 'reencode')
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_kib()
+    print(f"{baseline} {peak} {elapsed}")
+
+
+def _measure(variant, input_path, output_path):
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_removal_memory', '--child', variant, input_path, output_path],
+        capture_output=True, text=True, check=True,
+    )
+    baseline, peak, elapsed = result.stdout.split()
+    return int(baseline) / 1024, int(peak) / 1024, float(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12])
+    parser.add_argument('--format', nargs='+', default=['jpg', 'png'])
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(*args.child)
+        return
+
+    print(f"{'MP':>4} {'fmt':>4} {'frame MiB':>10} {'idle RSS':>10} {'legacy peak':>12} {'buffer peak':>12} {'legacy s':>9} {'buffer s':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.sizes:
+            width, height = PHOTO_SIZES[mp]
+            photo = make_photo(width, height, seed=mp)
+            for ext in args.format:
+                input_path = os.path.join(tmp, f"{mp}mp.{ext}")
+                photo.save(input_path, exif=make_exif())
+                output_path = os.path.join(tmp, f"out.{ext}")
+
+                idle, legacy_peak, legacy_time = _measure('legacy', input_path, output_path)
+                _, buffer_peak, buffer_time = _measure('buffer', input_path, output_path)
+                frame = width * height * 3 / (1024 * 1024)
+                print(f"{mp:>4} {ext:>4} {frame:>10.0f} {idle:>8.0f}Mi {legacy_peak:>10.0f}Mi {buffer_peak:>10.0f}Mi "
+                      f"{legacy_time:>9.2f} {buffer_time:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Time and memory of the metadata services across a synthetic image corpus.
+
+Every combination of format (JPEG, PNG, WebP), EXIF content (none, rich with
+GPS, rich plus a 48 KiB MakerNote) and size (0.3 to 50 MP) is generated
+from fixed seeds, then extract_metadata, _safe_convert,
+remove_metadata_from_image, remove_specific_metadata and
+verify_metadata_removal are run on each. Wall time is the median of
+--repeat runs after a warm-up. Memory is measured in a forked child per
+case: peak RSS growth (Pillow's pixel buffers included) and the Python heap
+peak from tracemalloc.
+
+Results are written as JSON. With --baseline, cases whose median time or
+peak RSS grew past the tolerances are listed and the exit status is 1, so
+a release can be diffed against the previous one. 50 MP is left out by
+default: re-encoding it as PNG or WebP takes tens of seconds per call.
+Run from the backend directory:
+    python -m benchmarks.bench_suite [--sizes 0.3 2 12 50] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy
+import PIL
+from PIL import Image
+from benchmarks.corpus import CORPUS_EXIF, CORPUS_FORMATS, CORPUS_SIZES, load_corpus_image
+from services.exif_service import _safe_convert, extract_metadata
+from services.metadata_removal_service import (remove_metadata_from_image, remove_specific_metadata,
+                                               verify_metadata_removal)
+
+SCHEMA_VERSION = 1
+
+DEFAULT_SIZES = ['0.3', '2', '12']
+
+FUNCTIONS = ('extract_metadata', '_safe_convert', 'remove_metadata_from_image',
+             'remove_specific_metadata', 'verify_metadata_removal')
+
+
+def _raw_exif(data):
+    # What _safe_convert receives inside extract_metadata: Pillow's merged tag dict
+    with Image.open(io.BytesIO(data)) as img:
+        return img.getexif()._get_merged_dict()
+
+
+def _clean(data):
+    output = io.BytesIO()
+    if not remove_metadata_from_image(data, output):
+        raise RuntimeError("remove_metadata_from_image failed on a corpus image")
+    return output.getvalue()
+
+
+def case_callable(function, data):
+    """The zero-argument call timed for function on one corpus image; inputs are prepared up front."""
+    if function == 'extract_metadata':
+        return lambda: extract_metadata(data)
+    if function == '_safe_convert':
+        raw = _raw_exif(data)
+        return lambda: _safe_convert(raw)
+    if function == 'remove_metadata_from_image':
+        return lambda: remove_metadata_from_image(data, io.BytesIO())
+    if function == 'remove_specific_metadata':
+        return lambda: remove_specific_metadata(data, io.BytesIO())
+    if function == 'verify_metadata_removal':
+        clean = _clean(data)
+        return lambda: verify_metadata_removal(clean)
+    raise ValueError(f"Unknown function {function}")
+
+
+def time_call(fn, repeat):
+    fn()  # warm-up: plugin imports and first-use allocations
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {'median': statistics.median(runs), 'min': min(runs), 'max': max(runs), 'runs': repeat}
+
+
+def _status_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def _memory_child(fn, write_fd):
+    gc.collect()
+    baseline = _status_kib('VmRSS:')
+    # Writing 5 resets the peak RSS (VmHWM) to the current RSS
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    tracemalloc.start()
+    fn()
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak = _status_kib('VmHWM:')
+    os.write(write_fd, json.dumps({'peak_rss_mib': round((peak - baseline) / 1024, 2),
+                                   'python_peak_mib': round(python_peak / (1024 * 1024), 2)}).encode())
+
+
+def measure_memory(fn):
+    """
+    Peak memory of one call, in a forked child so the allocations of other
+    cases cannot hide it. Returns None where /proc or fork is unavailable.
+    """
+    if not hasattr(os, 'fork') or not os.path.exists('/proc/self/clear_refs'):
+        return None
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            _memory_child(fn, write_fd)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        payload = pipe.read()
+    _, status = os.waitpid(pid, 0)
+    return json.loads(payload) if status == 0 and payload else None
+
+
+def run_suite(args, corpus_dir):
+    results = []
+    for size in args.sizes:
+        for fmt in args.formats:
+            for exif_variant in args.exif:
+                data, digest = load_corpus_image(corpus_dir, fmt, exif_variant, size)
+                for function in args.functions:
+                    fn = case_callable(function, data)
+                    case = {
+                        'id': f"{function}/{fmt}/{exif_variant}/{size}mp",
+                        'function': function,
+                        'format': fmt,
+                        'exif': exif_variant,
+                        'megapixels': float(size),
+                        'input_bytes': len(data),
+                        'input_sha256': digest,
+                        'seconds': time_call(fn, args.repeat),
+                        'memory': None if args.no_memory else measure_memory(fn),
+                    }
+                    results.append(case)
+                    _print_case(case)
+    return results
+
+
+def _print_case(case):
+    memory = case['memory'] or {}
+    rss = memory.get('peak_rss_mib')
+    print(f"{case['id']:<55} {case['seconds']['median'] * 1000:>10.2f}ms "
+          f"{'-' if rss is None else f'{rss:.1f}':>8} MiB", file=sys.stderr)
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def find_regressions(baseline, current, max_slowdown, max_memory_growth, min_seconds, min_mib):
+    """
+    Compare two result documents case by case.
+
+    A case regresses when its median time grew by more than max_slowdown
+    (a fraction) and by at least min_seconds, or its peak RSS grew by more
+    than max_memory_growth and by at least min_mib. The absolute floors keep
+    timer and allocator noise on tiny cases from failing a run.
+
+    Returns:
+        list: Dicts with 'id', 'metric', 'baseline', 'current' and 'change'
+    """
+    previous = {case['id']: case for case in baseline['results']}
+    regressions = []
+    for case in current['results']:
+        old = previous.get(case['id'])
+        if old is None:
+            continue
+
+        before, after = old['seconds']['median'], case['seconds']['median']
+        if after - before >= min_seconds and after > before * (1 + max_slowdown):
+            regressions.append({'id': case['id'], 'metric': 'seconds.median', 'baseline': before,
+                                'current': after, 'change': after / before - 1 if before else float('inf')})
+
+        old_rss = (old.get('memory') or {}).get('peak_rss_mib')
+        new_rss = (case.get('memory') or {}).get('peak_rss_mib')
+        if old_rss is not None and new_rss is not None and new_rss - old_rss >= min_mib \
+                and new_rss > old_rss * (1 + max_memory_growth):
+            regressions.append({'id': case['id'], 'metric': 'memory.peak_rss_mib', 'baseline': old_rss,
+                                'current': new_rss, 'change': new_rss / old_rss - 1 if old_rss else float('inf')})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, choices=list(CORPUS_SIZES))
+    parser.add_argument('--formats', nargs='+', default=list(CORPUS_FORMATS), choices=list(CORPUS_FORMATS))
+    parser.add_argument('--exif', nargs='+', default=list(CORPUS_EXIF), choices=list(CORPUS_EXIF))
+    parser.add_argument('--functions', nargs='+', default=list(FUNCTIONS), choices=list(FUNCTIONS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-memory', action='store_true', help="skip the forked memory runs")
+    parser.add_argument('--corpus-dir', help="keep generated images here and reuse them on later runs")
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--results', help="compare an existing results file instead of running")
+    parser.add_argument('--baseline', help="results of a previous run; exit 1 on regressions")
+    parser.add_argument('--max-slowdown', type=float, default=0.2)
+    parser.add_argument('--max-memory-growth', type=float, default=0.2)
+    parser.add_argument('--min-seconds', type=float, default=0.002)
+    parser.add_argument('--min-mib', type=float, default=4)
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            document = json.load(f)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+            results = run_suite(args, args.corpus_dir or tmp)
+        document = {
+            'schema': SCHEMA_VERSION,
+            'started': started,
+            'environment': environment(),
+            'config': {'sizes': args.sizes, 'formats': args.formats, 'exif': args.exif,
+                       'functions': args.functions, 'repeat': args.repeat},
+            'results': results,
+        }
+        text = json.dumps(document, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != document.get('environment'):
+        print("warning: baseline was recorded in a different environment", file=sys.stderr)
+    regressions = find_regressions(baseline, document, args.max_slowdown, args.max_memory_growth,
+                                   args.min_seconds, args.min_mib)
+    for regression in regressions:
+        print(f"REGRESSION {regression['id']} {regression['metric']}: "
+              f"{regression['baseline']:.4g} -> {regression['current']:.4g} "
+              f"(+{regression['change'] * 100:.0f}%)", file=sys.stderr)
+    print(f"{len(regressions)} regression(s) against {args.baseline}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
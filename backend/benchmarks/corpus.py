@@ -0,0 +1,217 @@
+import hashlib
+import io
+import os
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from PIL.ExifTags import IFD
+from PIL.TiffImagePlugin import IFDRational
+
+# Common phone camera resolutions, keyed by megapixels
+PHOTO_SIZES = {
+    12: (4000, 3000),
+    24: (6000, 4000),
+    48: (8000, 6000),
+}
+
+# Benchmark suite sizes, keyed by megapixel label: thumbnail to high-end sensor
+CORPUS_SIZES = {
+    '0.3': (640, 480),
+    '2': (1632, 1224),
+    '12': (4000, 3000),
+    '50': (8192, 6144),
+}
+
+CORPUS_FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+# 'none' has no EXIF, 'rich' a full camera block with GPS, 'makernote' adds a
+# vendor blob the size real cameras write (it must fit one 64 KiB APP1 segment)
+CORPUS_EXIF = ('none', 'rich', 'makernote')
+
+MAKERNOTE_BYTES = 48 * 1024
+
+
+def make_exif(with_gps=True):
+    """Build a typical phone-camera EXIF block, optionally with GPS coordinates."""
+    exif = Image.Exif()
+    exif[0x010F] = "Privify"            # Make
+    exif[0x0110] = "Benchmark Cam 1"    # Model
+    exif[0x0131] = "bench 1.0"          # Software
+    exif[0x0132] = "2025:03:11 00:43:00"  # DateTime
+    exif[0x0112] = 1                    # Orientation
+    exif_ifd = exif.get_ifd(IFD.Exif)
+    exif_ifd[0x9003] = "2025:03:11 00:43:00"  # DateTimeOriginal
+    exif_ifd[0xA001] = 1                      # ColorSpace
+    if with_gps:
+        gps_ifd = exif.get_ifd(IFD.GPSInfo)
+        gps_ifd[1] = "N"
+        gps_ifd[2] = (24.0, 51.0, 36.12)
+        gps_ifd[3] = "E"
+        gps_ifd[4] = (67.0, 0.0, 39.84)
+    return exif
+
+
+def make_rich_exif(makernote_bytes=0, seed=0):
+    """
+    Build a camera EXIF block with exposure, lens and GPS rationals, and
+    optionally a MakerNote of random bytes of the given length.
+    """
+    exif = make_exif(with_gps=True)
+    exif[0x013B] = "Benchmark Photographer"  # Artist
+    exif[0x8298] = "(c) 2025 Privify"        # Copyright
+    exif_ifd = exif.get_ifd(IFD.Exif)
+    exif_ifd[0x829A] = IFDRational(1, 250)  # ExposureTime
+    exif_ifd[0x829D] = IFDRational(18, 10)  # FNumber
+    exif_ifd[0x8827] = 100               # ISOSpeedRatings
+    exif_ifd[0x9004] = "2025:03:11 00:43:00"  # DateTimeDigitized
+    exif_ifd[0x920A] = IFDRational(52, 10)  # FocalLength
+    exif_ifd[0xA432] = tuple(IFDRational(*r) for r in ((24, 1), (70, 1), (28, 10), (40, 10)))  # LensSpecification
+    exif_ifd[0xA433] = "Privify"         # LensMake
+    exif_ifd[0xA434] = "Bench 24-70mm"   # LensModel
+    exif_ifd[0xA431] = "SN0123456789"    # BodySerialNumber
+    exif_ifd[0x9286] = b"ASCII\0\0\0Benchmark user comment"  # UserComment
+    gps_ifd = exif.get_ifd(IFD.GPSInfo)
+    gps_ifd[5] = 0                       # GPSAltitudeRef
+    gps_ifd[6] = IFDRational(123, 10)    # GPSAltitude
+    gps_ifd[7] = (0.0, 43.0, 0.0)        # GPSTimeStamp
+    gps_ifd[29] = "2025:03:11"           # GPSDateStamp
+    if makernote_bytes:
+        exif_ifd[0x927C] = np.random.default_rng(seed).bytes(makernote_bytes)  # MakerNote
+    return exif
+
+
+def make_photo(width, height, seed=0):
+    """
+    Generate a reproducible photo-like RGB image.
+
+    Smooth gradients plus sensor-style noise compress roughly like a real
+    photo, unlike flat colour fills which make every codec look fast.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = np.clip(x + rng.normal(0, 12, (height, width)), 0, 255)
+    pixels[..., 1] = np.clip(y + rng.normal(0, 12, (height, width)), 0, 255)
+    pixels[..., 2] = np.clip((x + y) / 2 + rng.normal(0, 12, (height, width)), 0, 255)
+    return Image.fromarray(pixels, 'RGB')
+
+
+# Lines drawn by make_text_photo: the kind of text the privacy filter removes
+SAMPLE_TEXT = [
+    "CONFIDENTIAL 2025",
+    "John Smith, 42 Baker Street",
+    "tel 555-0199",
+    "licence AB12 CDE",
+]
+
+
+def make_text_photo(width, height, seed=0):
+    """
+    Generate a photo-like image with lines of text and some non-text shapes.
+
+    Returns:
+        tuple: (image, boxes) where boxes are the (x, y, w, h) of each text line
+    """
+    img = make_photo(width, height, seed)
+    draw = ImageDraw.Draw(img)
+    line_height = height // (len(SAMPLE_TEXT) + 2)
+    font = ImageFont.load_default(size=max(10, line_height // 3))
+    boxes = []
+    for i, text in enumerate(SAMPLE_TEXT):
+        origin = (width // 16 + i * width // 40, (i + 1) * line_height)
+        fill = (255, 255, 255) if i % 2 == 0 else (0, 0, 0)
+        draw.text(origin, text, fill=fill, font=font)
+        left, top, right, bottom = draw.textbbox(origin, text, font=font)
+        boxes.append((left, top, right - left, bottom - top))
+
+    # Edges that are not text: a filled block, an outline and a thin line
+    draw.rectangle((width * 5 // 8, height // 12, width * 7 // 8, height // 3), fill=(30, 200, 30))
+    draw.ellipse((width * 5 // 8, height * 5 // 8, width * 7 // 8, height * 7 // 8), outline=(200, 30, 30), width=5)
+    draw.line((width // 2, height * 11 // 12, width * 31 // 32, height * 5 // 6), fill=(250, 250, 250), width=3)
+    return img, boxes
+
+
+def make_screenshot(width, height, seed=0):
+    """
+    Generate a UI screenshot: flat panels, buttons and many lines of text.
+
+    Large runs of identical pixels are what PNG's filters and zlib exploit,
+    so this compresses very differently from make_photo.
+    """
+    rng = np.random.default_rng(seed)
+    img = Image.new('RGB', (width, height), (246, 247, 249))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=max(10, height // 60))
+    line_height = max(12, height // 45)
+
+    # Title bar, sidebar and content cards
+    draw.rectangle((0, 0, width, height // 20), fill=(38, 50, 72))
+    draw.rectangle((0, height // 20, width // 6, height), fill=(228, 232, 238))
+    for i in range(6):
+        left = width // 5 + (i % 3) * width // 4
+        top = height // 10 + (i // 3) * height // 2
+        draw.rounded_rectangle((left, top, left + width // 5, top + height // 3), radius=12,
+                               fill=(255, 255, 255), outline=(210, 214, 220))
+        draw.rectangle((left + 12, top + height // 3 - 40, left + 110, top + height // 3 - 14),
+                       fill=tuple(int(c) for c in rng.integers(40, 200, 3)))
+
+    # Text everywhere, as in chat logs and documents
+    y = height // 20 + line_height
+    while y < height - line_height:
+        words = rng.integers(3, 12)
+        text = ' '.join(SAMPLE_TEXT[int(k) % len(SAMPLE_TEXT)].split()[0] for k in rng.integers(0, 100, words))
+        draw.text((12, y), text[:24], fill=(60, 60, 60), font=font)
+        draw.text((width // 5 + 12, y), text, fill=(20, 20, 20), font=font)
+        y += line_height
+    return img
+
+
+def make_jpeg_bytes(width, height, seed=0, with_gps=True, quality=92):
+    """Encode a synthetic photo as JPEG with camera-style EXIF."""
+    buf = io.BytesIO()
+    make_photo(width, height, seed).save(buf, 'JPEG', quality=quality, exif=make_exif(with_gps))
+    return buf.getvalue()
+
+
+def make_corpus_image(fmt, exif_variant, size, seed=0):
+    """
+    Encode one corpus image.
+
+    Args:
+        fmt: One of CORPUS_FORMATS
+        exif_variant: One of CORPUS_EXIF
+        size: One of CORPUS_SIZES
+        seed: Seed for the pixels and the MakerNote
+
+    Returns:
+        bytes: The encoded image; the same arguments always give the same pixels
+    """
+    width, height = CORPUS_SIZES[size]
+    params = {}
+    if exif_variant != 'none':
+        makernote = MAKERNOTE_BYTES if exif_variant == 'makernote' else 0
+        params['exif'] = make_rich_exif(makernote, seed)
+    if fmt in ('jpeg', 'webp'):
+        params['quality'] = 90
+
+    buf = io.BytesIO()
+    make_photo(width, height, seed).save(buf, CORPUS_FORMATS[fmt], **params)
+    return buf.getvalue()
+
+
+def load_corpus_image(directory, fmt, exif_variant, size, seed=0):
+    """
+    make_corpus_image, cached as a file in directory so repeated runs skip
+    generating and encoding large images. Returns (bytes, sha256 hex digest).
+    """
+    path = os.path.join(directory, f"{size}mp-{exif_variant}-{seed}.{fmt}")
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+    else:
+        data = make_corpus_image(fmt, exif_variant, size, seed)
+        os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    return data, hashlib.sha256(data).hexdigest()
@@ -7,3 +7,104 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 print(f"[INFO] Ensured upload directory exists: {UPLOAD_FOLDER}")
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 print(f"[INFO] Ensured processed directory exists: {PROCESSED_FOLDER}")
+
+# 'memory' hands the request stream straight to the services; 'disk' saves
+# every upload to UPLOAD_FOLDER first and passes the path
+UPLOAD_MODE = os.getenv('UPLOAD_MODE', 'memory')
+
+# Files under UPLOAD_FOLDER and PROCESSED_FOLDER are stored by content hash in
+# sharded directories. Each store is kept under its byte quota (oldest files
+# go first) and files unused for the TTL are removed by a background sweeper.
+UPLOAD_STORE_MAX_BYTES = int(os.getenv('UPLOAD_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+UPLOAD_STORE_TTL_SECONDS = int(os.getenv('UPLOAD_STORE_TTL_SECONDS', 60 * 60))
+PROCESSED_STORE_MAX_BYTES = int(os.getenv('PROCESSED_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+PROCESSED_STORE_TTL_SECONDS = int(os.getenv('PROCESSED_STORE_TTL_SECONDS', 24 * 60 * 60))
+STORAGE_SWEEP_INTERVAL_SECONDS = float(os.getenv('STORAGE_SWEEP_INTERVAL_SECONDS', 5 * 60))
+
+# Stored file downloads: '' serves them from Python, 'x-sendfile' hands the
+# path to the front server (Apache, lighttpd) and 'x-accel' redirects nginx to
+# an internal location, DOWNLOAD_ACCEL_PREFIX + '<store>/<shard path>', that
+# aliases the store's directory
+DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/_stored/')
+
+# Uploads up to this many bytes stay in memory; larger ones spill to a temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 16 * 1024 * 1024))
+
+# Content-addressed result cache shared by all worker processes (SQLite in WAL mode)
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', os.path.join('cache', 'results.sqlite3'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+# Concurrent requests for the same operation on the same content share one
+# computation: 'thread' coalesces within a worker, 'process' also across
+# workers through lock files (needs the result cache), 'off' disables it
+SINGLE_FLIGHT_MODE = os.getenv('SINGLE_FLIGHT_MODE', 'thread')
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', os.path.join('cache', 'locks'))
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', 120))
+
+# Images sent to upstream APIs are downscaled so the long side and the encoded
+# size stay under these limits, and re-encoded as JPEG at the given quality
+GROQ_IMAGE_MAX_SIDE = int(os.getenv('GROQ_IMAGE_MAX_SIDE', 1536))
+GROQ_IMAGE_MAX_BYTES = int(os.getenv('GROQ_IMAGE_MAX_BYTES', 3 * 1024 * 1024))
+GROQ_IMAGE_QUALITY = int(os.getenv('GROQ_IMAGE_QUALITY', 85))
+SEGMIND_IMAGE_MAX_SIDE = int(os.getenv('SEGMIND_IMAGE_MAX_SIDE', 2048))
+SEGMIND_IMAGE_MAX_BYTES = int(os.getenv('SEGMIND_IMAGE_MAX_BYTES', 6 * 1024 * 1024))
+SEGMIND_IMAGE_QUALITY = int(os.getenv('SEGMIND_IMAGE_QUALITY', 90))
+
+# Batch metadata removal: worker processes, and limits on what one request may
+# contain (files, including ZIP members, and the size of each)
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 1000))
+BATCH_MAX_FILE_BYTES = int(os.getenv('BATCH_MAX_FILE_BYTES', 64 * 1024 * 1024))
+
+# Asynchronous jobs: SQLite store shared by all workers, how many jobs of each
+# queue run at once per process, how many may wait, and how long finished
+# jobs (and their results) are kept
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', os.path.join('cache', 'jobs.sqlite3'))
+JOB_QUEUE_CONCURRENCY = {
+    'vision': int(os.getenv('JOB_VISION_CONCURRENCY', 4)),
+    'privacy': int(os.getenv('JOB_PRIVACY_CONCURRENCY', 2)),
+}
+JOB_QUEUE_MAX_PENDING = int(os.getenv('JOB_QUEUE_MAX_PENDING', 100))
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', 60 * 60))
+
+# Encoder profile used for re-encoded outputs when a request does not pick
+# one: 'fast', 'balanced' or 'smallest' (see ENCODER_PROFILES)
+ENCODER_PROFILE = os.getenv('ENCODER_PROFILE', 'balanced')
+
+# Upstream HTTP calls: (connect, read) timeouts in seconds per service,
+# retries for idempotent failures, and the circuit breaker that fails fast
+# after consecutive failures until the cool-down has passed
+UPSTREAM_TIMEOUTS = {
+    'groq': (float(os.getenv('GROQ_CONNECT_TIMEOUT', 3.05)), float(os.getenv('GROQ_READ_TIMEOUT', 30))),
+    'segmind': (float(os.getenv('SEGMIND_CONNECT_TIMEOUT', 3.05)), float(os.getenv('SEGMIND_READ_TIMEOUT', 60))),
+}
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', 2))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 16))
+# ASGI mode spreads upstream connections over this many async clients; one
+# httpx pool scans all of its connections per request, so large pools get slow
+UPSTREAM_ASYNC_SHARDS = int(os.getenv('UPSTREAM_ASYNC_SHARDS', 8))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 5))
+UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv('UPSTREAM_BREAKER_RESET_SECONDS', 30))
+
+# ASGI mode: image decoding, encoding and SQLite access run on this many
+# threads so they do not stall the event loop
+ASYNC_BLOCKING_WORKERS = int(os.getenv('ASYNC_BLOCKING_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+# ASGI mode: threads serving the routes that stay on the mounted Flask app
+# (uploads, batch downloads, job event streams)
+WSGI_FALLBACK_WORKERS = int(os.getenv('WSGI_FALLBACK_WORKERS', 32))
+
+# Logging: records go through a bounded queue to a background thread that
+# writes them as JSON lines ('json') or plain text ('text') to stderr and,
+# if set, LOG_FILE. A full queue drops records instead of blocking requests.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_FILE = os.getenv('LOG_FILE')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+# Fraction of requests whose records at or below LOG_SAMPLE_MAX_LEVEL are
+# kept; sampled requests keep all of them, warnings and errors always pass
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOG_SAMPLE_MAX_LEVEL = os.getenv('LOG_SAMPLE_MAX_LEVEL', 'INFO').upper()
@@ -0,0 +1,24 @@
+from flask import Blueprint, jsonify
+import logging
+from services.cache_service import result_cache
+from services.risk_analysis_service import risk_memo
+from services.single_flight_service import async_single_flight, single_flight
+
+cache_bp = Blueprint('cache', __name__)
+logger = logging.getLogger(__name__)
+
+@cache_bp.route('/stats', methods=['GET'])
+def cache_stats():
+    """
+    Report result cache size and per-operation hit/miss counters, plus this
+    worker's risk report memo and request coalescing counters.
+    """
+    try:
+        stats = result_cache.stats()
+        stats['risk_memo'] = risk_memo.stats()
+        stats['single_flight'] = single_flight.stats()
+        stats['async_single_flight'] = async_single_flight.stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Cache stats failed: {str(e)}")
+        return jsonify({'error': 'Cache stats unavailable'}), 500
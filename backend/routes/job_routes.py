@@ -0,0 +1,117 @@
+from flask import Blueprint, Response, jsonify, send_file, url_for
+import io
+import json
+import logging
+import time
+from config import JOB_TTL_SECONDS
+from services.job_service import FINAL_STATUSES, QueueFull, job_queues, job_store, submit_job
+
+jobs_bp = Blueprint('jobs', __name__)
+logger = logging.getLogger(__name__)
+
+# Seconds between status checks while an event stream is open, and between
+# keep-alive comments so proxies do not close an idle stream
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_KEEPALIVE_INTERVAL = 15
+
+def enqueue(queue, op, fn, *args):
+    """
+    Submit a job and build the 202 response pointing at its status, events
+    and result, or a 503 when the queue is full.
+    """
+    try:
+        job_id = submit_job(queue, op, fn, *args)
+    except QueueFull as e:
+        logger.warning(str(e))
+        response = jsonify({'error': 'Too many queued jobs, try again later'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('jobs.get_job', job_id=job_id),
+        'events_url': url_for('jobs.job_events', job_id=job_id),
+        'result_url': url_for('jobs.get_job_result', job_id=job_id),
+    })
+    response.headers['Location'] = url_for('jobs.get_job', job_id=job_id)
+    return response, 202
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Report a job's status. JSON results are included once it has finished.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """
+    Return a finished job's result: JSON as-is, images as a file.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] not in FINAL_STATUSES:
+        return jsonify({'error': 'Job not finished', 'status': job['status']}), 409
+
+    result = job_store.get_result(job_id)
+    if result is None:
+        return jsonify({'error': job['error'] or 'Job produced no result'}), 500
+    kind, value, mimetype = result
+    if kind == 'json':
+        return jsonify(value), 200 if job['status'] == 'succeeded' else 500
+    # A finished job's result never changes, so its id is a strong ETag
+    return send_file(io.BytesIO(value), mimetype=mimetype, download_name=f"{job['op']}_{job_id}",
+                     etag=job_id, conditional=True)
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Stream the job's status as server-sent events until it finishes.
+
+    Each change is sent as a 'status' event carrying the same JSON as
+    GET /jobs/<id>; the stream ends after the final status.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        last_status = None
+        last_sent = time.monotonic()
+        deadline = last_sent + JOB_TTL_SECONDS
+        while time.monotonic() < deadline:
+            job = job_store.get(job_id)
+            if job is None:
+                yield "event: error\ndata: {\"error\": \"Job expired\"}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                last_sent = time.monotonic()
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+                if last_status in FINAL_STATUSES:
+                    return
+            elif time.monotonic() - last_sent > EVENTS_KEEPALIVE_INTERVAL:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@jobs_bp.route('/stats', methods=['GET'])
+def job_stats():
+    """
+    Report this worker's queue occupancy and the stored jobs per status.
+    """
+    try:
+        return jsonify({
+            'queues': {name: queue.stats() for name, queue in job_queues.items()},
+            'jobs': job_store.counts(),
+        })
+    except Exception as e:
+        logger.error(f"Job stats failed: {str(e)}")
+        return jsonify({'error': 'Job stats unavailable'}), 500
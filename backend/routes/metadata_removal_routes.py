@@ -1,13 +1,98 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import send_file as send_file_header
+import io
 import os
+import json
 import logging
-from config import UPLOAD_FOLDER, PROCESSED_FOLDER
-from services.metadata_removal_service import remove_metadata_from_image, remove_specific_metadata, verify_metadata_removal
+from config import DOWNLOAD_ACCEL_PREFIX, DOWNLOAD_OFFLOAD, ENCODER_PROFILE
+from services.metadata_removal_service import clean_image, remove_specific_metadata, REMOVAL_METHODS, DEFAULT_SENSITIVE_TYPES, ENCODER_PROFILES
 from services.exif_service import extract_metadata
+from services.storage_service import mimetype_for, processed_store
+from services.upload_service import prepare_upload
+from services.cache_service import cached, content_digest
+from services.batch_service import clean_batch, iter_batch_inputs
+from services.zip_stream_service import stream_zip
 
 metadata_removal_bp = Blueprint('metadata_removal', __name__)
 logger = logging.getLogger(__name__)
 
+# Verification results travel with the image as response headers
+REPORT_HEADERS = [
+    'X-Metadata-Original-Count',
+    'X-Metadata-Remaining-Count',
+    'X-Metadata-Verified',
+    'X-Metadata-Remaining',
+    'X-Metadata-Removed-Types',
+]
+
+def _send_clean_image(clean_bytes, report, download_name, removed_types=None):
+    """Send the cleaned image with its verification report in response headers."""
+    verification = report['verification']
+    response = send_file(
+        io.BytesIO(clean_bytes),
+        mimetype=report['mimetype'],
+        as_attachment=True,
+        download_name=download_name
+    )
+    response.headers['X-Metadata-Original-Count'] = str(report['original_metadata_count'])
+    response.headers['X-Metadata-Remaining-Count'] = str(verification['metadata_count'])
+    response.headers['X-Metadata-Verified'] = 'true' if verification['success'] else 'false'
+    # Tag names only; values may be long or contain characters headers cannot carry
+    response.headers['X-Metadata-Remaining'] = ','.join(verification['remaining_metadata'])
+    if removed_types is not None:
+        response.headers['X-Metadata-Removed-Types'] = json.dumps(removed_types)
+    return response
+
+# Extension written for each output format in batch archives
+_FORMAT_EXTENSIONS = {'JPEG': ('.jpg', '.jpeg'), 'PNG': ('.png',), 'WEBP': ('.webp',)}
+
+def _batch_entry_name(name, fmt, taken):
+    """Archive name for a cleaned file: flat, matching its format, and unique."""
+    stem, ext = os.path.splitext(os.path.basename(name))
+    if ext.lower() not in _FORMAT_EXTENSIONS[fmt]:
+        ext = _FORMAT_EXTENSIONS[fmt][0]
+    candidate = f"clean_{stem}{ext}"
+    suffix = 1
+    while candidate in taken:
+        suffix += 1
+        candidate = f"clean_{stem}_{suffix}{ext}"
+    taken.add(candidate)
+    return candidate
+
+def _send_stored_file(store, name, path, download_name):
+    """
+    Send a file from a content store as an attachment.
+
+    The stored name is the content hash, so it doubles as a strong ETag and
+    the bytes behind a URL never change: If-None-Match gets a 304, Range
+    requests a 206, and browsers may keep the file for the store's TTL.
+    With DOWNLOAD_OFFLOAD set, only headers are built here and the front
+    server sends the file (and serves ranges) itself.
+    """
+    options = dict(mimetype=mimetype_for(name), as_attachment=True, download_name=download_name,
+                   etag=name.partition('.')[0], max_age=store.ttl_seconds)
+    if DOWNLOAD_OFFLOAD:
+        response = send_file_header(path, request.environ, use_x_sendfile=True, conditional=False,
+                                    response_class=current_app.response_class, **options)
+        if DOWNLOAD_OFFLOAD == 'x-accel':
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = f"{DOWNLOAD_ACCEL_PREFIX}{store.name}/{store.relative_path(path)}"
+        response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+    else:
+        response = send_file(path, conditional=True, **options)
+
+    # The mtime records last use, not a change of content; the ETag is the validator
+    response.headers.pop('Last-Modified', None)
+    # Cleaned images belong to one user: let the browser cache them, not shared proxies
+    response.cache_control.public = None
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @metadata_removal_bp.route('/remove-all', methods=['POST'])
 def remove_all_metadata():
     """
@@ -24,44 +109,33 @@ def remove_all_metadata():
         logger.error("Empty filename")
         return jsonify({'error': 'No selected file'}), 400
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    # 'auto' strips JPEG segments losslessly and re-encodes everything else
+    method = request.form.get('method', 'auto')
+    if method not in REMOVAL_METHODS:
+        logger.error("Invalid removal method: %s", method)
+        return jsonify({'error': f'Invalid method, expected one of {list(REMOVAL_METHODS)}'}), 400
+
+    # Encoder settings for re-encoded output: speed against size
+    profile = request.form.get('profile', ENCODER_PROFILE)
+    if profile not in ENCODER_PROFILES:
+        logger.error("Invalid encoder profile: %s", profile)
+        return jsonify({'error': f'Invalid profile, expected one of {list(ENCODER_PROFILES)}'}), 400
 
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
+        source = prepare_upload(file)
         output_filename = f"clean_{file.filename}"
-        output_path = os.path.join(PROCESSED_FOLDER, output_filename)
-        
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
-        
-        # Extract original metadata for comparison
-        original_metadata = extract_metadata(input_path)
         
-        logger.info("Removing all metadata from image...")
-        success = remove_metadata_from_image(input_path, output_path)
+        # Parse, clean and verify in one pass over the upload
+        logger.info("Removing all metadata from image (method=%s, profile=%s)...", method, profile)
+        result = cached('clean', content_digest(source), {'method': method, 'profile': profile},
+                        lambda: clean_image(source, method=method, profile=profile))
         
-        if not success:
+        if result is None:
             return jsonify({'error': 'Metadata removal failed'}), 500
         
-        # Verify metadata removal
-        verification = verify_metadata_removal(output_path)
-        
-        # Return the clean image and verification results
-        response_data = {
-            'message': 'Metadata removed successfully',
-            'original_metadata_count': len(original_metadata),
-            'verification': verification,
-            'filename': output_filename
-        }
-        
-        return send_file(
-            output_path, 
-            mimetype='image/jpeg',
-            as_attachment=True,
-            download_name=output_filename
-        )
+        # Return the clean image with verification results in the headers
+        clean_bytes, report = result
+        return _send_clean_image(clean_bytes, report, output_filename)
         
     except Exception as e:
         logger.error(f"Metadata removal failed: {str(e)}")
@@ -87,52 +161,94 @@ def remove_selective_metadata():
     metadata_types = request.form.getlist('metadata_types[]')
     if not metadata_types:
         # Default to removing sensitive metadata
-        metadata_types = ['GPSInfo', 'DateTime', 'DateTimeOriginal', 'Make', 'Model', 'Software']
+        metadata_types = DEFAULT_SENSITIVE_TYPES
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    profile = request.form.get('profile', ENCODER_PROFILE)
+    if profile not in ENCODER_PROFILES:
+        logger.error("Invalid encoder profile: %s", profile)
+        return jsonify({'error': f'Invalid profile, expected one of {list(ENCODER_PROFILES)}'}), 400
 
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
+        source = prepare_upload(file)
         output_filename = f"selective_clean_{file.filename}"
-        output_path = os.path.join(PROCESSED_FOLDER, output_filename)
-        
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
-        
-        # Extract original metadata for comparison
-        original_metadata = extract_metadata(input_path)
         
+        # Parse, clean and verify in one pass over the upload
         logger.info(f"Removing selective metadata: {metadata_types}")
-        success = remove_specific_metadata(input_path, output_path, metadata_types)
+        result = cached('clean-selective', content_digest(source),
+                        {'types': sorted(metadata_types), 'profile': profile},
+                        lambda: clean_image(source, metadata_types=metadata_types, profile=profile))
         
-        if not success:
+        if result is None:
             return jsonify({'error': 'Selective metadata removal failed'}), 500
         
-        # Verify metadata removal
-        verification = verify_metadata_removal(output_path)
-        
-        # Return the clean image and verification results
-        response_data = {
-            'message': 'Selective metadata removal completed',
-            'removed_types': metadata_types,
-            'original_metadata_count': len(original_metadata),
-            'verification': verification,
-            'filename': output_filename
-        }
-        
-        return send_file(
-            output_path, 
-            mimetype='image/jpeg',
-            as_attachment=True,
-            download_name=output_filename
-        )
+        # Return the clean image with verification results in the headers
+        clean_bytes, report = result
+        return _send_clean_image(clean_bytes, report, output_filename, removed_types=metadata_types)
         
     except Exception as e:
         logger.error(f"Selective metadata removal failed: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@metadata_removal_bp.route('/remove-batch', methods=['POST'])
+def remove_batch_metadata():
+    """
+    Remove metadata from many images and stream back a ZIP of the results.
+
+    Form fields:
+        file: Images or ZIP archives of images (repeat the field for more)
+        method: One of REMOVAL_METHODS, used when removing all metadata
+        metadata_types[]: Types to remove selectively; omit to remove everything
+        profile: One of ENCODER_PROFILES for re-encoded images
+
+    Cleaned images are added to the archive as soon as each one finishes.
+    manifest.json, written last, holds the verification report or the error
+    for every input file.
+    """
+    logger.info("Received batch metadata removal request")
+
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        logger.error("No file part in request")
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    method = request.form.get('method', 'auto')
+    if method not in REMOVAL_METHODS:
+        logger.error("Invalid removal method: %s", method)
+        return jsonify({'error': f'Invalid method, expected one of {list(REMOVAL_METHODS)}'}), 400
+
+    profile = request.form.get('profile', ENCODER_PROFILE)
+    if profile not in ENCODER_PROFILES:
+        logger.error("Invalid encoder profile: %s", profile)
+        return jsonify({'error': f'Invalid profile, expected one of {list(ENCODER_PROFILES)}'}), 400
+
+    metadata_types = request.form.getlist('metadata_types[]') or None
+
+    def entries():
+        manifest = []
+        taken = set()
+        for name, result, error in clean_batch(iter_batch_inputs(files), method, metadata_types, profile):
+            entry = {'file': name}
+            if error is not None:
+                entry['error'] = error
+            else:
+                clean_bytes, report = result
+                entry['name'] = _batch_entry_name(name, report['format'], taken)
+                entry.update(report)
+                yield entry['name'], clean_bytes
+            manifest.append(entry)
+
+        failed = sum(1 for entry in manifest if 'error' in entry)
+        logger.info("Batch metadata removal completed. %d files, %d failed", len(manifest), failed)
+        yield 'manifest.json', json.dumps(manifest, indent=2).encode('utf-8')
+
+    logger.info("Streaming batch of %d uploads (method=%s, types=%s, profile=%s)...",
+                len(files), method, metadata_types, profile)
+    return Response(
+        stream_with_context(stream_zip(entries())),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=clean_batch.zip'}
+    )
+
 @metadata_removal_bp.route('/analyze-and-remove', methods=['POST'])
 def analyze_and_remove_metadata():
     """
@@ -149,16 +265,16 @@ def analyze_and_remove_metadata():
         logger.error("Empty filename")
         return jsonify({'error': 'No selected file'}), 400
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    profile = request.form.get('profile', ENCODER_PROFILE)
+    if profile not in ENCODER_PROFILES:
+        logger.error("Invalid encoder profile: %s", profile)
+        return jsonify({'error': f'Invalid profile, expected one of {list(ENCODER_PROFILES)}'}), 400
 
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(input_path)
+        source = prepare_upload(file)
         
         # Extract and analyze metadata
-        metadata = extract_metadata(input_path)
+        metadata = cached('metadata', content_digest(source), None, lambda: extract_metadata(source))
         
         # Identify sensitive metadata types
         sensitive_types = []
@@ -173,22 +289,21 @@ def analyze_and_remove_metadata():
         if 'Software' in metadata:
             sensitive_types.append('Software')
         
-        # Create clean version if sensitive data found
-        clean_image_path = None
+        # Create clean version if sensitive data found; it is kept for /download-clean
+        clean_image_filename = None
         if sensitive_types:
-            output_filename = f"secure_{file.filename}"
-            clean_image_path = os.path.join(PROCESSED_FOLDER, output_filename)
-            
-            success = remove_specific_metadata(input_path, clean_image_path, sensitive_types)
-            if not success:
+            output = io.BytesIO()
+            success = remove_specific_metadata(source, output, sensitive_types, profile)
+            if success:
+                clean_image_filename = processed_store.put(output.getvalue())
+            else:
                 logger.warning("Failed to create clean version")
-                clean_image_path = None
         
         return jsonify({
             'metadata': metadata,
             'sensitive_types_found': sensitive_types,
-            'clean_image_available': clean_image_path is not None,
-            'clean_image_filename': os.path.basename(clean_image_path) if clean_image_path else None,
+            'clean_image_available': clean_image_filename is not None,
+            'clean_image_filename': clean_image_filename,
             'recommendations': {
                 'high_risk': ['GPSInfo'],
                 'moderate_risk': ['DateTime', 'DateTimeOriginal'],
@@ -204,20 +319,22 @@ def analyze_and_remove_metadata():
 def download_clean_image(filename):
     """
     Download a previously processed clean image.
+
+    filename is the clean_image_filename returned by /analyze-and-remove;
+    an optional ?name= query parameter sets the name the browser saves it as.
+    Supports conditional and range requests.
     """
     try:
-        file_path = os.path.join(PROCESSED_FOLDER, filename)
+        file_path = processed_store.path_for(filename)
         
-        if not os.path.exists(file_path):
+        if file_path is None:
             return jsonify({'error': 'File not found'}), 404
         
-        return send_file(
-            file_path,
-            mimetype='image/jpeg',
-            as_attachment=True,
-            download_name=filename
-        )
-        
+        return _send_stored_file(processed_store, filename, file_path, request.args.get('name') or filename)
+
+    except HTTPException:
+        # 416 for an unsatisfiable Range
+        raise
     except Exception as e:
         logger.error(f"Download failed: {str(e)}")
         return jsonify({'error': 'Download failed'}), 500 
\ No newline at end of file
@@ -1,10 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
-import os
 import logging
-import json
-from config import UPLOAD_FOLDER
 from services.exif_service import extract_metadata
-from services.risk_analysis_service import analyze_metadata_risks  # New import
+from services.logging_service import LazyJson
+from services.upload_service import prepare_upload
+from services.cache_service import cached, content_digest
+from services.risk_analysis_service import assess_metadata_risks, ENRICHMENT_MODES
 
 metadata_bp = Blueprint('metadata', __name__)
 logger = logging.getLogger(__name__)
@@ -19,12 +19,9 @@ def scan_metadata():
         return jsonify({'error': 'No file uploaded'}), 400
 
     file = request.files['file']
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
+    source = prepare_upload(file)
 
-    file.save(file_path)
-    logger.info("File saved to: %s", file_path)
-
-    metadata = extract_metadata(file_path)
+    metadata = cached('metadata', content_digest(source), None, lambda: extract_metadata(source))
     logger.info("Returning extracted metadata.")
 
     return jsonify(metadata)
@@ -38,7 +35,9 @@ def analyze_metadata():
     if request.is_json:
         try:
             metadata = request.get_json(force=True)
-            logger.debug(f"Received JSON metadata: {json.dumps(metadata, indent=2)}")
+            if not isinstance(metadata, dict):
+                raise ValueError(f"expected a JSON object, got {type(metadata).__name__}")
+            logger.debug("Received JSON metadata: %s", LazyJson(metadata, indent=2))
         except Exception as e:
             logger.error(f"JSON parsing error: {str(e)}")
             return jsonify({'error': 'Invalid JSON format'}), 400
@@ -49,10 +48,9 @@ def analyze_metadata():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
             
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
         try:
-            file.save(file_path)
-            metadata = extract_metadata(file_path)
+            source = prepare_upload(file)
+            metadata = cached('metadata', content_digest(source), None, lambda: extract_metadata(source))
         except Exception as e:
             logger.error(f"File processing error: {str(e)}")
             return jsonify({'error': 'File processing failed'}), 400
@@ -61,9 +59,14 @@ def analyze_metadata():
         logger.error("No valid input provided - missing both file and JSON")
         return jsonify({'error': 'No valid input provided'}), 400
 
+    # Local rules answer immediately; ?enrich=sync|async adds the LLM report
+    enrichment = request.args.get('enrich')
+    if enrichment is not None and enrichment not in ENRICHMENT_MODES:
+        return jsonify({'error': f'Invalid enrich mode, expected one of {list(ENRICHMENT_MODES)}'}), 400
+
     # Perform risk analysis
     try:
-        risk_report = analyze_metadata_risks(metadata)
+        risk_report = assess_metadata_risks(metadata, enrichment)
         logger.info("Risk analysis completed successfully")
         return jsonify({
             'metadata': metadata,
@@ -0,0 +1,157 @@
+from flask import Blueprint, Response, g, request
+import logging
+import time
+from services.cache_service import result_cache
+from services.job_service import job_queues, job_store
+from services.logging_service import logging_stats
+from services.metrics_service import (Collector, observe_request, registry, request_duration, response_bytes,
+                                      time_stage)
+from services.risk_analysis_service import risk_memo
+from services.single_flight_service import async_single_flight, single_flight
+from services.storage_service import stores
+from services.upstream_service import LATENCY_BUCKETS as UPSTREAM_LATENCY_BUCKETS, upstreams
+
+metrics_bp = Blueprint('metrics', __name__)
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_BREAKER_STATES = ('closed', 'half_open', 'open')
+
+
+def _collect_upstreams():
+    stats = {name: upstream.stats() for name, upstream in upstreams.items()}
+    yield ('privify_upstream_request_duration_seconds', 'histogram',
+           'Latency of each upstream API attempt, including retries.',
+           [({'upstream': name}, UPSTREAM_LATENCY_BUCKETS, list(s['latency_seconds']['buckets'].values()),
+             s['latency_seconds']['sum']) for name, s in stats.items()])
+    yield ('privify_upstream_responses_total', 'counter', 'Upstream API responses by HTTP status.',
+           [({'upstream': name, 'status': status}, count)
+            for name, s in stats.items() for status, count in s['status'].items()])
+    yield ('privify_upstream_errors_total', 'counter', 'Upstream API attempts that got no response.',
+           [({'upstream': name, 'kind': kind}, count)
+            for name, s in stats.items() for kind, count in s['errors'].items()])
+    yield ('privify_upstream_retries_total', 'counter', 'Upstream API attempts that were retried.',
+           [({'upstream': name}, s['retries']) for name, s in stats.items()])
+    yield ('privify_upstream_rejected_total', 'counter', 'Calls refused while the circuit breaker was open.',
+           [({'upstream': name}, s['rejected']) for name, s in stats.items()])
+    yield ('privify_upstream_circuit_state', 'gauge', 'Circuit breaker state, 1 for the current one.',
+           [({'upstream': name, 'state': state}, int(s['state'] == state))
+            for name, s in stats.items() for state in _BREAKER_STATES])
+
+
+def _collect_caches():
+    stats = result_cache.stats()
+    yield ('privify_result_cache_entries', 'gauge', 'Entries in the shared result cache.',
+           [({}, stats['entries'])])
+    yield ('privify_result_cache_bytes', 'gauge', 'Bytes stored in the shared result cache.',
+           [({}, stats['bytes'])])
+    for counter in ('hits', 'misses', 'evictions'):
+        yield (f'privify_result_cache_{counter}_total', 'counter',
+               f'Result cache {counter} per operation, across all workers.',
+               [({'op': op}, op_stats[counter]) for op, op_stats in stats['operations'].items()])
+
+    memo = risk_memo.stats()
+    yield ('privify_risk_memo_entries', 'gauge', 'Entries in the risk report memo.', [({}, memo['entries'])])
+    for counter in ('hits', 'misses', 'evictions'):
+        yield (f'privify_risk_memo_{counter}_total', 'counter', f'Risk report memo {counter}.',
+               [({}, memo[counter])])
+
+    flights = {'thread': single_flight.stats(), 'async': async_single_flight.stats()}
+    yield ('privify_single_flight_in_flight', 'gauge', 'Computations other requests can join.',
+           [({'kind': kind}, s['in_flight']) for kind, s in flights.items()])
+    yield ('privify_single_flight_coalesced_total', 'counter', 'Requests that joined a running computation.',
+           [({'kind': kind}, s['coalesced']) for kind, s in flights.items()])
+
+
+def _collect_queues():
+    queues = {name: queue.stats() for name, queue in job_queues.items()}
+    yield ('privify_job_queue_pending', 'gauge', 'Jobs queued or running in this worker.',
+           [({'queue': name}, s['pending']) for name, s in queues.items()])
+    yield ('privify_job_queue_max_pending', 'gauge', 'Jobs a queue accepts before refusing new ones.',
+           [({'queue': name}, s['max_pending']) for name, s in queues.items()])
+    yield ('privify_jobs', 'gauge', 'Stored jobs per queue and status.',
+           [({'queue': queue, 'status': status}, count)
+            for queue, counts in job_store.counts().items() for status, count in counts.items()])
+
+
+def _collect_logging():
+    stats = logging_stats()
+    yield ('privify_log_queue_depth', 'gauge', 'Log records waiting for the writer thread.',
+           [({}, stats['queued'])])
+    yield ('privify_log_records_dropped_total', 'counter', 'Log records dropped because the queue was full.',
+           [({}, stats['dropped'])])
+
+
+def _collect_storage():
+    stats = {name: store.stats() for name, store in stores.items()}
+    yield ('privify_storage_files', 'gauge', 'Files in each content store as of its last sweep and writes since.',
+           [({'store': name}, s['files']) for name, s in stats.items()])
+    yield ('privify_storage_bytes', 'gauge', 'Bytes in each content store; absent until the first sweep.',
+           [({'store': name}, s['bytes']) for name, s in stats.items() if s['bytes'] is not None])
+    yield ('privify_storage_max_bytes', 'gauge', 'Byte quota of each content store.',
+           [({'store': name}, s['max_bytes']) for name, s in stats.items()])
+    for counter, doc in (('writes', 'New files written'), ('deduplicated', 'Writes of content already stored'),
+                         ('expired', 'Files removed after their TTL'),
+                         ('evicted', 'Files removed to stay under the quota')):
+        yield (f'privify_storage_{counter}_total', 'counter', f'{doc}, per content store.',
+               [({'store': name}, s[counter]) for name, s in stats.items()])
+
+
+for _collect in (_collect_upstreams, _collect_caches, _collect_queues, _collect_logging, _collect_storage):
+    registry.register(Collector(_collect))
+
+
+def _count_bytes(iterable, counter):
+    for chunk in iterable:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    if request.mimetype == 'multipart/form-data':
+        # Werkzeug parses the form lazily; parse it here so the time is attributed
+        with time_stage('upload_parse'):
+            request.files
+
+
+def _finish_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    bytes_out = response.content_length
+    if bytes_out is None and response.is_streamed:
+        # Counted as the body is sent, e.g. batch ZIPs and event streams
+        response.response = _count_bytes(response.response, response_bytes.labels(route))
+    observe_request(route, request.method, response.status_code, time.perf_counter() - start,
+                    request.content_length, bytes_out)
+    return response
+
+
+def init_request_metrics(app):
+    """
+    Time every request of app into privify_http_request_duration_seconds and
+    count its body bytes. Streamed responses are timed to the first byte.
+    """
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    # Create the children for every route up front
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            request_duration.labels(rule.rule, method, 200)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics for this worker: route and stage latency histograms,
+    bytes in and out, upstream status codes, and cache and queue gauges.
+    """
+    try:
+        return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        logger.error(f"Metrics rendering failed: {str(e)}")
+        return Response('# metrics unavailable\n', status=500, content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,44 +1,233 @@
 # routes/privacy_filter_routes.py
 from flask import Blueprint, request, jsonify, send_file
-import os
+import io
+import json
 import logging
-from config import UPLOAD_FOLDER, PROCESSED_FOLDER
+import os
+import zipfile
+from PIL import Image
 from services.blur_service import remove_text_from_image
+from services.local_privacy_service import (TEXT_REMOVAL_ENGINES, DEFAULT_TEXT_REMOVAL_ENGINE, TEXT_ACTIONS,
+                                            REDACTION_TARGETS, REDACTION_STYLES, REDACTION_BATCH_LIMIT,
+                                            remove_text_locally, redact_batch)
+from services.upload_service import prepare_upload, read_source
+from routes.job_routes import enqueue
 
 # Initialize the Blueprint FIRST
 privacy_filter_bp = Blueprint('privacy_filter', __name__)
 logger = logging.getLogger(__name__)
 
-@privacy_filter_bp.route('/filter', methods=['POST'])
-def privacy_filter():
-    logger.info("Received privacy filter request")
-    
+# Redaction results of a single image travel as response headers
+REDACTION_HEADERS = ['X-Redaction-Regions', 'Server-Timing']
+
+def _server_timing(timings_ms):
+    return ', '.join(f"{stage};dur={duration}" for stage, duration in timings_ms.items())
+
+def output_mimetype(output):
+    # Both engines may return PNG or WebP; only the header is read
+    try:
+        with Image.open(output) as img:
+            return Image.MIME.get(img.format, 'image/jpeg')
+    except Exception:
+        return 'image/jpeg'
+    finally:
+        output.seek(0)
+
+def parse_filter_options(form):
+    """
+    Read and validate the privacy filter form fields.
+
+    Returns:
+        tuple: (options, None), or (None, error message)
+    """
+    engine = form.get('engine', DEFAULT_TEXT_REMOVAL_ENGINE)
+    if engine not in TEXT_REMOVAL_ENGINES:
+        logger.error("Invalid privacy filter engine: %s", engine)
+        return None, f'Invalid engine, expected one of {list(TEXT_REMOVAL_ENGINES)}'
+
+    action = form.get('action', 'inpaint')
+    if action not in TEXT_ACTIONS:
+        logger.error("Invalid privacy filter action: %s", action)
+        return None, f'Invalid action, expected one of {list(TEXT_ACTIONS)}'
+
+    try:
+        threshold = float(form.get('threshold', 0.7))
+    except ValueError:
+        threshold = -1
+    if not 0 <= threshold <= 1:
+        logger.error("Invalid threshold: %s", form.get('threshold'))
+        return None, 'Invalid threshold, expected a number between 0 and 1'
+
+    return {'engine': engine, 'action': action, 'threshold': threshold}, None
+
+def _filter_request():
+    """
+    Validate a privacy filter request.
+
+    Returns:
+        tuple: (file, options, None), or (None, None, error response)
+    """
     if 'file' not in request.files:
         logger.error("No file part in request")
-        return jsonify({'error': 'No file uploaded'}), 400
+        return None, None, (jsonify({'error': 'No file uploaded'}), 400)
 
     file = request.files['file']
     if file.filename == '':
         logger.error("Empty filename")
-        return jsonify({'error': 'No selected file'}), 400
+        return None, None, (jsonify({'error': 'No selected file'}), 400)
+
+    options, error = parse_filter_options(request.form)
+    if error:
+        return None, None, (jsonify({'error': error}), 400)
+
+    return file, options, None
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+def _apply_filter(source, options):
+    """
+    Run the selected text removal engine.
+
+    Returns:
+        tuple: (output stream rewound to the start, mimetype), or None on failure
+    """
+    output = io.BytesIO()
+    if options['engine'] == 'local':
+        succeeded = remove_text_locally(source, output, options['threshold'], options['action'])
+    else:
+        succeeded = remove_text_from_image(source, output, options['threshold'])
+    if not succeeded:
+        return None
+    output.seek(0)
+    return output, output_mimetype(output)
+
+def _filter_job(data, options):
+    result = _apply_filter(data, options)
+    if result is None:
+        raise RuntimeError('Text removal failed')
+    output, mimetype = result
+    return output.getvalue(), mimetype
+
+@privacy_filter_bp.route('/filter', methods=['POST'])
+def privacy_filter():
+    """
+    Remove text from the uploaded image.
+
+    Form fields:
+        engine: 'remote' (Segmind workflow) or 'local' (OpenCV on this server)
+        threshold: Detection threshold between 0 and 1 (default 0.7)
+        action: 'inpaint' or 'blur', local engine only
+    """
+    logger.info("Received privacy filter request")
+    
+    file, options, error = _filter_request()
+    if error:
+        return error
 
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        output_path = os.path.join(PROCESSED_FOLDER, f"processed_{file.filename}")
+        source = prepare_upload(file)
         
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
-        
-        logger.info("Processing image...")
-        if not remove_text_from_image(input_path, output_path):
+        logger.info("Processing image (engine=%s)...", options['engine'])
+        result = _apply_filter(source, options)
+        if result is None:
             return jsonify({'error': 'Text removal failed'}), 500
             
-        return send_file(output_path, mimetype='image/jpeg')
+        output, mimetype = result
+        return send_file(output, mimetype=mimetype, download_name=f"processed_{file.filename}")
         
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@privacy_filter_bp.route('/filter/jobs', methods=['POST'])
+def submit_privacy_filter():
+    """
+    Queue a privacy filter run and return its job id at once.
+
+    Takes the same form fields as /filter. Poll /jobs/<id> or listen on
+    /jobs/<id>/events, then fetch the image from /jobs/<id>/result.
+    """
+    logger.info("Received privacy filter job")
+
+    file, options, error = _filter_request()
+    if error:
+        return error
+
+    try:
+        # The request stream is gone once we return, so the job gets the bytes
+        data = read_source(prepare_upload(file))
+        return enqueue('privacy', 'privacy-filter', _filter_job, data, options)
+
+    except Exception as e:
+        logger.error(f"Queueing privacy filter failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@privacy_filter_bp.route('/redact', methods=['POST'])
+def redact():
+    """
+    Blur faces and licence plates locally in one or more uploaded images.
+
+    Form fields:
+        file: One or more images (repeat the field for a batch)
+        targets: Comma-separated subset of 'faces,plates' (default both)
+        style: 'blur' or 'pixelate'
+
+    A single image comes back as an image with the region counts in
+    X-Redaction-Regions and per-stage latency in Server-Timing. A batch comes
+    back as a ZIP of the redacted images plus manifest.json with the same
+    report for every file.
+    """
+    logger.info("Received redaction request")
+
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        logger.error("No file part in request")
+        return jsonify({'error': 'No file uploaded'}), 400
+    if len(files) > REDACTION_BATCH_LIMIT:
+        logger.error("Redaction batch too large: %d files", len(files))
+        return jsonify({'error': f'Too many files, at most {REDACTION_BATCH_LIMIT} per request'}), 400
+
+    targets = [t.strip() for t in request.form.get('targets', ','.join(REDACTION_TARGETS)).split(',') if t.strip()]
+    if not targets or any(t not in REDACTION_TARGETS for t in targets):
+        logger.error("Invalid redaction targets: %s", targets)
+        return jsonify({'error': f'Invalid targets, expected a subset of {list(REDACTION_TARGETS)}'}), 400
+
+    style = request.form.get('style', 'blur')
+    if style not in REDACTION_STYLES:
+        logger.error("Invalid redaction style: %s", style)
+        return jsonify({'error': f'Invalid style, expected one of {list(REDACTION_STYLES)}'}), 400
+
+    try:
+        logger.info("Redacting %d images (targets=%s, style=%s)...", len(files), targets, style)
+        results = redact_batch([read_source(prepare_upload(file)) for file in files], targets, style)
+
+        if len(files) == 1:
+            if results[0] is None:
+                return jsonify({'error': 'Redaction failed'}), 500
+            redacted, report = results[0]
+            response = send_file(io.BytesIO(redacted), mimetype=report['mimetype'],
+                                 download_name=f"redacted_{files[0].filename}")
+            response.headers['X-Redaction-Regions'] = json.dumps(report['regions'])
+            response.headers['Server-Timing'] = _server_timing(report['timings_ms'])
+            return response
+
+        archive = io.BytesIO()
+        manifest = []
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+            for index, (file, result) in enumerate(zip(files, results)):
+                entry = {'file': file.filename}
+                if result is None:
+                    entry['error'] = 'Redaction failed'
+                else:
+                    redacted, report = result
+                    # Prefix with the position so duplicate upload names do not collide
+                    entry['name'] = f"{index:03d}_redacted_{os.path.basename(file.filename)}"
+                    entry.update(report)
+                    zf.writestr(entry['name'], redacted)
+                manifest.append(entry)
+            zf.writestr('manifest.json', json.dumps(manifest, indent=2))
+
+        archive.seek(0)
+        return send_file(archive, mimetype='application/zip', as_attachment=True, download_name='redacted.zip')
+
+    except Exception as e:
+        logger.error(f"Redaction failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
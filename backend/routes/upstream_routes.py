@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+import logging
+from services.upstream_service import upstreams
+
+upstream_bp = Blueprint('upstreams', __name__)
+logger = logging.getLogger(__name__)
+
+@upstream_bp.route('/stats', methods=['GET'])
+def upstream_stats():
+    """
+    Report this worker's request, retry, status and latency counters and the
+    circuit breaker state for each upstream API.
+    """
+    try:
+        return jsonify({name: upstream.stats() for name, upstream in upstreams.items()})
+    except Exception as e:
+        logger.error(f"Upstream stats failed: {str(e)}")
+        return jsonify({'error': 'Upstream stats unavailable'}), 500
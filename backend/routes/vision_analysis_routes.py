@@ -1,12 +1,21 @@
-from flask import Blueprint, request, jsonify
-import os
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
 import logging
-from config import UPLOAD_FOLDER
-from services.vision_analysis_service import analyze_image_description, detect_objects_in_image, analyze_image_comprehensive
+from config import RESULT_CACHE_ENABLED
+from services.upload_service import prepare_upload, read_source
+from services.cache_service import cached, content_digest, make_key, result_cache
+from routes.job_routes import enqueue
+from services.vision_analysis_service import (COMPREHENSIVE_MODES, DEFAULT_COMPREHENSIVE_MODE, analyze_image_description,
+                                              detect_objects_in_image, analyze_image_comprehensive,
+                                              stream_image_analysis)
 
 vision_analysis_bp = Blueprint('vision_analysis', __name__)
 logger = logging.getLogger(__name__)
 
+def _succeeded(result):
+    # Upstream failures (missing key, rate limits) must not be cached
+    return bool(result) and result.get('success', False)
+
 @vision_analysis_bp.route('/description', methods=['POST'])
 def get_image_description():
     """
@@ -23,17 +32,12 @@ def get_image_description():
         logger.error("Empty filename")
         return jsonify({'error': 'No selected file'}), 400
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
+        source = prepare_upload(file)
         
         logger.info("Analyzing image description...")
-        result = analyze_image_description(input_path)
+        result = cached('vision-description', content_digest(source), None,
+                        lambda: analyze_image_description(source), is_cacheable=_succeeded)
         
         if not result['success']:
             return jsonify({'error': result['error']}), 500
@@ -63,17 +67,12 @@ def get_detected_objects():
         logger.error("Empty filename")
         return jsonify({'error': 'No selected file'}), 400
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
+        source = prepare_upload(file)
         
         logger.info("Detecting objects in image...")
-        result = detect_objects_in_image(input_path)
+        result = cached('vision-objects', content_digest(source), None,
+                        lambda: detect_objects_in_image(source), is_cacheable=_succeeded)
         
         if not result['success']:
             return jsonify({'error': result['error']}), 500
@@ -89,52 +88,203 @@ def get_detected_objects():
         logger.error(f"Object detection failed: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def _comprehensive(source, mode):
+    """Run (or fetch from cache) a comprehensive analysis and shape the response body."""
+    result = cached('vision-comprehensive', content_digest(source), {'mode': mode},
+                    lambda: analyze_image_comprehensive(source, mode), is_cacheable=_succeeded)
+    return _comprehensive_body(result)
+
+def _comprehensive_body(result):
+    if not result['success']:
+        return {
+            'success': False,
+            'errors': result['errors'],
+            'partial_results': {
+                'description': result.get('description', ''),
+                'objects': result.get('objects', []),
+                'object_count': result.get('object_count', 0)
+            }
+        }
+    
+    return {
+        'success': True,
+        'description': result['description'],
+        'objects': result['objects'],
+        'object_count': result['object_count']
+    }
+
+def _comprehensive_request():
+    """Validate a comprehensive analysis request: (file, mode, None) or (None, None, error response)."""
+    if 'file' not in request.files:
+        logger.error("No file part in request")
+        return None, None, (jsonify({'error': 'No file uploaded'}), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        logger.error("Empty filename")
+        return None, None, (jsonify({'error': 'No selected file'}), 400)
+
+    mode = request.args.get('mode', DEFAULT_COMPREHENSIVE_MODE)
+    if mode not in COMPREHENSIVE_MODES:
+        logger.error("Invalid comprehensive analysis mode: %s", mode)
+        return None, None, (jsonify({'error': f'Invalid mode, expected one of {list(COMPREHENSIVE_MODES)}'}), 400)
+
+    return file, mode, None
+
 @vision_analysis_bp.route('/comprehensive', methods=['POST'])
 def get_comprehensive_analysis():
     """
     Get comprehensive analysis including description and object detection.
+
+    Query parameters:
+        mode: 'parallel' (two concurrent requests) or 'fused' (one request)
     """
     logger.info("Received request for comprehensive vision analysis")
     
+    file, mode, error = _comprehensive_request()
+    if error:
+        return error
+
+    try:
+        source = prepare_upload(file)
+        
+        logger.info("Performing comprehensive vision analysis (mode=%s)...", mode)
+        body = _comprehensive(source, mode)
+        return jsonify(body), 200 if body['success'] else 500
+        
+    except Exception as e:
+        logger.error(f"Comprehensive vision analysis failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@vision_analysis_bp.route('/comprehensive/jobs', methods=['POST'])
+def submit_comprehensive_analysis():
+    """
+    Queue a comprehensive analysis and return its job id at once.
+
+    Takes the same file and mode as /comprehensive. Poll /jobs/<id> or
+    listen on /jobs/<id>/events; the result has the /comprehensive body.
+    """
+    logger.info("Received comprehensive vision analysis job")
+
+    file, mode, error = _comprehensive_request()
+    if error:
+        return error
+
+    try:
+        # The request stream is gone once we return, so the job gets the bytes
+        data = read_source(prepare_upload(file))
+        return enqueue('vision', 'vision-comprehensive', _comprehensive, data, mode)
+
+    except Exception as e:
+        logger.error(f"Queueing comprehensive vision analysis failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_analysis(source, op, params, with_objects):
+    """
+    Server-sent events for a streamed analysis.
+
+    The final 'result' event carries the body the matching JSON endpoint
+    returns (an 'error' event for a failed description). A cached result is
+    replayed at once; a fresh successful one is stored under the same key
+    the JSON endpoint uses, so either kind of client benefits.
+    """
+    data = read_source(source)
+    yield _sse('received', {'bytes': len(data)})
+
+    key = make_key(op, content_digest(data), params)
+    result = result_cache.get(op, key) if RESULT_CACHE_ENABLED else None
+    try:
+        if result is None:
+            for event, payload in stream_image_analysis(data, with_objects):
+                if event == 'result':
+                    result = payload
+                else:
+                    yield _sse(event, payload)
+            if RESULT_CACHE_ENABLED and _succeeded(result):
+                result_cache.set(op, key, result)
+        else:
+            logger.info("Result cache hit for %s", op)
+            yield _sse('description', {'success': True, 'description': result['description']})
+            if with_objects:
+                yield _sse('objects', {'success': True, 'objects': result['objects'],
+                                       'object_count': result['object_count']})
+
+        if with_objects:
+            yield _sse('result', _comprehensive_body(result))
+        elif result['success']:
+            yield _sse('result', {'success': True, 'description': result['description']})
+        else:
+            yield _sse('error', {'error': result['error']})
+
+    except Exception as e:
+        logger.error(f"Streamed vision analysis failed: {str(e)}")
+        yield _sse('error', {'error': 'Internal server error'})
+
+def _event_stream(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _uploaded_file():
+    """The uploaded file, or an error response: (file, None) or (None, error)."""
     if 'file' not in request.files:
         logger.error("No file part in request")
-        return jsonify({'error': 'No file uploaded'}), 400
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
 
     file = request.files['file']
     if file.filename == '':
         logger.error("Empty filename")
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
 
-    # Create necessary directories
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    return file, None
+
+@vision_analysis_bp.route('/description/stream', methods=['POST'])
+def stream_image_description():
+    """
+    Streaming variant of /description, as server-sent events.
+
+    Events: 'received', 'encoded', 'description_delta' (one per piece of
+    generated text), 'description', then 'result' with the /description
+    body or 'error'.
+    """
+    logger.info("Received request for streamed image description")
+
+    file, error = _uploaded_file()
+    if error:
+        return error
 
     try:
-        input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        
-        logger.info(f"Saving file to {input_path}")
-        file.save(input_path)
-        
-        logger.info("Performing comprehensive vision analysis...")
-        result = analyze_image_comprehensive(input_path)
-        
-        if not result['success']:
-            return jsonify({
-                'success': False,
-                'errors': result['errors'],
-                'partial_results': {
-                    'description': result.get('description', ''),
-                    'objects': result.get('objects', []),
-                    'object_count': result.get('object_count', 0)
-                }
-            }), 500
-        
-        return jsonify({
-            'success': True,
-            'description': result['description'],
-            'objects': result['objects'],
-            'object_count': result['object_count']
-        })
-        
+        source = prepare_upload(file)
+        return _event_stream(_stream_analysis(source, 'vision-description', None, with_objects=False))
+
     except Exception as e:
-        logger.error(f"Comprehensive vision analysis failed: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
+        logger.error(f"Streamed image description failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@vision_analysis_bp.route('/comprehensive/stream', methods=['POST'])
+def stream_comprehensive_analysis():
+    """
+    Streaming variant of /comprehensive, as server-sent events.
+
+    The description streams token by token while objects are detected
+    concurrently ('parallel' mode). Events: 'received', 'encoded',
+    'description_delta', 'description', 'objects' (as soon as it is ready,
+    possibly before the description ends), then 'result' with the
+    /comprehensive body.
+    """
+    logger.info("Received request for streamed comprehensive vision analysis")
+
+    file, error = _uploaded_file()
+    if error:
+        return error
+
+    try:
+        source = prepare_upload(file)
+        return _event_stream(_stream_analysis(source, 'vision-comprehensive', {'mode': 'parallel'},
+                                              with_objects=True))
+
+    except Exception as e:
+        logger.error(f"Streamed comprehensive vision analysis failed: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
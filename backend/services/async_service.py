@@ -0,0 +1,17 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import ASYNC_BLOCKING_WORKERS
+
+# Shared by every coroutine of the ASGI app. Pillow and OpenCV release the
+# GIL while decoding, resizing and encoding, so threads give real overlap.
+blocking_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call (image work, SQLite) on blocking_executor and await its result."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context (request id, log sampling) into the thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, context.run, functools.partial(fn, *args, **kwargs))
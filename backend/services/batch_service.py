@@ -0,0 +1,174 @@
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from config import BATCH_WORKERS, BATCH_MAX_FILES, BATCH_MAX_FILE_BYTES, ENCODER_PROFILE, RESULT_CACHE_ENABLED
+from services.cache_service import content_digest, make_key, result_cache
+from services.metadata_removal_service import clean_image
+from services.upload_service import prepare_upload, read_source
+
+logger = logging.getLogger(__name__)
+
+# Jobs submitted ahead of the ones being collected, per worker. Bounds how
+# many inputs and results the request process holds at once.
+_IN_FLIGHT_PER_WORKER = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_batch_pool():
+    """
+    Return the process pool that runs batch jobs, starting it on first use.
+
+    Workers come from a fork server rather than forking the web worker, so
+    they do not inherit its threads, locks or open sockets.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS,
+                                        mp_context=multiprocessing.get_context('forkserver'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _is_skipped_member(info):
+    # Folders and the resource forks macOS adds to archives
+    name = info.filename
+    return info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.')
+
+
+def iter_batch_inputs(files):
+    """
+    Yield the images of a batch upload one at a time.
+
+    ZIP archives are expanded member by member, so only the member being
+    handed out is decompressed. At most BATCH_MAX_FILES images are produced;
+    files over BATCH_MAX_FILE_BYTES are reported instead of read.
+
+    Args:
+        files: Uploaded FileStorage objects; any of them may be a ZIP archive
+
+    Yields:
+        tuple: (name, data, error) where exactly one of data and error is set
+    """
+    count = 0
+    for file in files:
+        source = prepare_upload(file)
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    if _is_skipped_member(info):
+                        continue
+                    count += 1
+                    if count > BATCH_MAX_FILES:
+                        yield info.filename, None, f'Batch limit of {BATCH_MAX_FILES} files reached'
+                        return
+                    if info.file_size > BATCH_MAX_FILE_BYTES:
+                        yield info.filename, None, 'File too large'
+                        continue
+                    yield info.filename, archive.read(info), None
+            continue
+
+        count += 1
+        if count > BATCH_MAX_FILES:
+            yield file.filename, None, f'Batch limit of {BATCH_MAX_FILES} files reached'
+            return
+        data = read_source(source)
+        if len(data) > BATCH_MAX_FILE_BYTES:
+            yield file.filename, None, 'File too large'
+            continue
+        yield file.filename, data, None
+
+
+def clean_batch(inputs, method='auto', metadata_types=None, profile=ENCODER_PROFILE):
+    """
+    Clean a stream of images on the process pool, yielding results as they finish.
+
+    A bounded number of jobs is in flight at any time, so memory stays flat
+    however long the batch is. Results already in the result cache are
+    returned without a round trip to a worker, and new ones are stored.
+
+    Args:
+        inputs: Iterable of (name, data, error) as produced by iter_batch_inputs
+        method: One of REMOVAL_METHODS, used when removing all metadata
+        metadata_types: Metadata types to remove selectively, or None to remove everything
+        profile: One of ENCODER_PROFILES, used when an image is re-encoded
+
+    Yields:
+        tuple: (name, result, error) in completion order, where result is the
+        (clean_bytes, report) pair returned by clean_image
+    """
+    if metadata_types is None:
+        op, params = 'clean', {'method': method, 'profile': profile}
+    else:
+        op, params = 'clean-selective', {'types': sorted(metadata_types), 'profile': profile}
+
+    pool = get_batch_pool()
+    max_in_flight = BATCH_WORKERS * _IN_FLIGHT_PER_WORKER
+    inputs = iter(inputs)
+    pending = {}
+    exhausted = False
+
+    try:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                item = next(inputs, None)
+                if item is None:
+                    exhausted = True
+                    break
+                name, data, error = item
+                if error is not None:
+                    yield name, None, error
+                    continue
+
+                key = make_key(op, content_digest(data), params)
+                result = result_cache.get(op, key) if RESULT_CACHE_ENABLED else None
+                if result is not None:
+                    yield name, result, None
+                    continue
+                try:
+                    pending[pool.submit(clean_image, data, method, metadata_types, profile)] = (name, key)
+                except BrokenProcessPool as e:
+                    logger.error(f"Batch worker pool broke: {str(e)}")
+                    _reset_pool()
+                    pool = get_batch_pool()
+                    yield name, None, 'Metadata removal failed'
+
+            if not pending:
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. OOM killed); start a fresh pool next time
+                    logger.error(f"Batch worker pool broke: {str(e)}")
+                    _reset_pool()
+                    result = None
+                except Exception as e:
+                    logger.error(f"Batch job failed for {name}: {str(e)}")
+                    result = None
+
+                if result is None:
+                    yield name, None, 'Metadata removal failed'
+                    continue
+                if RESULT_CACHE_ENABLED:
+                    result_cache.set(op, key, result)
+                yield name, result, None
+
+    finally:
+        # Client went away or the batch failed: drop work not yet started
+        for future in pending:
+            future.cancel()
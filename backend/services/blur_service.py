@@ -1,27 +1,30 @@
 # services/blur_service.py
 import os
 import logging
-import requests
-import base64
+from services.async_service import run_blocking
+from services.upload_service import write_output
+from services.upstream_image_service import upstream_data_url
+from services.upstream_service import UpstreamUnavailable, upstreams
 
 logger = logging.getLogger(__name__)
 
 SEGMIND_API_KEY = os.getenv("SEGMIND_API_KEY")
 WORKFLOW_URL = "https://api.segmind.com/workflows/67a326c2d52cfa65374963ab-v4"
 
-def remove_text_from_image(input_path, output_path, threshold=0.7):
-    """Process image directly using base64 encoding"""
+def remove_text_from_image(source, output, threshold=0.7):
+    """Process image (path, bytes or stream) directly using base64 encoding"""
     try:
-        # 1. Read and encode image
-        with open(input_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+        # 1. Read, downscale and encode image
+        image_url, _ = upstream_data_url(source, 'segmind')
 
-        # 2. Call Segmind API with base64
-        response = requests.post(
+        # 2. Call Segmind API with base64. Each run is billed, so a request
+        # that may have reached the workflow is not sent again.
+        response = upstreams['segmind'].post(
             WORKFLOW_URL,
+            idempotent=False,
             headers={'x-api-key': SEGMIND_API_KEY},
             json={
-                "input_image": f"data:image/jpeg;base64,{base64_image}",
+                "input_image": image_url,
                 "Threshold": str(threshold)
             }
         )
@@ -32,12 +35,47 @@ def remove_text_from_image(input_path, output_path, threshold=0.7):
             return False
 
         # 4. Save processed image
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+        write_output(output, response.content)
             
-        logger.info(f"Processed image saved to {output_path}")
+        logger.info(f"Processed image written ({len(response.content)} bytes)")
         return True
 
+    except UpstreamUnavailable as e:
+        logger.warning(f"Text removal skipped: {str(e)}")
+        return False
+
+    except Exception as e:
+        logger.error(f"Text removal failed: {str(e)}")
+        return False
+
+async def remove_text_from_image_async(source, output, threshold=0.7):
+    """Async counterpart of remove_text_from_image; image preparation runs on the blocking executor"""
+    try:
+        image_url, _ = await run_blocking(upstream_data_url, source, 'segmind')
+
+        response = await upstreams['segmind'].apost(
+            WORKFLOW_URL,
+            idempotent=False,
+            headers={'x-api-key': SEGMIND_API_KEY},
+            json={
+                "input_image": image_url,
+                "Threshold": str(threshold)
+            }
+        )
+
+        if response.status_code != 200:
+            logger.error(f"API Error {response.status_code}: {response.text}")
+            return False
+
+        write_output(output, response.content)
+            
+        logger.info(f"Processed image written ({len(response.content)} bytes)")
+        return True
+
+    except UpstreamUnavailable as e:
+        logger.warning(f"Text removal skipped: {str(e)}")
+        return False
+
     except Exception as e:
         logger.error(f"Text removal failed: {str(e)}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,375 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import RESULT_CACHE_ENABLED, RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS
+from services.async_service import run_blocking
+from services.single_flight_service import async_single_flight, single_flight
+from services.upload_service import open_source
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a process sweeps expired entries while writing
+_PURGE_INTERVAL = 60
+
+# How often (seconds) a process adds its hit and miss counts to the shared stats
+_STATS_FLUSH_INTERVAL = 10
+
+# A hit refreshes an entry's LRU position only once it is older than this
+# fraction of the TTL, so most hits stay read-only transactions
+_ACCESS_REFRESH_FRACTION = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    op TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    blob BLOB,
+    meta TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+-- Running total of results.size, kept by triggers in the same transaction
+-- as each write, so eviction does not have to sum the whole table
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bytes INTEGER NOT NULL
+);
+INSERT INTO usage (id, bytes)
+    SELECT 1, (SELECT COALESCE(SUM(size), 0) FROM results) WHERE NOT EXISTS (SELECT 1 FROM usage);
+CREATE TRIGGER IF NOT EXISTS results_usage_insert AFTER INSERT ON results
+    BEGIN UPDATE usage SET bytes = bytes + new.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS results_usage_delete AFTER DELETE ON results
+    BEGIN UPDATE usage SET bytes = bytes - old.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS results_usage_update AFTER UPDATE OF size ON results
+    BEGIN UPDATE usage SET bytes = bytes - old.size + new.size WHERE id = 1; END;
+CREATE TABLE IF NOT EXISTS stats (
+    op TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def content_digest(source):
+    """SHA-256 hex digest of an image source (path, bytes or seekable stream)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    with open_source(source) as f:
+        digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        f.seek(0)
+        return digest
+
+
+def json_digest(value):
+    """SHA-256 hex digest of a JSON-serializable value in canonical form."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def make_key(op, digest, params=None):
+    """Cache key for an operation on content, including its parameters."""
+    return f"{op}:{digest}:{json_digest(params) if params else ''}"
+
+
+class ResultCache:
+    """
+    Size-capped LRU cache with TTL, stored in SQLite so gunicorn workers share it.
+
+    Values are JSON-serializable objects, bytes, or a (bytes, dict) pair such
+    as a cleaned image with its verification report. Hit, miss and eviction
+    counters are kept per operation in the same database; hits and misses
+    are counted in memory and added every _STATS_FLUSH_INTERVAL seconds, so
+    a hit does not take the database write lock.
+    """
+
+    def __init__(self, path, max_bytes, ttl_seconds):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._stats_lock = threading.Lock()
+        self._pending = {}
+        self._pending_pid = os.getpid()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush_stats)
+
+    def _connect(self):
+        # One connection per thread and per process (connections do not survive fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE fires the delete trigger for the replaced row only with this on
+        conn.execute("PRAGMA recursive_triggers=ON")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn, op, column, amount=1):
+        conn.execute(
+            f"INSERT INTO stats (op, {column}) VALUES (?, ?) "
+            f"ON CONFLICT(op) DO UPDATE SET {column} = {column} + excluded.{column}",
+            (op, amount),
+        )
+
+    def _tally(self, op, column):
+        with self._stats_lock:
+            if self._pending_pid != os.getpid():
+                # Forked: the parent flushes what it counted
+                self._pending, self._pending_pid = {}, os.getpid()
+            counts = self._pending.setdefault(op, {'hits': 0, 'misses': 0})
+            counts[column] += 1
+            due = time.monotonic() - self._last_flush > _STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Add this process's pending hit and miss counts to the shared stats."""
+        with self._stats_lock:
+            if self._pending_pid != os.getpid():
+                self._pending, self._pending_pid = {}, os.getpid()
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for op, counts in pending.items():
+                    for column, amount in counts.items():
+                        if amount:
+                            self._count(conn, op, column, amount)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Result cache stats update failed: %s", e)
+
+    def get(self, op, key):
+        """Return the cached value, or None on a miss or expired entry."""
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT kind, blob, meta, created, accessed FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[3] + self.ttl_seconds < now:
+                if row is not None:
+                    conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._tally(op, 'misses')
+                return None
+            if now - row[4] > self.ttl_seconds * _ACCESS_REFRESH_FRACTION:
+                conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._tally(op, 'hits')
+        except sqlite3.Error as e:
+            logger.warning("Result cache read failed: %s", e)
+            return None
+
+        kind, blob, meta = row[:3]
+        if kind == 'json':
+            return json.loads(meta)
+        if kind == 'bytes':
+            return bytes(blob)
+        return bytes(blob), json.loads(meta)
+
+    def set(self, op, key, value):
+        """Store a value and evict least recently used entries over the size cap."""
+        if isinstance(value, tuple):
+            kind, blob, meta = 'pair', value[0], json.dumps(value[1])
+        elif isinstance(value, (bytes, bytearray)):
+            kind, blob, meta = 'bytes', value, None
+        else:
+            kind, blob, meta = 'json', None, json.dumps(value)
+        size = len(blob or b'') + len(meta or '')
+        if size > self.max_bytes:
+            return
+
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, op, kind, blob, meta, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, op, kind, blob, meta, size, now, now),
+            )
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning("Result cache write failed: %s", e)
+
+    def _evict(self, conn, now):
+        if now - self._last_purge > _PURGE_INTERVAL:
+            self._last_purge = now
+            conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_seconds,))
+
+        total = conn.execute("SELECT bytes FROM usage WHERE id = 1").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Other workers may have written or evicted since the read above
+            total = conn.execute("SELECT bytes FROM usage WHERE id = 1").fetchone()[0]
+            evicted = {}
+            for key, op, size in conn.execute("SELECT key, op, size FROM results ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                evicted[op] = evicted.get(op, 0) + 1
+            for op, count in evicted.items():
+                self._count(conn, op, 'evictions', count)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info("Result cache evicted %d entries", sum(evicted.values()))
+
+    def stats(self):
+        """
+        Entry count, stored bytes and per-operation hit/miss/eviction counters.
+
+        Includes this process's latest counts; other workers' may lag by up
+        to _STATS_FLUSH_INTERVAL seconds.
+        """
+        self.flush_stats()
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        total = conn.execute("SELECT bytes FROM usage WHERE id = 1").fetchone()[0]
+        ops = {}
+        for op, hits, misses, evictions in conn.execute("SELECT op, hits, misses, evictions FROM stats"):
+            lookups = hits + misses
+            ops[op] = {
+                'hits': hits,
+                'misses': misses,
+                'evictions': evictions,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            'enabled': RESULT_CACHE_ENABLED,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'operations': ops,
+        }
+
+
+class LRUMemo:
+    """Bounded in-process LRU map with hit, miss and eviction counters."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS)
+
+
+def cached(op, digest, params, compute, is_cacheable=lambda value: value is not None):
+    """
+    Return the cached result of an operation, computing and storing it on a miss.
+
+    Concurrent misses for the same key are coalesced by single_flight, so a
+    burst of identical uploads costs one computation (and one upstream call).
+
+    Args:
+        op: Operation name, used for per-operation counters
+        digest: Content digest of the input (see content_digest and json_digest)
+        params: Operation parameters that change the result, or None
+        compute: Zero-argument callable producing the result
+        is_cacheable: Predicate deciding whether a computed result is stored;
+            failures should not be cached
+    """
+    key = make_key(op, digest, params)
+    if not RESULT_CACHE_ENABLED:
+        return single_flight.do(key, compute)
+
+    value = result_cache.get(op, key)
+    if value is not None:
+        logger.info("Result cache hit for %s", op)
+        return value
+
+    def compute_and_store():
+        value = compute()
+        if is_cacheable(value):
+            result_cache.set(op, key, value)
+        return value
+
+    return single_flight.do(key, compute_and_store, recheck=lambda: result_cache.get(op, key))
+
+
+async def cached_async(op, digest, params, compute, is_cacheable=lambda value: value is not None):
+    """
+    Async counterpart of cached() for the ASGI mode.
+
+    Same keys as cached(), so both serving modes share results. Cache
+    access runs on the blocking executor, and concurrent misses are
+    coalesced on the event loop.
+
+    Args:
+        compute: Zero-argument coroutine function producing the result
+    """
+    key = make_key(op, digest, params)
+    if not RESULT_CACHE_ENABLED:
+        return await async_single_flight.do(key, compute)
+
+    value = await run_blocking(result_cache.get, op, key)
+    if value is not None:
+        logger.info("Result cache hit for %s", op)
+        return value
+
+    async def compute_and_store():
+        value = await compute()
+        if is_cacheable(value):
+            await run_blocking(result_cache.set, op, key, value)
+        return value
+
+    return await async_single_flight.do(key, compute_and_store)
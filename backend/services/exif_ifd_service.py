@@ -0,0 +1,230 @@
+import logging
+import struct
+from PIL.ExifTags import TAGS
+from services.jpeg_segment_service import APP1, SOS, iter_jpeg_segments, find_jpeg_end, is_mpf_segment
+
+logger = logging.getLogger(__name__)
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/'
+
+# Tags whose value is the offset of a child IFD
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+INTEROP_IFD_POINTER = 0xA005
+IFD_POINTER_TAGS = {EXIF_IFD_POINTER, GPS_IFD_POINTER, INTEROP_IFD_POINTER}
+
+# Byte size of one value of each TIFF field type
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+ENTRY_SIZE = 12
+
+# Reverse of PIL.ExifTags.TAGS; a handful of names map to more than one id
+_NAME_TO_IDS = {}
+for _tag_id, _name in TAGS.items():
+    _NAME_TO_IDS.setdefault(_name, set()).add(_tag_id)
+
+
+def tag_ids_for_names(names):
+    """
+    Resolve metadata type names (as returned by extract_metadata) to tag ids.
+
+    Numeric strings are accepted for tags Pillow has no name for.
+    """
+    tag_ids = set()
+    for name in names:
+        if name in _NAME_TO_IDS:
+            tag_ids |= _NAME_TO_IDS[name]
+        elif str(name).isdigit():
+            tag_ids.add(int(name))
+        else:
+            logger.warning("Unknown metadata type: %s", name)
+    return tag_ids
+
+
+class _Tiff:
+    """Bounds-checked view over a TIFF structure that is patched in place."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        if bytes(buf[:2]) == b'II':
+            self.order = '<'
+        elif bytes(buf[:2]) == b'MM':
+            self.order = '>'
+        else:
+            raise ValueError("Invalid TIFF byte order")
+        if self.u16(2) != 42:
+            raise ValueError("Invalid TIFF magic number")
+
+    def u16(self, offset):
+        return struct.unpack_from(self.order + 'H', self.buf, offset)[0]
+
+    def u32(self, offset):
+        return struct.unpack_from(self.order + 'I', self.buf, offset)[0]
+
+    def valid_ifd(self, offset):
+        if offset < 8 or offset + 2 > len(self.buf):
+            return False
+        return offset + 2 + self.u16(offset) * ENTRY_SIZE + 4 <= len(self.buf)
+
+    def zero(self, start, length):
+        end = min(start + length, len(self.buf))
+        if start < end:
+            self.buf[start:end] = bytes(end - start)
+
+    def entries(self, offset):
+        for i in range(self.u16(offset)):
+            pos = offset + 2 + i * ENTRY_SIZE
+            tag, field_type, count = struct.unpack_from(self.order + 'HHI', self.buf, pos)
+            yield pos, tag, field_type, count
+
+    def value_extent(self, pos, field_type, count):
+        """Return (offset, length) of an out-of-line value, or None if it fits in the entry."""
+        length = TYPE_SIZES.get(field_type, 1) * count
+        if length <= 4:
+            return None
+        return self.u32(pos + 8), length
+
+
+def _wipe_ifd(tiff, offset, visited):
+    """Zero an IFD, its out-of-line values and any child IFDs it points to."""
+    if offset in visited or not tiff.valid_ifd(offset):
+        return
+    visited.add(offset)
+
+    count = tiff.u16(offset)
+    for pos, tag, field_type, value_count in tiff.entries(offset):
+        if tag in IFD_POINTER_TAGS:
+            _wipe_ifd(tiff, tiff.u32(pos + 8), visited)
+        extent = tiff.value_extent(pos, field_type, value_count)
+        if extent:
+            tiff.zero(*extent)
+    tiff.zero(offset, 2 + count * ENTRY_SIZE + 4)
+
+
+def _scrub_ifd(tiff, offset, tag_ids, visited):
+    """
+    Remove entries with the given tag ids from the IFD at offset, in place.
+
+    The kept entries are compacted to the front of the table and the next-IFD
+    pointer follows them, so the IFD keeps its position and no other offset in
+    the file (including MakerNote internals) has to be relocated. Freed table
+    slots and the out-of-line values of removed entries are zeroed.
+
+    Returns:
+        int: Number of entries removed from this IFD and its children
+    """
+    if offset in visited or not tiff.valid_ifd(offset):
+        return 0
+    visited.add(offset)
+
+    count = tiff.u16(offset)
+    next_pointer_pos = offset + 2 + count * ENTRY_SIZE
+    next_ifd = bytes(tiff.buf[next_pointer_pos:next_pointer_pos + 4])
+
+    kept = []
+    removed = 0
+    for pos, tag, field_type, value_count in tiff.entries(offset):
+        if tag in tag_ids:
+            if tag in IFD_POINTER_TAGS:
+                _wipe_ifd(tiff, tiff.u32(pos + 8), visited)
+            extent = tiff.value_extent(pos, field_type, value_count)
+            if extent:
+                tiff.zero(*extent)
+            removed += 1
+            logger.debug("Removed metadata tag: %s", TAGS.get(tag, tag))
+            continue
+        if tag in IFD_POINTER_TAGS:
+            removed += _scrub_ifd(tiff, tiff.u32(pos + 8), tag_ids, visited)
+        kept.append(bytes(tiff.buf[pos:pos + ENTRY_SIZE]))
+
+    if removed and len(kept) < count:
+        struct.pack_into(tiff.order + 'H', tiff.buf, offset, len(kept))
+        table = b''.join(kept) + next_ifd
+        tiff.buf[offset + 2:offset + 2 + len(table)] = table
+        tiff.zero(offset + 2 + len(table), (count - len(kept)) * ENTRY_SIZE)
+
+    return removed
+
+
+def scrub_tiff_tags(buf, tag_ids):
+    """
+    Remove tags from every IFD of a TIFF/EXIF structure, patching buf in place.
+
+    IFD0, the thumbnail IFD chain and the Exif, GPS and Interop child IFDs are
+    all visited. Removing a pointer tag (e.g. GPSInfo) wipes the child IFD it
+    points to. The structure keeps its length, so it can be written back over
+    the original bytes.
+
+    Args:
+        buf: Writable buffer (bytearray or memoryview) starting at the TIFF header
+        tag_ids: Set of tag ids to remove
+
+    Returns:
+        int: Number of entries removed
+    """
+    tiff = _Tiff(buf)
+    visited = set()
+    removed = 0
+
+    offset = tiff.u32(4)
+    while offset and offset not in visited and tiff.valid_ifd(offset):
+        next_pointer_pos = offset + 2 + tiff.u16(offset) * ENTRY_SIZE
+        next_offset = tiff.u32(next_pointer_pos)
+        removed += _scrub_ifd(tiff, offset, tag_ids, visited)
+        offset = next_offset
+
+    return removed
+
+
+def scrub_jpeg_exif(data, tag_ids):
+    """
+    Remove selected EXIF tags from a JPEG without touching its pixel data.
+
+    The first EXIF APP1 segment is rewritten in place and spliced back into
+    the file unchanged in size; any further EXIF APP1 segments are dropped. XMP packets repeat GPS, dates and device details in
+    free-form XML that cannot be edited tag by tag, so they are dropped, as are
+    MPF secondary images with their own EXIF. All other segments and the scan
+    data are copied byte for byte.
+
+    Args:
+        data: JPEG file contents
+        tag_ids: Set of EXIF tag ids to remove
+
+    Returns:
+        tuple: (clean_bytes, removed_count)
+    """
+    pieces = []
+    removed = 0
+    scan_start = None
+    exif_done = False
+
+    for marker, start, end in iter_jpeg_segments(data):
+        payload_start = start + 4
+        if marker == APP1 and data[payload_start:payload_start + len(XMP_HEADER)] == XMP_HEADER:
+            logger.debug("Dropping XMP packet (%d bytes)", end - start)
+            continue
+        if is_mpf_segment(marker, data[payload_start:end]):
+            continue
+        if marker == APP1 and data[payload_start:payload_start + 6] == EXIF_HEADER:
+            if exif_done:
+                # Readers, Pillow included, ignore later EXIF segments, so they
+                # are neither shown nor verified; they must not survive either
+                logger.debug("Dropping extra EXIF segment (%d bytes)", end - start)
+                continue
+            segment = bytearray(data[start:end])
+            tiff = memoryview(segment)[4 + len(EXIF_HEADER):]
+            removed += scrub_tiff_tags(tiff, tag_ids)
+            tiff.release()
+            pieces.append(bytes(segment))
+            exif_done = True
+            continue
+        pieces.append(data[start:end])
+        if marker == SOS:
+            scan_start = end
+
+    if scan_start is None:
+        raise ValueError("JPEG has no image scan")
+
+    pieces.append(data[scan_start:find_jpeg_end(data, scan_start)])
+    return b''.join(pieces), removed
@@ -1,39 +1,171 @@
 import logging
+import os
+import struct
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 from PIL.TiffImagePlugin import IFDRational  # needed to check for IFDRational
+from services.metrics_service import time_stage
+from services.upload_service import open_source
 
 logger = logging.getLogger(__name__)
 
-def extract_metadata(filepath):
+# Container signatures recognised by the header-only reader
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_EXIF_PREFIX = b'Exif\x00\x00'
+
+# VP8X flag bit announcing an EXIF chunk
+_WEBP_EXIF_FLAG = 0x08
+
+def extract_metadata(source):
     """
     Extract EXIF metadata from an image using Pillow, converting non-JSON-serializable
     data types (bytes, IFDRational, etc.) to serializable forms.
+
+    Args:
+        source: Image as a path, bytes or seekable stream
     """
-    logger.info("Extracting EXIF metadata from file: %s", filepath)
+    logger.info("Extracting EXIF metadata from: %s", source if isinstance(source, str) else type(source).__name__)
 
     metadata = {}
     try:
-        with Image.open(filepath) as img:
-            exif_data = img._getexif()
-            if exif_data:
-                for tag, value in exif_data.items():
-                    tag_name = TAGS.get(tag, tag)
-                    if tag_name == "GPSInfo":
-                        # GPSInfo is a dict of sub-tags
-                        gps_data = {}
-                        for gps_tag, gps_value in value.items():
-                            sub_tag_name = GPSTAGS.get(gps_tag, gps_tag)
-                            gps_data[sub_tag_name] = _safe_convert(gps_value)
-                        metadata["GPSInfo"] = gps_data
-                    else:
-                        metadata[tag_name] = _safe_convert(value)
+        with time_stage('extract_metadata'), open_source(source) as f:
+            metadata = extract_metadata_from_stream(f)
     except Exception as e:
         logger.error("Error extracting metadata: %s", e)
 
     logger.info("Metadata extraction complete. Number of tags: %d", len(metadata))
     return metadata
 
+def extract_metadata_from_stream(stream):
+    """
+    Extract EXIF metadata by reading only the container header.
+
+    JPEG, PNG and WebP are parsed segment by segment and reading stops at the
+    first scan or image-data chunk, so cost does not grow with file size.
+    Other formats fall back to Pillow, which opens them lazily.
+
+    Returns:
+        dict: Same JSON-safe structure as extract_metadata
+    """
+    start = stream.tell()
+    head = stream.read(12)
+    stream.seek(start)
+
+    if head[:3] == b'\xff\xd8\xff':
+        exif_block = _read_jpeg_exif(stream)
+    elif head[:8] == _PNG_SIGNATURE:
+        exif_block = _read_png_exif(stream)
+    elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        exif_block = _read_webp_exif(stream)
+    else:
+        with Image.open(stream) as img:
+            # Only a few plugins implement _getexif; getexif works for all of them
+            return _exif_to_metadata(img.getexif()._get_merged_dict())
+
+    if not exif_block:
+        return {}
+
+    exif = Image.Exif()
+    exif.load(exif_block)
+    # Same flattening as JpegImageFile._getexif: IFD0 + Exif IFD, GPS as a nested dict
+    return _exif_to_metadata(exif._get_merged_dict())
+
+def _exif_to_metadata(exif_data):
+    metadata = {}
+    if exif_data:
+        for tag, value in exif_data.items():
+            tag_name = TAGS.get(tag, tag)
+            if tag_name == "GPSInfo":
+                # GPSInfo is a dict of sub-tags
+                gps_data = {}
+                for gps_tag, gps_value in value.items():
+                    sub_tag_name = GPSTAGS.get(gps_tag, gps_tag)
+                    gps_data[sub_tag_name] = _safe_convert(gps_value)
+                metadata["GPSInfo"] = gps_data
+            else:
+                metadata[tag_name] = _safe_convert(value)
+    return metadata
+
+def _skip(stream, length):
+    stream.seek(length, os.SEEK_CUR)
+
+def _read_jpeg_exif(stream):
+    """
+    Return the first EXIF APP1 payload, stopping at the first SOS.
+
+    Like Pillow, later EXIF APP1 segments are ignored. A header that is
+    truncated or malformed before the EXIF segment yields None.
+    """
+    stream.read(2)  # SOI
+    try:
+        while True:
+            byte = stream.read(1)
+            if not byte:
+                return None
+            if byte != b'\xff':
+                raise ValueError("Malformed JPEG marker")
+            marker = stream.read(1)
+            while marker == b'\xff':
+                marker = stream.read(1)
+            if not marker or marker in (b'\xda', b'\xd9'):
+                # Start of scan or end of image: no metadata past this point
+                return None
+            if b'\xd0' <= marker <= b'\xd7' or marker == b'\x01':
+                continue
+            length = struct.unpack('>H', stream.read(2))[0] - 2
+            if marker == b'\xe1' and length >= 6:
+                payload = stream.read(length)
+                if payload.startswith(_EXIF_PREFIX):
+                    return payload
+            else:
+                _skip(stream, length)
+    except (struct.error, ValueError) as e:
+        logger.debug("Stopped reading a malformed JPEG header: %s", e)
+        return None
+
+def _read_png_exif(stream):
+    """Return the eXIf chunk, stopping at the first IDAT."""
+    stream.read(8)  # signature
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        if chunk_type == b'eXIf':
+            return stream.read(length)
+        _skip(stream, length + 4)  # data + CRC
+
+def _read_webp_exif(stream):
+    """
+    Return the EXIF chunk of a WebP.
+
+    The format places EXIF after the image data, so image chunks are seeked
+    over rather than read. Files without a VP8X header cannot carry EXIF.
+    """
+    stream.read(12)  # RIFF header
+    extended = False
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return None
+        chunk_type, length = struct.unpack('<4sI', header)
+        padded = length + (length & 1)
+        if chunk_type == b'VP8X':
+            flags = stream.read(1)
+            if not flags or not flags[0] & _WEBP_EXIF_FLAG:
+                return None
+            extended = True
+            _skip(stream, padded - 1)
+        elif chunk_type == b'EXIF':
+            return stream.read(length)
+        elif chunk_type in (b'VP8 ', b'VP8L') and not extended:
+            # Simple format: a lone image chunk and nothing else
+            return None
+        else:
+            _skip(stream, padded)
+
 def _safe_convert(value):
     """
     Convert non-JSON-serializable data (like IFDRational, bytes) to a serializable form.
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_STORE_PATH, JOB_QUEUE_CONCURRENCY, JOB_QUEUE_MAX_PENDING, JOB_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle; the last two are final
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+FINAL_STATUSES = ('succeeded', 'failed')
+
+# How often (seconds) a process sweeps expired jobs while writing
+_PURGE_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    op TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    kind TEXT,
+    blob BLOB,
+    meta TEXT,
+    mimetype TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when a queue already has JOB_QUEUE_MAX_PENDING jobs waiting or running."""
+
+
+class JobStore:
+    """
+    Job status and results in SQLite, so any worker can answer a poll.
+
+    Results are either JSON (stored in meta) or bytes with a MIME type, such
+    as a filtered image. Finished jobs are deleted after ttl_seconds.
+    """
+
+    def __init__(self, path, ttl_seconds):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+    def _connect(self):
+        # One connection per thread and per process (connections do not survive fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job_id, queue, op):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT INTO jobs (id, queue, op, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                     (job_id, queue, op, now))
+        if now - self._last_purge > _PURGE_INTERVAL:
+            self._last_purge = now
+            # Also clears jobs orphaned by a worker that died mid-run
+            conn.execute("DELETE FROM jobs WHERE created < ?", (now - self.ttl_seconds,))
+
+    def mark_running(self, job_id):
+        self._connect().execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                                (time.time(), job_id))
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Record the outcome. result is a JSON-serializable value or a (bytes, mimetype) pair."""
+        if isinstance(result, tuple):
+            kind, blob, meta, mimetype = 'bytes', result[0], None, result[1]
+        elif result is not None:
+            kind, blob, meta, mimetype = 'json', None, json.dumps(result), 'application/json'
+        else:
+            kind = blob = meta = mimetype = None
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished = ?, error = ?, kind = ?, blob = ?, meta = ?, mimetype = ? "
+            "WHERE id = ?",
+            (status, time.time(), error, kind, blob, meta, mimetype, job_id),
+        )
+
+    def get(self, job_id):
+        """Return the job's status fields (without any bytes result), or None."""
+        row = self._connect().execute(
+            "SELECT id, queue, op, status, created, started, finished, error, kind, meta FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(('id', 'queue', 'op', 'status', 'created', 'started', 'finished', 'error'), row[:8]))
+        job['result_type'] = row[8]
+        if row[8] == 'json':
+            job['result'] = json.loads(row[9])
+        return job
+
+    def get_result(self, job_id):
+        """Return (kind, value, mimetype) for a finished job, or None."""
+        row = self._connect().execute("SELECT kind, blob, meta, mimetype FROM jobs WHERE id = ?",
+                                      (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        kind, blob, meta, mimetype = row
+        return kind, (bytes(blob) if kind == 'bytes' else json.loads(meta)), mimetype
+
+    def counts(self):
+        """Number of stored jobs per queue and status."""
+        counts = {}
+        for queue, status, count in self._connect().execute(
+                "SELECT queue, status, COUNT(*) FROM jobs GROUP BY queue, status"):
+            counts.setdefault(queue, {})[status] = count
+        return counts
+
+
+class JobQueue:
+    """Bounded thread pool for one kind of slow work, with a cap on waiting jobs."""
+
+    def __init__(self, name, concurrency, max_pending, store):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"job-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, op, fn, *args):
+        """
+        Queue fn(*args) and return the new job id.
+
+        fn returns a JSON-serializable value or a (bytes, mimetype) pair. A
+        dict with 'success': False marks the job failed but is still stored,
+        so partial results stay available.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"Queue '{self.name}' is full")
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, self.name, op)
+            self._executor.submit(self._run, job_id, op, fn, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        logger.info("Queued %s job %s on %s", op, job_id, self.name)
+        return job_id
+
+    def _run(self, job_id, op, fn, args):
+        try:
+            self.store.mark_running(job_id)
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                logger.error(f"Job {job_id} ({op}) failed: {str(e)}")
+                self.store.finish(job_id, 'failed', error=str(e))
+                return
+
+            if isinstance(result, dict) and result.get('success') is False:
+                errors = result.get('errors') or [result.get('error', 'Unknown error')]
+                self.store.finish(job_id, 'failed', result, '; '.join(errors))
+            else:
+                self.store.finish(job_id, 'succeeded', result)
+            logger.info("Job %s (%s) finished in %.2fs", job_id, op, time.perf_counter() - start)
+        except sqlite3.Error as e:
+            logger.error(f"Job store write failed for {job_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'concurrency': self.concurrency, 'max_pending': self.max_pending, 'pending': self._pending}
+
+
+job_store = JobStore(JOB_STORE_PATH, JOB_TTL_SECONDS)
+job_queues = {name: JobQueue(name, concurrency, JOB_QUEUE_MAX_PENDING, job_store)
+              for name, concurrency in JOB_QUEUE_CONCURRENCY.items()}
+
+
+def submit_job(queue, op, fn, *args):
+    """Run fn(*args) on the named queue; see JobQueue.submit."""
+    return job_queues[queue].submit(op, fn, *args)
@@ -0,0 +1,142 @@
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# JPEG markers
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+APP1 = 0xE1
+APP2 = 0xE2
+APP13 = 0xED
+COM = 0xFE
+
+# Markers that stand alone without a length field (TEM, RST0-RST7, SOI, EOI)
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8), SOI, EOI}
+
+# Segments dropped by a full metadata strip: EXIF/XMP, IPTC/Photoshop and comments
+METADATA_MARKERS = {APP1, APP13, COM}
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+
+def is_jpeg(data):
+    """Return True if the given bytes start with a JPEG SOI marker."""
+    return data[:3] == JPEG_MAGIC
+
+
+def iter_jpeg_segments(data):
+    """
+    Walk the marker segments of a JPEG up to and including the first SOS.
+
+    Args:
+        data: JPEG file contents
+
+    Yields:
+        tuple: (marker, start, end) where data[start:end] is the complete segment,
+        including the 0xFF marker prefix and the length field. The last segment
+        yielded is the SOS header; everything after its end is scan data.
+    """
+    if not is_jpeg(data):
+        raise ValueError("Not a JPEG file")
+
+    yield SOI, 0, 2
+    pos = 2
+    size = len(data)
+
+    while pos < size:
+        if data[pos] != 0xFF:
+            raise ValueError(f"Expected marker at offset {pos}")
+
+        # Skip fill bytes (any number of 0xFF may precede a marker)
+        start = pos
+        while pos < size and data[pos] == 0xFF:
+            pos += 1
+        if pos >= size:
+            break
+
+        marker = data[pos]
+        pos += 1
+
+        if marker in STANDALONE_MARKERS:
+            yield marker, start, pos
+            if marker == EOI:
+                return
+            continue
+
+        if pos + 2 > size:
+            raise ValueError("Truncated JPEG segment header")
+        (length,) = struct.unpack('>H', data[pos:pos + 2])
+        end = pos + length
+        if length < 2 or end > size:
+            raise ValueError(f"Invalid length for marker 0x{marker:02X}")
+
+        yield marker, start, end
+        pos = end
+
+        if marker == SOS:
+            return
+
+
+def find_jpeg_end(data, scan_start):
+    """
+    Find the end of the primary image (just past its EOI marker).
+
+    Entropy-coded data stuffs every literal 0xFF with 0x00, so the first FFD9
+    after the first scan is the EOI of the primary image. Anything after it is
+    a trailer (MPF secondary images, vendor blobs) that can carry its own EXIF.
+    """
+    eoi = data.find(b'\xff\xd9', scan_start)
+    if eoi == -1:
+        return len(data)
+    return eoi + 2
+
+
+def is_mpf_segment(marker, payload):
+    """APP2 is shared by ICC profiles and MPF indexes of the trailing images we cut off."""
+    return marker == APP2 and payload[:4] == b'MPF\x00'
+
+
+def _is_dropped_segment(marker, payload, drop_markers):
+    return marker in drop_markers or is_mpf_segment(marker, payload)
+
+
+def strip_jpeg_metadata(data, drop_markers=METADATA_MARKERS):
+    """
+    Remove metadata segments from a JPEG without decoding the image.
+
+    APP1 (EXIF/XMP), APP13 (IPTC) and COM segments are dropped along with any
+    MPF index and trailing data after the primary image. All other header
+    segments (JFIF, ICC profile, Adobe, quantization and Huffman tables) and
+    the entropy-coded scan data are copied byte for byte, so there is no
+    generational quality loss.
+
+    Args:
+        data: JPEG file contents
+        drop_markers: Set of marker codes to remove
+
+    Returns:
+        tuple: (clean_bytes, removed_count)
+    """
+    pieces = []
+    removed = 0
+    scan_start = None
+
+    for marker, start, end in iter_jpeg_segments(data):
+        if marker not in STANDALONE_MARKERS and _is_dropped_segment(marker, data[start + 4:end], drop_markers):
+            removed += 1
+            logger.debug("Dropping JPEG segment 0x%02X (%d bytes)", marker, end - start)
+            continue
+        pieces.append(data[start:end])
+        if marker == SOS:
+            scan_start = end
+        elif marker == EOI:
+            break
+
+    if scan_start is None:
+        raise ValueError("JPEG has no image scan")
+
+    pieces.append(data[scan_start:find_jpeg_end(data, scan_start)])
+    return b''.join(pieces), removed
+
@@ -0,0 +1,420 @@
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+from services.upload_service import read_source, write_output
+
+logger = logging.getLogger(__name__)
+
+# Text removal engines: 'remote' calls the Segmind workflow, 'local' runs
+# detection and inpainting with OpenCV on this machine
+TEXT_REMOVAL_ENGINES = ('remote', 'local')
+DEFAULT_TEXT_REMOVAL_ENGINE = os.getenv("PRIVACY_FILTER_ENGINE", "remote")
+
+# What the local engine does with detected text: fill it in from the
+# surrounding pixels, or blur the region
+TEXT_ACTIONS = ('inpaint', 'blur')
+
+# What local redaction can find, and how it hides what it found
+REDACTION_TARGETS = ('faces', 'plates')
+REDACTION_STYLES = ('blur', 'pixelate')
+
+# Most images accepted by one redaction request
+REDACTION_BATCH_LIMIT = int(os.getenv("REDACTION_BATCH_LIMIT", 32))
+
+# Haar cascades shipped with opencv-python-headless, per redaction target
+_CASCADE_FILES = {
+    'faces': ('haarcascade_frontalface_default.xml', 'haarcascade_profileface.xml'),
+    'plates': ('haarcascade_russian_plate_number.xml',),
+}
+
+# Cascades trained on one facing direction only; they also run on the
+# mirrored image to find faces turned the other way
+_ONE_SIDED_CASCADES = {'haarcascade_profileface.xml'}
+
+# Text is detected on a copy scaled down to this long side, faces and
+# plates on a smaller one; regions are mapped back and cleaned at full
+# resolution
+DETECTION_MAX_SIDE = 1600
+REDACTION_DETECTION_MAX_SIDE = 1280
+
+# Output formats cv2.imencode writes for us, keyed by container format
+_ENCODE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+_ENCODE_PARAMS = {
+    'JPEG': [cv2.IMWRITE_JPEG_QUALITY, 95],
+    'PNG': [cv2.IMWRITE_PNG_COMPRESSION, 3],
+    'WEBP': [cv2.IMWRITE_WEBP_QUALITY, 95],
+}
+
+# EXIF orientation -> transform that displays the stored pixels upright.
+# IMREAD_COLOR applies it while decoding, IMREAD_UNCHANGED does not
+_ORIENTATIONS = {
+    2: lambda a: cv2.flip(a, 1),
+    3: lambda a: cv2.rotate(a, cv2.ROTATE_180),
+    4: lambda a: cv2.flip(a, 0),
+    5: cv2.transpose,
+    6: lambda a: cv2.rotate(a, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda a: cv2.flip(cv2.rotate(a, cv2.ROTATE_90_CLOCKWISE), 0),
+    8: lambda a: cv2.rotate(a, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+# Minimum gradient for a pixel to count as a glyph edge, so sensor noise in
+# flat areas never reaches the Otsu threshold
+_MIN_EDGE_STRENGTH = 48
+
+
+def decode_image(data):
+    """
+    Decode image bytes to a BGR array.
+
+    OpenCV applies the EXIF orientation while decoding, and nothing from the
+    original metadata survives into the array.
+
+    Returns:
+        tuple: (bgr_array, format) where format is the container format the
+        result should be written back as
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format if img.format in _ENCODE_EXTENSIONS else 'JPEG'
+    bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError("Could not decode image")
+    return bgr, fmt
+
+
+def decode_image_with_alpha(data):
+    """
+    Like decode_image, but keep transparency.
+
+    Returns:
+        tuple: (bgr_array, alpha, format) where alpha is the 8-bit alpha
+        channel, or None if the image has none or is written back as JPEG
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format if img.format in _ENCODE_EXTENSIONS else 'JPEG'
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        orientation = img.getexif().get(0x0112, 1)
+    if not has_alpha or fmt == 'JPEG':
+        bgr, fmt = decode_image(data)
+        return bgr, None, fmt
+
+    # Grey + alpha and palette transparency also come back as BGRA
+    pixels = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if pixels is None or pixels.ndim != 3 or pixels.shape[2] != 4:
+        bgr, fmt = decode_image(data)
+        return bgr, None, fmt
+    if pixels.dtype == np.uint16:
+        pixels = (pixels >> 8).astype(np.uint8)
+    if orientation in _ORIENTATIONS:
+        pixels = _ORIENTATIONS[orientation](pixels)
+    return np.ascontiguousarray(pixels[:, :, :3]), np.ascontiguousarray(pixels[:, :, 3]), fmt
+
+
+def encode_image(bgr, fmt, alpha=None):
+    """Encode a BGR array in the given container format, with alpha as its transparency if given."""
+    if alpha is not None:
+        bgr = np.dstack((bgr, alpha))
+    ok, buf = cv2.imencode(_ENCODE_EXTENSIONS[fmt], bgr, _ENCODE_PARAMS[fmt])
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    return buf.tobytes()
+
+
+# Inpainting runs on text boxes scaled down to about this height; the fill is
+# smooth anyway and Telea's cost grows with the masked area
+_INPAINT_BOX_HEIGHT = 24
+
+
+# CascadeClassifier keeps scratch buffers, so each thread loads its own
+_cascades = threading.local()
+
+# OpenCV releases the GIL, so a batch is spread over threads
+_redaction_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="redact")
+
+
+def _detection_copy(bgr, max_side=DETECTION_MAX_SIDE):
+    """Return (gray, scale): a grayscale copy whose long side is at most max_side."""
+    height, width = bgr.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    small = bgr if scale == 1.0 else cv2.resize(bgr, (round(width * scale), round(height * scale)),
+                                               interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), scale
+
+
+def _edge_mask(gray):
+    """Binary mask of strong edges, the outline of glyph strokes."""
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    otsu, _ = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    _, mask = cv2.threshold(gradient, max(otsu, _MIN_EDGE_STRENGTH), 255, cv2.THRESH_BINARY)
+    return mask
+
+
+def detect_text_regions(bgr, threshold=0.7):
+    """
+    Find regions of an image that look like lines of text.
+
+    Strong edges are joined horizontally into candidate words. Each candidate
+    is scored from how densely it is filled and how many glyph-sized strokes
+    it contains; lines of characters score close to 1, isolated edges such
+    as object outlines score low.
+
+    Args:
+        bgr: Image as a BGR array
+        threshold: Minimum score (0-1) for a region to be treated as text
+
+    Returns:
+        list: (x, y, w, h, score) tuples in full-resolution pixels
+    """
+    gray, scale = _detection_copy(bgr)
+    edges = _edge_mask(gray)
+
+    # Join the glyphs of a word into one component
+    join_width = max(9, gray.shape[1] // 100)
+    words = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (join_width, 3)))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(words, connectivity=8)
+
+    regions = []
+    for x, y, w, h, area in stats[1:count]:
+        if h < 8 or w < h or h > gray.shape[0] // 4:
+            continue
+        _, _, strokes, _ = cv2.connectedComponentsWithStats(edges[y:y + h, x:x + w], connectivity=8)
+        glyphs = np.count_nonzero((strokes[1:, cv2.CC_STAT_HEIGHT] >= 0.4 * h) &
+                                  (strokes[1:, cv2.CC_STAT_WIDTH] <= 1.5 * h))
+        score = 0.5 * min(1.0, area / (w * h) / 0.6) + 0.5 * min(1.0, glyphs / 4)
+        if score < threshold:
+            continue
+        regions.append((int(x / scale), int(y / scale), int(np.ceil(w / scale)), int(np.ceil(h / scale)),
+                        round(float(score), 3)))
+
+    return regions
+
+
+def _padded(region, shape, pad_ratio=0.15):
+    x, y, w, h = region[:4]
+    pad = max(2, int(h * pad_ratio))
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(shape[1], x + w + pad), min(shape[0], y + h + pad)
+    return x0, y0, x1, y1
+
+
+def _inpaint_box(roi, box):
+    """Fill box (x, y, w, h, relative to roi) from the surrounding ring of roi."""
+    x, y, w, h = box
+    scale = min(1.0, _INPAINT_BOX_HEIGHT / h)
+    small = roi if scale == 1.0 else cv2.resize(roi, (max(1, round(roi.shape[1] * scale)),
+                                                      max(1, round(roi.shape[0] * scale))),
+                                               interpolation=cv2.INTER_AREA)
+    mask = np.zeros(small.shape[:2], np.uint8)
+    mask[int(y * scale):int(np.ceil((y + h) * scale)), int(x * scale):int(np.ceil((x + w) * scale))] = 255
+    filled = cv2.inpaint(small, mask, 3, cv2.INPAINT_TELEA)
+    if scale != 1.0:
+        filled = cv2.resize(filled, (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_LINEAR)
+    roi[y:y + h, x:x + w] = filled[y:y + h, x:x + w]
+
+
+def clean_text_regions(bgr, regions, action='inpaint'):
+    """
+    Remove text from the given regions of bgr, in place.
+
+    Only the padded region boxes are touched, so the cost follows the text
+    area rather than the frame. Inpainting fills each text box from the ring
+    of padding around it.
+    """
+    for region in regions:
+        x0, y0, x1, y1 = _padded(region, bgr.shape)
+        roi = bgr[y0:y1, x0:x1]
+        if action == 'blur':
+            # Stack blur costs the same per pixel whatever the kernel size
+            kernel = max(3, (y1 - y0) // 2) | 1
+            roi[:] = cv2.stackBlur(roi, (kernel, kernel))
+        else:
+            x, y, w, h = region[:4]
+            _inpaint_box(roi, (x - x0, y - y0, w, h))
+    return bgr
+
+
+def remove_text_locally(source, output, threshold=0.7, action='inpaint'):
+    """
+    Detect and remove text from an image without calling a remote API.
+
+    The output keeps the input's container format (JPEG, PNG or WebP; others
+    become JPEG) and its transparency, and carries no metadata. Detection
+    and inpainting see only the colour channels.
+
+    Args:
+        source: Input image as a path, bytes or seekable stream
+        output: Path or writable stream to save the processed image to
+        threshold: Minimum text score (0-1) for a region to be removed
+        action: One of TEXT_ACTIONS
+    """
+    try:
+        bgr, alpha, fmt = decode_image_with_alpha(read_source(source))
+        regions = detect_text_regions(bgr, threshold)
+        clean_text_regions(bgr, regions, action)
+        write_output(output, encode_image(bgr, fmt, alpha))
+
+        logger.info("Local text removal completed. Cleaned %d regions (%s)", len(regions), action)
+        return True
+
+    except Exception as e:
+        logger.error(f"Local text removal failed: {str(e)}")
+        return False
+
+
+def _get_cascades(target):
+    loaded = getattr(_cascades, 'by_target', None)
+    if loaded is None:
+        loaded = _cascades.by_target = {}
+    if target not in loaded:
+        classifiers = []
+        for filename in _CASCADE_FILES[target]:
+            classifier = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, filename))
+            if classifier.empty():
+                raise RuntimeError(f"Could not load cascade {filename}")
+            classifiers.append((classifier, filename in _ONE_SIDED_CASCADES))
+        loaded[target] = classifiers
+    return loaded[target]
+
+
+def _drop_duplicates(boxes):
+    """Drop boxes that mostly overlap a larger one (frontal and profile hits on one face)."""
+    kept = []
+    for x, y, w, h in sorted(boxes, key=lambda box: box[2] * box[3], reverse=True):
+        overlaps = (max(0, min(x + w, kx + kw) - max(x, kx)) * max(0, min(y + h, ky + kh) - max(y, ky))
+                    for kx, ky, kw, kh in kept)
+        if all(overlap < 0.5 * w * h for overlap in overlaps):
+            kept.append((x, y, w, h))
+    return kept
+
+
+def _detect(classifier, gray):
+    detections = classifier.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=5, minSize=(20, 20))
+    return detections.tolist() if len(detections) else []
+
+
+def detect_redaction_regions(bgr, targets=REDACTION_TARGETS):
+    """
+    Find faces and licence plates with the Haar cascades bundled with OpenCV.
+
+    Args:
+        bgr: Image as a BGR array
+        targets: Subset of REDACTION_TARGETS to look for
+
+    Returns:
+        dict: Target name -> list of (x, y, w, h) in full-resolution pixels
+    """
+    gray, scale = _detection_copy(bgr, REDACTION_DETECTION_MAX_SIDE)
+    gray = cv2.equalizeHist(gray)
+
+    mirrored = None
+    found = {}
+    for target in targets:
+        boxes = []
+        for classifier, one_sided in _get_cascades(target):
+            boxes.extend(_detect(classifier, gray))
+            if one_sided:
+                if mirrored is None:
+                    mirrored = cv2.flip(gray, 1)
+                width = gray.shape[1]
+                boxes.extend((width - x - w, y, w, h) for x, y, w, h in _detect(classifier, mirrored))
+        found[target] = [(int(x / scale), int(y / scale), int(np.ceil(w / scale)), int(np.ceil(h / scale)))
+                         for x, y, w, h in _drop_duplicates(boxes)]
+    return found
+
+
+def redact_regions(bgr, boxes, style='blur'):
+    """
+    Blur or pixelate the given boxes of bgr, in place.
+
+    Each box is processed as one array operation on its own slice, so the
+    rest of the frame is never touched or copied.
+    """
+    for box in boxes:
+        x0, y0, x1, y1 = _padded(box, bgr.shape)
+        roi = bgr[y0:y1, x0:x1]
+        if roi.size == 0:
+            continue
+        if style == 'pixelate':
+            # About 8 blocks across the short side of the region
+            block = max(1, min(roi.shape[:2]) // 8)
+            small = cv2.resize(roi, (max(1, roi.shape[1] // block), max(1, roi.shape[0] // block)),
+                               interpolation=cv2.INTER_AREA)
+            roi[:] = cv2.resize(small, (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_NEAREST)
+        else:
+            kernel = max(3, min(roi.shape[:2]) // 3) | 1
+            roi[:] = cv2.stackBlur(roi, (kernel, kernel))
+    return bgr
+
+
+def redact_image(data, targets=REDACTION_TARGETS, style='blur'):
+    """
+    Blur faces and licence plates in one image, timing each stage.
+
+    Transparency is kept: only the colour channels are redacted, and pixels
+    hidden under full transparency stay hidden.
+
+    Args:
+        data: Image file contents
+        targets: Subset of REDACTION_TARGETS to redact
+        style: One of REDACTION_STYLES
+
+    Returns:
+        tuple: (image_bytes, report) where report has 'format', 'mimetype',
+        per-target 'regions' counts and 'timings_ms' for the decode, detect,
+        blur and encode stages
+    """
+    timings = {}
+    start = time.perf_counter()
+    bgr, alpha, fmt = decode_image_with_alpha(data)
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = detect_redaction_regions(bgr, targets)
+    timings['detect'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for boxes in found.values():
+        redact_regions(bgr, boxes, style)
+    timings['blur'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = encode_image(bgr, fmt, alpha)
+    timings['encode'] = time.perf_counter() - start
+
+    report = {
+        'format': fmt,
+        'mimetype': Image.MIME[fmt],
+        'regions': {target: len(boxes) for target, boxes in found.items()},
+        'timings_ms': {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()},
+    }
+    logger.info("Local redaction completed. Regions %s, timings %s", report['regions'], report['timings_ms'])
+    return encoded, report
+
+
+def redact_batch(images, targets=REDACTION_TARGETS, style='blur'):
+    """
+    Redact several images concurrently.
+
+    Args:
+        images: List of image file contents
+        targets: Subset of REDACTION_TARGETS to redact
+        style: One of REDACTION_STYLES
+
+    Returns:
+        list: (image_bytes, report) per input, in order, or None where that
+        image failed
+    """
+    def run(data):
+        try:
+            return redact_image(data, targets, style)
+        except Exception as e:
+            logger.error(f"Local redaction failed: {str(e)}")
+            return None
+
+    return list(_redaction_executor.map(run, images))
@@ -0,0 +1,177 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import traceback
+import uuid
+from datetime import datetime, timezone
+from config import (LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_MAX_LEVEL,
+                    LOG_SAMPLE_RATE)
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {
+    'message', 'asctime', 'request_id', 'taskName'}
+
+# (request id, sampled) of the request being handled in this thread or task
+_request_context = contextvars.ContextVar('log_request_context', default=(None, True))
+
+_listener = None
+_handler = None
+_configure_lock = threading.Lock()
+
+
+class LazyJson:
+    """
+    Log argument that is serialised only if the record is emitted:
+
+        logger.debug("Raw metadata input: %s", LazyJson(metadata))
+    """
+    __slots__ = ('value', 'indent')
+
+    def __init__(self, value, indent=None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+
+def start_request_logging(request_id=None):
+    """
+    Tag records logged while handling this request with its id, and decide
+    once whether its verbose records are kept (LOG_SAMPLE_RATE), so sampled
+    requests are logged completely rather than line by line.
+
+    Returns:
+        str: The request id, generated when none was given
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    sampled = LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+    _request_context.set((request_id, sampled))
+    return request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request id and drop verbose records of unsampled requests."""
+
+    def __init__(self, max_sampled_level=logging.INFO):
+        super().__init__()
+        self.max_sampled_level = max_sampled_level
+
+    def filter(self, record):
+        request_id, sampled = _request_context.get()
+        if not sampled and record.levelno <= self.max_sampled_level:
+            return False
+        record.request_id = request_id
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the listener thread without waiting on it.
+
+    Only the message is interpolated here, so arguments are captured as they
+    are now; turning the record into a JSON line and writing it happen on
+    the listener thread. When the queue is full the record is dropped and
+    counted rather than blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames that may change once the caller moves on
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request id and extra= fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _output_handlers(fmt, log_file):
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, log_file=LOG_FILE):
+    """
+    Route the root logger through a queue to a background writer thread.
+
+    Replaces any handlers already on the root logger. Safe to call more than
+    once; only the first call takes effect.
+
+    Args:
+        level: Root logger level name, e.g. 'INFO'
+        fmt: 'json' for JSON lines, 'text' for the human-readable format
+        log_file: Also append records to this file, or None for stderr only
+    """
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = NonBlockingQueueHandler(log_queue)
+        _handler.addFilter(RequestContextFilter(logging.getLevelName(LOG_SAMPLE_MAX_LEVEL)))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *_output_handlers(fmt, log_file),
+                                                   respect_handler_level=True)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(_listener.stop)
+
+
+def logging_stats():
+    """Queue depth and records dropped because the queue was full."""
+    if _handler is None:
+        return {'configured': False, 'queued': 0, 'dropped': 0}
+    return {'configured': True, 'queued': _handler.queue.qsize(), 'dropped': _handler.dropped}
@@ -1,160 +1,307 @@
+import io
 import logging
-import os
 from PIL import Image, ImageOps
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.ExifTags import TAGS, GPSTAGS, IFD
+from config import ENCODER_PROFILE
+from services.jpeg_segment_service import is_jpeg, strip_jpeg_metadata
+from services.exif_ifd_service import tag_ids_for_names, scrub_jpeg_exif
+from services.exif_service import extract_metadata_from_stream
+from services.metrics_service import time_stage
+from services.upload_service import open_source, read_source, write_output
 
 logger = logging.getLogger(__name__)
 
-def remove_metadata_from_image(input_path, output_path):
+# Removal methods: 'lossless' rewrites JPEG marker segments without decoding,
+# 'reencode' decodes and saves a fresh copy, 'auto' picks lossless for JPEG input
+REMOVAL_METHODS = ('auto', 'lossless', 'reencode')
+
+# Removed by selective removal when the caller does not name any types
+DEFAULT_SENSITIVE_TYPES = ['GPSInfo', 'DateTime', 'DateTimeOriginal', 'Make', 'Model', 'Software']
+
+# Modes each output format stores natively, so no conversion is needed
+_NATIVE_MODES = {
+    'JPEG': ('RGB', 'L', 'CMYK'),
+    'PNG': ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA'),
+    'WEBP': ('RGB', 'RGBA'),
+}
+
+# Save options per encoder profile and output format. Quality is the same in
+# every profile; they only trade encode time against output size.
+# 'balanced' skips PNG's exhaustive optimize pass, which is far slower than
+# zlib's default level for a few percent; 'smallest' adds it back along
+# with progressive JPEG and WebP's slowest method.
+ENCODER_PROFILES = {
+    'fast': {
+        'JPEG': {'quality': 95, 'subsampling': '4:2:0', 'optimize': False},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'quality': 95, 'method': 0},
+    },
+    'balanced': {
+        'JPEG': {'quality': 95, 'subsampling': '4:2:0', 'optimize': True},
+        'PNG': {'compress_level': 6},
+        'WEBP': {'quality': 95, 'method': 4},
+    },
+    'smallest': {
+        'JPEG': {'quality': 95, 'subsampling': '4:2:0', 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': 95, 'method': 6},
+    },
+}
+
+# Image.MIME is only filled in once Pillow's plugins are loaded, which the
+# lossless path never triggers in a fresh worker process
+_MIMETYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+def _output_format(img):
+    # Keep the container format where we can write it; anything else becomes JPEG
+    return img.format if img.format in _NATIVE_MODES else 'JPEG'
+
+def _has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+def _convert_for_format(img, fmt):
+    """
+    Convert an image to a mode the output format can store.
+
+    Only JPEG is flattened onto a white background; PNG and WebP keep alpha.
+    Returns the image itself when it is already in a native mode.
+    """
+    if img.mode in _NATIVE_MODES[fmt]:
+        return img
+
+    if fmt == 'JPEG':
+        if _has_alpha(img):
+            # Create a white background for transparent images
+            rgba = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return img.convert('RGB')
+
+    return img.convert('RGBA' if _has_alpha(img) else 'RGB')
+
+def _detach_metadata(img, fmt):
+    """
+    Return a pixel-identical image that carries no metadata.
+
+    The decoded frame is reused rather than copied pixel by pixel: Pillow only
+    writes what is left in ``info`` (ICC, XMP, text chunks) or passed explicitly
+    at save time, so clearing ``info`` is enough to drop every block. Peak memory
+    stays at one decoded frame, or two when a mode conversion is required.
+    """
+    img.load()
+    clean_img = _convert_for_format(img, fmt)
+    # tRNS-style transparency (palette index or colour key) is pixel data, not metadata
+    transparency = clean_img.info.get('transparency') if clean_img.mode in ('P', 'L', 'RGB') else None
+    clean_img.info = {} if transparency is None else {'transparency': transparency}
+    return clean_img
+
+def _save_clean(clean_img, output, fmt, exif=None, profile=ENCODER_PROFILE):
+    params = dict(ENCODER_PROFILES[profile][fmt])
+    if exif is not None:
+        params['exif'] = exif
+    clean_img.save(output, fmt, **params)
+
+def _remove_exif_tags(exif, tag_ids):
+    """Delete tags from a Pillow Exif object, including its Exif and GPS sub-IFDs."""
+    removed = 0
+    for tag_id in tag_ids & set(exif.keys()):
+        # Deleting a pointer tag (GPSInfo, ExifOffset) drops its whole sub-IFD
+        del exif[tag_id]
+        removed += 1
+    for ifd_id in (IFD.Exif, IFD.GPSInfo):
+        if ifd_id in exif:
+            ifd = exif.get_ifd(ifd_id)
+            for tag_id in tag_ids & set(ifd.keys()):
+                del ifd[tag_id]
+                removed += 1
+    return removed
+
+def _strip_all(data, output, method, profile=ENCODER_PROFILE):
+    """Write data without any metadata to output. Returns the format written."""
+    if method != 'reencode' and is_jpeg(data):
+        try:
+            with time_stage('strip'):
+                clean, removed = strip_jpeg_metadata(data)
+            write_output(output, clean)
+            logger.info("Lossless metadata removal completed. Dropped %d segments (%d -> %d bytes)",
+                        removed, len(data), len(clean))
+            return 'JPEG'
+        except ValueError as e:
+            # Malformed segment structure; the decoder may still cope with it
+            logger.warning("Lossless removal failed (%s), falling back to re-encode", str(e))
+    elif method == 'lossless':
+        logger.warning("Lossless removal only supports JPEG input, falling back to re-encode")
+
+    with time_stage('encode'), Image.open(io.BytesIO(data)) as img:
+        fmt = _output_format(img)
+        _save_clean(_detach_metadata(img, fmt), output, fmt, profile=profile)
+
+    logger.info("Metadata removal completed. Clean %s image written (profile=%s)", fmt, profile)
+    return fmt
+
+def _strip_selected(data, output, metadata_types, profile=ENCODER_PROFILE):
+    """Write data without the given metadata types to output. Returns the format written."""
+    tag_ids = tag_ids_for_names(metadata_types)
+
+    if is_jpeg(data):
+        try:
+            # Rewrite the EXIF IFDs in place; pixel data is never decoded
+            with time_stage('strip'):
+                clean, removed_count = scrub_jpeg_exif(data, tag_ids)
+            write_output(output, clean)
+            logger.info("Selective metadata removal completed in place. Removed %d items.", removed_count)
+            return 'JPEG'
+        except ValueError as e:
+            logger.warning("In-place EXIF rewrite failed (%s), falling back to re-encode", str(e))
+
+    with time_stage('encode'), Image.open(io.BytesIO(data)) as img:
+        # Other containers are re-encoded with the filtered EXIF attached
+        exif = img.getexif()
+        removed_count = _remove_exif_tags(exif, tag_ids)
+
+        fmt = _output_format(img)
+        _save_clean(_detach_metadata(img, fmt), output, fmt, exif=exif if len(exif) else None, profile=profile)
+
+    logger.info("Selective metadata removal completed. Removed %d items, kept %d items.",
+               removed_count, len(exif))
+    return fmt
+
+def remove_metadata_from_image(source, output, method='auto', profile=ENCODER_PROFILE):
     """
     Remove all EXIF metadata from an image while preserving image quality.
     This function creates a clean copy of the image without any metadata.
+
+    Args:
+        source: Input image as a path, bytes or seekable stream
+        output: Path or writable stream to save the cleaned image to
+        method: One of REMOVAL_METHODS. JPEG input is stripped losslessly unless
+            'reencode' is requested; other formats are always re-encoded.
+        profile: One of ENCODER_PROFILES, used when the image is re-encoded
     """
-    logger.info("Starting metadata removal from: %s", input_path)
+    logger.info("Starting metadata removal (method=%s)", method)
     
     try:
-        # Open the original image
-        with Image.open(input_path) as img:
-            # Convert to RGB if necessary (for JPEG compatibility)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background for transparent images
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Create a new image without metadata
-            # This preserves the original image data but strips all EXIF
-            clean_img = Image.new(img.mode, img.size)
-            clean_img.putdata(list(img.getdata()))
-            
-            # Preserve original format and quality
-            format_extension = os.path.splitext(input_path)[1].lower()
-            
-            if format_extension in ['.jpg', '.jpeg']:
-                # Save as JPEG with high quality
-                clean_img.save(output_path, 'JPEG', quality=95, optimize=True)
-            elif format_extension == '.png':
-                # Save as PNG (lossless)
-                clean_img.save(output_path, 'PNG', optimize=True)
-            elif format_extension == '.webp':
-                # Save as WebP
-                clean_img.save(output_path, 'WEBP', quality=95)
-            else:
-                # Default to JPEG for other formats
-                clean_img.save(output_path, 'JPEG', quality=95, optimize=True)
-            
-            logger.info("Metadata removal completed. Clean image saved to: %s", output_path)
-            return True
+        _strip_all(read_source(source), output, method, profile)
+        return True
             
     except Exception as e:
         logger.error("Error removing metadata: %s", str(e))
         return False
 
-def remove_specific_metadata(input_path, output_path, metadata_types=None):
+def remove_specific_metadata(source, output, metadata_types=None, profile=ENCODER_PROFILE):
     """
     Remove specific types of metadata while keeping others.
     
     Args:
-        input_path: Path to input image
-        output_path: Path to save cleaned image
+        source: Input image as a path, bytes or seekable stream
+        output: Path or writable stream to save the cleaned image to
         metadata_types: List of metadata types to remove (e.g., ['GPSInfo', 'DateTime', 'Make', 'Model'])
+        profile: One of ENCODER_PROFILES, used when the image is re-encoded
     """
-    logger.info("Starting selective metadata removal from: %s", input_path)
+    logger.info("Starting selective metadata removal")
     
     if metadata_types is None:
-        metadata_types = ['GPSInfo', 'DateTime', 'DateTimeOriginal', 'Make', 'Model', 'Software']
+        metadata_types = DEFAULT_SENSITIVE_TYPES
     
     try:
-        with Image.open(input_path) as img:
-            # Get existing EXIF data
-            exif_data = img._getexif()
-            
-            if exif_data is None:
-                logger.info("No EXIF data found, copying image as-is")
-                img.save(output_path)
-                return True
-            
-            # Create a new image without any EXIF data first
-            # This ensures we start with a clean slate
-            clean_img = Image.new(img.mode, img.size)
-            clean_img.putdata(list(img.getdata()))
-            
-            # Now we'll selectively add back the metadata we want to keep
-            # This is more reliable than trying to remove specific tags
-            tags_to_keep = {}
-            removed_count = 0
-            
-            for tag_id, value in exif_data.items():
-                tag_name = TAGS.get(tag_id, str(tag_id))
-                
-                if tag_name not in metadata_types:
-                    # Keep this metadata
-                    tags_to_keep[tag_id] = value
-                else:
-                    # Remove this metadata
-                    removed_count += 1
-                    logger.debug("Removed metadata: %s", tag_name)
-            
-            # Save the image
-            # If we have metadata to keep, we'll need to handle it differently
-            # For now, we'll save without any EXIF to ensure clean removal
-            format_extension = os.path.splitext(input_path)[1].lower()
-            
-            if format_extension in ['.jpg', '.jpeg']:
-                clean_img.save(output_path, 'JPEG', quality=95, optimize=True)
-            elif format_extension == '.png':
-                clean_img.save(output_path, 'PNG', optimize=True)
-            elif format_extension == '.webp':
-                clean_img.save(output_path, 'WEBP', quality=95)
-            else:
-                clean_img.save(output_path, 'JPEG', quality=95, optimize=True)
-            
-            logger.info("Selective metadata removal completed. Removed %d items, kept %d items.", 
-                       removed_count, len(tags_to_keep))
-            
-            return True
+        _strip_selected(read_source(source), output, metadata_types, profile)
+        return True
             
     except Exception as e:
         logger.error("Error in selective metadata removal: %s", str(e))
         return False
 
-def verify_metadata_removal(image_path):
+def clean_image(source, method='auto', metadata_types=None, profile=ENCODER_PROFILE):
+    """
+    Clean an image in a single pass and verify the bytes that were produced.
+
+    The upload is read once; the original metadata count comes from the
+    header-only EXIF reader, and the verification report is derived from the
+    in-memory output rather than by reopening a file.
+
+    Args:
+        source: Input image as a path, bytes or seekable stream
+        method: One of REMOVAL_METHODS, used when removing all metadata
+        metadata_types: Metadata types to remove selectively, or None to remove everything
+        profile: One of ENCODER_PROFILES, used when the image is re-encoded
+
+    Returns:
+        tuple: (clean_bytes, report) where report contains 'format', 'mimetype',
+        'original_metadata_count' and 'verification', or None on failure
+    """
+    logger.info("Starting single-pass cleaning (method=%s, types=%s, profile=%s)", method, metadata_types, profile)
+
+    try:
+        data = read_source(source)
+        with time_stage('extract_metadata'):
+            original_metadata = extract_metadata_from_stream(io.BytesIO(data))
+
+        output = io.BytesIO()
+        if metadata_types is None:
+            fmt = _strip_all(data, output, method, profile)
+        else:
+            fmt = _strip_selected(data, output, metadata_types, profile)
+        clean = output.getvalue()
+
+        with time_stage('verify'):
+            remaining = extract_metadata_from_stream(io.BytesIO(clean))
+        return clean, {
+            'format': fmt,
+            'mimetype': _MIMETYPES[fmt],
+            'original_metadata_count': len(original_metadata),
+            'verification': _verification_report(remaining, metadata_types),
+        }
+
+    except Exception as e:
+        logger.error("Error cleaning image: %s", str(e))
+        return None
+
+def _verification_report(remaining, metadata_types=None):
+    """
+    Build the verification dict from the metadata found in a cleaned image.
+
+    With metadata_types set, success means none of those types survived;
+    other tags are expected to remain.
+    """
+    if not remaining:
+        return {
+            'success': True,
+            'message': 'No metadata found - removal successful',
+            'remaining_metadata': {},
+            'metadata_count': 0
+        }
+
+    # Convert to readable format
+    readable_metadata = {str(name): str(value)[:100] for name, value in remaining.items()}  # Truncate long values
+    if metadata_types is None:
+        leftover = list(readable_metadata)
+    else:
+        leftover = [name for name in metadata_types if name in readable_metadata]
+
+    return {
+        'success': len(leftover) == 0,
+        'message': f'Found {len(readable_metadata)} metadata items remaining',
+        'remaining_metadata': readable_metadata,
+        'metadata_count': len(readable_metadata)
+    }
+
+def verify_metadata_removal(source, metadata_types=None):
     """
     Verify that metadata has been successfully removed from an image.
+
+    Args:
+        source: Cleaned image as a path, bytes or seekable stream
+        metadata_types: Types that were removed selectively, or None if all metadata was removed
     
     Returns:
         dict: Contains verification results and any remaining metadata
     """
-    logger.info("Verifying metadata removal for: %s", image_path)
+    logger.info("Verifying metadata removal")
     
     try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            
-            if exif_data is None:
-                return {
-                    'success': True,
-                    'message': 'No metadata found - removal successful',
-                    'remaining_metadata': {},
-                    'metadata_count': 0
-                }
-            
-            # Convert to readable format
-            readable_metadata = {}
-            for tag_id, value in exif_data.items():
-                tag_name = TAGS.get(tag_id, str(tag_id))
-                readable_metadata[tag_name] = str(value)[:100]  # Truncate long values
-            
-            return {
-                'success': len(readable_metadata) == 0,
-                'message': f'Found {len(readable_metadata)} metadata items remaining',
-                'remaining_metadata': readable_metadata,
-                'metadata_count': len(readable_metadata)
-            }
+        with time_stage('verify'), open_source(source) as f:
+            return _verification_report(extract_metadata_from_stream(f), metadata_types)
             
     except Exception as e:
         logger.error("Error verifying metadata removal: %s", str(e))
@@ -163,4 +310,4 @@ def verify_metadata_removal(image_path):
             'message': f'Verification failed: {str(e)}',
             'remaining_metadata': {},
             'metadata_count': 0
-        } 
\ No newline at end of file
+        }
@@ -0,0 +1,228 @@
+import bisect
+import threading
+import time
+
+# Latency bucket upper bounds in seconds, shared by route and stage histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Pipeline stages timed by time_stage()
+STAGES = ('upload_parse', 'upload_save', 'extract_metadata', 'strip', 'encode', 'verify',
+          'upstream_prepare')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _Metric:
+    """
+    A labelled metric family.
+
+    Children are created once per label tuple and kept, so the hot path is
+    a dict lookup and an increment; label values are only turned into text
+    when the registry is rendered.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(child.value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            lines.extend(_histogram_lines(self.name, self.labelnames, values, self.buckets, counts, total))
+        return lines
+
+
+def _histogram_lines(name, labelnames, values, bounds, counts, total):
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*bounds, float('inf')), counts):
+        cumulative += count
+        le = f'le="{_number(bound)}"'
+        lines.append(f'{name}_bucket{_labels(labelnames, values, le)} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labelnames, values)} {_number(float(total))}')
+    lines.append(f'{name}_count{_labels(labelnames, values)} {cumulative}')
+    return lines
+
+
+class Collector:
+    """
+    Metrics computed at scrape time from a callback, for state other
+    services already track (cache sizes, queue depths, upstream counters).
+
+    The callback returns (name, kind, documentation, samples), where
+    samples is a list of (labels dict, value), or for a histogram of
+    (labels dict, bounds, bucket counts, sum).
+    """
+
+    def __init__(self, collect):
+        self.collect = collect
+
+    def render(self):
+        lines = []
+        for name, kind, documentation, samples in self.collect():
+            lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}'])
+            for sample in samples:
+                labels = sample[0]
+                if kind == 'histogram':
+                    _, bounds, counts, total = sample
+                    lines.extend(_histogram_lines(name, tuple(labels), tuple(labels.values()),
+                                                  bounds, counts, total))
+                else:
+                    lines.append(f'{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(sample[1])}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'privify_http_request_duration_seconds', 'Time to produce a response, per route.',
+    ('route', 'method', 'status')))
+request_bytes = registry.register(Counter(
+    'privify_http_request_bytes_total', 'Request body bytes received, per route.', ('route',)))
+response_bytes = registry.register(Counter(
+    'privify_http_response_bytes_total', 'Response body bytes sent, per route.', ('route',)))
+stage_duration = registry.register(Histogram(
+    'privify_stage_duration_seconds', 'Time spent in each processing stage.', ('stage',)))
+
+_stage_children = {stage: stage_duration.labels(stage) for stage in STAGES}
+
+
+def time_stage(stage):
+    """
+    Context manager timing one of STAGES into privify_stage_duration_seconds.
+
+        with time_stage('strip'):
+            ...
+    """
+    return _Timer(_stage_children[stage])
+
+
+def observe_request(route, method, status, seconds, bytes_in, bytes_out):
+    """Record one HTTP request; route is the URL rule, not the concrete path."""
+    request_duration.labels(route, method, status).observe(seconds)
+    if bytes_in:
+        request_bytes.labels(route).inc(bytes_in)
+    if bytes_out:
+        response_bytes.labels(route).inc(bytes_out)
@@ -1,61 +1,277 @@
 import logging
-import requests
 import json
 import os
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from config import RESULT_CACHE_ENABLED
+from services.async_service import run_blocking
+from services.cache_service import LRUMemo, cached, cached_async, json_digest, make_key, result_cache
+from services.logging_service import LazyJson
+from services.upstream_service import UpstreamUnavailable, upstreams
 
 logger = logging.getLogger(__name__)
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "YOUR_GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+# GROQ_BASE_URL is also honoured by the Groq SDK used for vision
+GROQ_API_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com").rstrip('/') + "/openai/v1/chat/completions"
 
-def analyze_metadata_risks(metadata):
-    """Analyze metadata using Groq/Llama 3 for security risks with enhanced parsing"""
-    logger.info("Starting metadata risk analysis with Groq/Llama 3")
-    
-    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY":
-        logger.error("Groq API key not configured properly")
-        return None
+# How the LLM enriches the local rule-based report:
+# 'none' never calls it, 'sync' waits for it (falling back to the rules),
+# 'async' answers from the rules and fills the cache in the background
+ENRICHMENT_MODES = ('none', 'sync', 'async')
+DEFAULT_ENRICHMENT = os.getenv("RISK_ENRICHMENT", "none")
+
+# Metadata fields each rule looks at, matching the LLM system prompt:
+# exact location is high risk, date and time moderate, device info low
+DATETIME_FIELDS = ('DateTime', 'DateTimeOriginal', 'DateTimeDigitized',
+                   'OffsetTime', 'OffsetTimeOriginal', 'OffsetTimeDigitized')
+DEVICE_FIELDS = ('Make', 'Model', 'Software', 'LensMake', 'LensModel', 'HostComputer',
+                 'BodySerialNumber', 'LensSerialNumber', 'CameraOwnerName')
+GPS_COORDINATE_FIELDS = ('GPSLatitude', 'GPSLongitude')
+
+_SEVERITY_ORDER = {'low': 0, 'moderate': 1, 'high': 2}
+
+# LLM reports memoized per risk fingerprint within this process
+RISK_MEMO_SIZE = int(os.getenv("RISK_MEMO_SIZE", 4096))
+risk_memo = LRUMemo(RISK_MEMO_SIZE)
+
+# Background LLM enrichment for 'async' mode, one submission per metadata digest
+_enrichment_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='risk-enrich')
+_enrichment_pending = set()
+_enrichment_lock = threading.Lock()
+
+def _present(metadata, fields):
+    return [field for field in fields if metadata.get(field) not in (None, '', [])]
+
+def analyze_metadata_risks_local(metadata):
+    """
+    Rule-based risk analysis with the same schema as the LLM report.
+
+    Applies the rules from the LLM system prompt deterministically, so it runs
+    in microseconds and needs no network access.
+    """
+    risks = []
+
+    gps = metadata.get('GPSInfo')
+    if isinstance(gps, dict) and _present(gps, GPS_COORDINATE_FIELDS):
+        risks.append({
+            'type': 'location',
+            'severity': 'high',
+            'description': 'The image contains GPS coordinates that reveal exactly where it was taken.',
+            'recommendation': 'Remove the GPSInfo metadata before sharing this image.'
+        })
+    elif gps:
+        risks.append({
+            'type': 'location',
+            'severity': 'moderate',
+            'description': 'The image contains GPS data such as altitude or a satellite timestamp, but no coordinates.',
+            'recommendation': 'Remove the GPSInfo metadata before sharing this image.'
+        })
+
+    dates = _present(metadata, DATETIME_FIELDS)
+    if dates:
+        risks.append({
+            'type': 'date_time',
+            'severity': 'moderate',
+            'description': f"The image records when it was taken or edited ({', '.join(dates)}).",
+            'recommendation': 'Remove date and time metadata if the timing of the photo is sensitive.'
+        })
+
+    devices = _present(metadata, DEVICE_FIELDS)
+    if devices:
+        risks.append({
+            'type': 'device_info',
+            'severity': 'low',
+            'description': f"The image identifies the device or software used ({', '.join(devices)}).",
+            'recommendation': 'Remove device metadata to avoid linking images to the same camera or owner.'
+        })
+
+    if risks:
+        overall = max((risk['severity'] for risk in risks), key=_SEVERITY_ORDER.get)
+        description = f"Found {len(risks)} privacy risk{'s' if len(risks) > 1 else ''} in the image metadata; the most serious is {overall}."
+    else:
+        overall = 'low'
+        description = 'No location, date or device metadata was found.'
+
+    return {
+        'overall_risk': overall,
+        'overall_description': description,
+        'risks': risks,
+        'engine': 'rules'
+    }
+
+def _gps_precision(gps):
+    """Classify how precisely GPSInfo pins down a location."""
+    if not gps:
+        return 'none'
+    if not isinstance(gps, dict) or not _present(gps, GPS_COORDINATE_FIELDS):
+        return 'no_coordinates'
+
+    precision = 'degrees'
+    for field in GPS_COORDINATE_FIELDS:
+        parts = gps.get(field)
+        if not isinstance(parts, (list, tuple)) or len(parts) != 3:
+            # Unusual encoding; treat as exact rather than guess
+            return 'subsecond'
+        try:
+            degrees, minutes, seconds = (float(part) for part in parts)
+        except (TypeError, ValueError):
+            return 'subsecond'
+        if seconds != int(seconds) or degrees != int(degrees) or minutes != int(minutes):
+            return 'subsecond'
+        if seconds:
+            precision = 'seconds'
+        elif minutes and precision == 'degrees':
+            precision = 'minutes'
+    return precision
+
+def risk_fingerprint(metadata):
+    """
+    Normalize metadata down to what the risk rules look at.
 
+    Two photos with the same fingerprint get the same risk report: GPS
+    presence and precision, and which date and device fields exist. The
+    values themselves (timestamps, camera model) do not change the risk.
+    """
+    return (
+        _gps_precision(metadata.get('GPSInfo')),
+        tuple(_present(metadata, DATETIME_FIELDS)),
+        tuple(_present(metadata, DEVICE_FIELDS)),
+    )
+
+def _llm_report(metadata, fingerprint):
+    """LLM report via the in-process memo, then the shared result cache, then Groq."""
+    report = risk_memo.get(fingerprint)
+    if report is not None:
+        return report
+    report = cached('risk-llm', json_digest(fingerprint), None, lambda: analyze_metadata_risks(metadata))
+    if report is not None:
+        risk_memo.set(fingerprint, report)
+    return report
+
+def _enrich_in_background(metadata, fingerprint):
     try:
-        logger.debug(f"Raw metadata input: {json.dumps(metadata, indent=2)}")
+        _llm_report(metadata, fingerprint)
+    finally:
+        with _enrichment_lock:
+            _enrichment_pending.discard(fingerprint)
+
+async def _llm_report_async(metadata, fingerprint):
+    report = risk_memo.get(fingerprint)
+    if report is not None:
+        return report
+    report = await cached_async('risk-llm', json_digest(fingerprint), None,
+                                lambda: analyze_metadata_risks_async(metadata))
+    if report is not None:
+        risk_memo.set(fingerprint, report)
+    return report
+
+async def assess_metadata_risks_async(metadata, enrichment=None):
+    """
+    Async counterpart of assess_metadata_risks, for the ASGI mode.
+
+    Only 'sync' enrichment waits on the LLM, and it does so on the event
+    loop; the other modes never block on the network and run as is on the
+    blocking executor, since they may touch the result cache.
+    """
+    enrichment = enrichment or DEFAULT_ENRICHMENT
+    if enrichment != 'sync':
+        return await run_blocking(assess_metadata_risks, metadata, enrichment)
+
+    report = await _llm_report_async(metadata, risk_fingerprint(metadata))
+    if report is not None:
+        return dict(report, engine='llm')
+    logger.warning("LLM risk analysis unavailable, falling back to local rules")
+    return analyze_metadata_risks_local(metadata)
+
+def assess_metadata_risks(metadata, enrichment=None):
+    """
+    Risk report for metadata: local rules first, LLM enrichment on request.
+
+    Args:
+        metadata: Dict as produced by extract_metadata
+        enrichment: One of ENRICHMENT_MODES; defaults to RISK_ENRICHMENT
+
+    Returns:
+        dict: overall_risk, overall_description, risks[] and the 'engine' that produced it
+    """
+    enrichment = enrichment or DEFAULT_ENRICHMENT
+    fingerprint = risk_fingerprint(metadata)
+
+    if enrichment == 'sync':
+        report = _llm_report(metadata, fingerprint)
+        if report is not None:
+            return dict(report, engine='llm')
+        logger.warning("LLM risk analysis unavailable, falling back to local rules")
+
+    elif enrichment == 'async':
+        report = risk_memo.get(fingerprint)
+        if report is None and RESULT_CACHE_ENABLED:
+            report = result_cache.get('risk-llm', make_key('risk-llm', json_digest(fingerprint)))
+            if report is not None:
+                risk_memo.set(fingerprint, report)
+        if report is not None:
+            return dict(report, engine='llm')
+        with _enrichment_lock:
+            schedule = fingerprint not in _enrichment_pending
+            _enrichment_pending.add(fingerprint)
+        if schedule:
+            _enrichment_executor.submit(_enrich_in_background, metadata, fingerprint)
 
-        system_prompt = """You are a cybersecurity expert analyzing image metadata.If there is exact location mark the risk high,  if there is date and time mark the risk moderate, if there is device info makr the risk low. Return JSON response with:
+    return analyze_metadata_risks_local(metadata)
+
+def fingerprint_prompt(fingerprint):
+    """
+    What the LLM is shown for a risk fingerprint: GPS precision and the
+    names of the date and device fields, never their values. Its report is
+    cached and served for every photo with the same fingerprint, so it must
+    not be able to quote one user's coordinates, timestamps or camera.
+    """
+    gps_precision, date_fields, device_fields = fingerprint
+    return {
+        'GPS': gps_precision,
+        'date_fields': list(date_fields),
+        'device_fields': list(device_fields),
+    }
+
+def _risk_request(metadata):
+    """Chat completion payload asking the LLM for a risk report on metadata."""
+    system_prompt = """You are a cybersecurity expert analyzing image metadata.If there is exact location mark the risk high,  if there is date and time mark the risk moderate, if there is device info makr the risk low. Return JSON response with:
 - overall_risk (low/moderate/high)
 - overall_description
 - risks array containing type, severity, description, recommendation
 ONLY respond with valid JSON, no commentary."""
 
-        user_prompt = f"Analyze this image metadata:\n{json.dumps(metadata, indent=2)}"
-        
-        request_payload = {
-            "model": "llama3-70b-8192",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.1,
-            "response_format": {"type": "json_object"},
-            "max_tokens": 1024
-        }
-
-        logger.info(f"Sending request to Groq API: {GROQ_API_URL}")
-        response = requests.post(
-            GROQ_API_URL,
-            headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
-            json=request_payload,
-            timeout=30
-        )
+    summary = fingerprint_prompt(risk_fingerprint(metadata))
+    user_prompt = ("Analyze this summary of image metadata. GPS is how precisely coordinates are recorded "
+                   "(none, no_coordinates, degrees, minutes, seconds or subsecond); the other entries list "
+                   f"which date and device fields are present:\n{json.dumps(summary, indent=2)}")
+    
+    return {
+        "model": "llama3-70b-8192",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"},
+        "max_tokens": 1024
+    }
 
-        logger.info(f"Received response: HTTP {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"API error {response.status_code}: {response.text}")
-            return None
+def _parse_risk_response(response):
+    """Validated report from a Groq HTTP response (requests or httpx), or None."""
+    logger.info(f"Received response: HTTP {response.status_code}")
+    
+    if response.status_code != 200:
+        logger.error(f"API error {response.status_code}: {response.text}")
+        return None
 
-        response_data = response.json()
+    response_data = response.json()
+    clean_json = ''
+    try:
         llm_response = response_data["choices"][0]["message"]["content"]
-        logger.debug(f"Raw LLM response: {llm_response}")
+        logger.debug("Raw LLM response: %s", llm_response)
 
         # Clean JSON response
         json_str = llm_response.strip()
@@ -71,16 +287,6 @@ ONLY respond with valid JSON, no commentary."""
 
         # Parse and validate
         parsed = json.loads(clean_json)
-        
-        if not all(key in parsed for key in ['overall_risk', 'risks']):
-            raise ValueError("Missing required fields in response")
-            
-        for risk in parsed['risks']:
-            if not all(k in risk for k in ['type', 'severity']):
-                raise ValueError("Invalid risk format")
-
-        logger.info("Successfully parsed and validated LLM response")
-        return parsed
 
     except json.JSONDecodeError as e:
         logger.error(f"JSON parse failed: {str(e)}\nContent: {clean_json[:500]}")
@@ -89,7 +295,65 @@ ONLY respond with valid JSON, no commentary."""
     except KeyError as e:
         logger.error(f"Missing key in response: {str(e)}\nData: {response_data}")
         return None
+    
+    if not all(key in parsed for key in ['overall_risk', 'risks']):
+        raise ValueError("Missing required fields in response")
+        
+    for risk in parsed['risks']:
+        if not all(k in risk for k in ['type', 'severity']):
+            raise ValueError("Invalid risk format")
+
+    logger.info("Successfully parsed and validated LLM response")
+    return parsed
+
+def analyze_metadata_risks(metadata):
+    """Analyze metadata using Groq/Llama 3 for security risks with enhanced parsing"""
+    logger.info("Starting metadata risk analysis with Groq/Llama 3")
+    
+    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY":
+        logger.error("Groq API key not configured properly")
+        return None
+
+    try:
+        logger.debug("Raw metadata input: %s", LazyJson(metadata, indent=2))
+
+        logger.info(f"Sending request to Groq API: {GROQ_API_URL}")
+        response = upstreams['groq'].post(
+            GROQ_API_URL,
+            headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+            json=_risk_request(metadata)
+        )
+        return _parse_risk_response(response)
+
+    except UpstreamUnavailable as e:
+        logger.warning(f"Skipping risk analysis: {str(e)}")
+        return None
         
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}\n{traceback.format_exc()}")
-        return None
\ No newline at end of file
+        return None
+
+async def analyze_metadata_risks_async(metadata):
+    """Async counterpart of analyze_metadata_risks, for the ASGI mode."""
+    logger.info("Starting metadata risk analysis with Groq/Llama 3")
+    
+    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY":
+        logger.error("Groq API key not configured properly")
+        return None
+
+    try:
+        logger.info(f"Sending request to Groq API: {GROQ_API_URL}")
+        response = await upstreams['groq'].apost(
+            GROQ_API_URL,
+            headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+            json=_risk_request(metadata)
+        )
+        return _parse_risk_response(response)
+
+    except UpstreamUnavailable as e:
+        logger.warning(f"Skipping risk analysis: {str(e)}")
+        return None
+        
+    except Exception as e:
+        logger.error(f"Analysis failed: {str(e)}\n{traceback.format_exc()}")
+        return None
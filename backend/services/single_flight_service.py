@@ -0,0 +1,235 @@
+import asyncio
+import copy
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from config import SINGLE_FLIGHT_MODE, SINGLE_FLIGHT_LOCK_DIR, SINGLE_FLIGHT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_MODES = ('off', 'thread', 'process')
+
+# How often a worker waiting on another process's lock checks it again
+_LOCK_POLL_SECONDS = 0.05
+
+
+class _Call:
+    """One in-flight computation that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one computation.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs block and receive the same result, or the same exception. Nothing
+    is remembered once the call finishes; that is the result cache's job.
+
+    In 'process' mode the thread leader also takes an exclusive lock file
+    for the key, so one worker process computes while the others wait and
+    then call `recheck`, which normally finds the result in the shared
+    cache. Waiting is bounded by wait_seconds, after which the caller
+    computes on its own rather than stall the request.
+    """
+
+    def __init__(self, mode=SINGLE_FLIGHT_MODE, lock_dir=SINGLE_FLIGHT_LOCK_DIR,
+                 wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS):
+        if mode not in SINGLE_FLIGHT_MODES:
+            logger.warning("Unknown single-flight mode %r, using 'thread'", mode)
+            mode = 'thread'
+        self.mode = mode
+        self.lock_dir = lock_dir
+        self.wait_seconds = wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.process_waits = 0
+        self.lock_timeouts = 0
+
+    def do(self, key, fn, recheck=None):
+        """
+        Run fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the computation, e.g. a result cache key
+            fn: Zero-argument callable producing the result
+            recheck: Zero-argument callable returning a result stored by
+                another process, or None. 'process' mode only locks across
+                processes when this is given, since without a shared
+                result the other workers would just take turns computing
+
+        Returns:
+            The result of fn(), or of recheck() when another process got there first
+        """
+        if self.mode == 'off':
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Each request gets its own copy, as it would from the cache
+            return copy.deepcopy(call.value)
+
+        try:
+            if self.mode == 'process' and recheck is not None:
+                call.value = self._do_exclusive(key, fn, recheck)
+            else:
+                call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                # No one can join once the call is unregistered
+                waiters = call.waiters
+            call.done.set()
+
+        # call.value stays private while followers copy it, so the leader's
+        # caller gets a copy too and may change its result freely
+        return copy.deepcopy(call.value) if waiters else call.value
+
+    def _lock_path(self, key):
+        return os.path.join(self.lock_dir, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.lock')
+
+    def _do_exclusive(self, key, fn, recheck):
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            fd = os.open(self._lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning("Single-flight lock unavailable (%s), computing without it", e)
+            return fn()
+
+        try:
+            if not self._acquire(fd):
+                with self._lock:
+                    self.lock_timeouts += 1
+                logger.warning("Timed out waiting for another worker on %s", key.split(':', 1)[0])
+                return fn()
+
+            try:
+                value = recheck()
+                return value if value is not None else fn()
+            finally:
+                # Remove the file while still holding it so lock files do not
+                # pile up; a waiter on the old inode simply rechecks the cache
+                try:
+                    os.unlink(self._lock_path(key))
+                except OSError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _acquire(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+
+        with self._lock:
+            self.process_waits += 1
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL_SECONDS)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                continue
+        return False
+
+    def stats(self):
+        with self._lock:
+            calls = self.leaders + self.coalesced
+            return {
+                'mode': self.mode,
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / calls, 4) if calls else 0.0,
+                'process_waits': self.process_waits,
+                'lock_timeouts': self.lock_timeouts,
+            }
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop.
+
+    Followers await the leader's task instead of blocking a thread. Used by
+    the ASGI mode, where one process serves every request on a single loop,
+    so coalescing within the loop covers the whole worker.
+    """
+
+    def __init__(self, mode=SINGLE_FLIGHT_MODE):
+        self.enabled = mode != 'off'
+        self._tasks = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Await fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the computation, e.g. a result cache key
+            fn: Zero-argument coroutine function producing the result
+        """
+        if not self.enabled:
+            return await fn()
+
+        entry = self._tasks.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            # [task, followers]; the list is this call's own, whatever later
+            # calls for the key register
+            entry = self._tasks[key] = [task, 0]
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.leaders += 1
+            # Shielded so a caller that disconnects does not cancel the others' result
+            value = await asyncio.shield(task)
+            # Followers copy the result after the leader resumes, so the
+            # leader must not hand out the shared object either
+            return copy.deepcopy(value) if entry[1] else value
+
+        entry[1] += 1
+        self.coalesced += 1
+        return copy.deepcopy(await asyncio.shield(entry[0]))
+
+    def stats(self):
+        calls = self.leaders + self.coalesced
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self._tasks),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesced_rate': round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
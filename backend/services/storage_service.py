@@ -0,0 +1,317 @@
+import fcntl
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from config import (PROCESSED_FOLDER, PROCESSED_STORE_MAX_BYTES, PROCESSED_STORE_TTL_SECONDS,
+                    STORAGE_SWEEP_INTERVAL_SECONDS, UPLOAD_FOLDER, UPLOAD_STORE_MAX_BYTES,
+                    UPLOAD_STORE_TTL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Stored names are '<sha256>.<ext>'; anything else is rejected before touching the disk
+_NAME = re.compile(r'^([0-9a-f]{64})\.([a-z0-9]{1,5})$')
+_SHARD = re.compile(r'^[0-9a-f]{2}$')
+
+# Quota eviction stops once usage is back under this fraction of the quota,
+# so a store at its limit is not swept again on every write
+_LOW_WATER = 0.9
+
+# Temp files older than this were left by a crashed writer
+_STALE_TEMP_SECONDS = 60 * 60
+
+_CHUNK_SIZE = 1024 * 1024
+
+_MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'bin': 'application/octet-stream'}
+
+
+def sniff_extension(data):
+    """File extension for image bytes, from their signature: 'jpg', 'png', 'webp' or 'bin'."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'bin'
+
+
+def mimetype_for(name):
+    """Content type of a stored name, from its extension."""
+    ext = name.rpartition('.')[2]
+    return _MIMETYPES.get(ext) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def filename_extension(filename):
+    """Lower-case extension of a client file name, or 'bin' if it has none usable."""
+    ext = os.path.splitext(filename or '')[1][1:].lower()
+    return ext if re.fullmatch(r'[a-z0-9]{1,5}', ext) else 'bin'
+
+
+class ContentStore:
+    """
+    Files stored under the SHA-256 of their content.
+
+    A file lives at root/ab/cd/<digest>.<ext>, so two uploads can never
+    overwrite each other and identical content is kept once; no directory
+    holds more than a few hundred entries. Writes go to a temp file in the
+    same filesystem and are renamed into place, so readers never see a
+    partial file. Reads and repeated writes refresh a file's mtime, which
+    the sweeper uses for both the TTL and oldest-first quota eviction.
+    """
+
+    def __init__(self, name, root, max_bytes, ttl_seconds):
+        self.name = name
+        # Absolute, so paths handed to send_file do not depend on the app root
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._tmp_dir = os.path.join(self.root, '.tmp')
+        self._lock = threading.Lock()
+        # Bytes found by the last sweep plus those written since; None until the first sweep
+        self._usage = None
+        self.writes = 0
+        self.deduplicated = 0
+        self.expired = 0
+        self.evicted = 0
+        self.files = 0
+
+    def _path(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def path_for(self, name):
+        """
+        Path of a stored file, or None if name is not a stored name or the
+        file is gone. Marks the file as used.
+        """
+        match = _NAME.match(name)
+        if not match:
+            return None
+        path = self._path(*match.groups())
+        try:
+            # Refreshing at most every tenth of the TTL saves a metadata write per read
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds / 10:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def relative_path(self, path):
+        """A stored file's path relative to the store root, with '/' separators."""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def put(self, data, ext=None):
+        """
+        Store bytes.
+
+        Args:
+            data: File contents
+            ext: File extension; sniffed from the contents when omitted
+
+        Returns:
+            str: The stored name, '<sha256>.<ext>'
+        """
+        return self.put_stream(_BytesChunks(data), ext or sniff_extension(data))
+
+    def put_stream(self, stream, ext):
+        """Store a readable binary stream chunk by chunk; returns the stored name."""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while chunk := stream.read(_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            return self._publish(tmp_path, digest.hexdigest(), ext, size)
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+
+    def _publish(self, tmp_path, digest, ext, size):
+        name = f"{digest}.{ext}"
+        path = self._path(digest, ext)
+        try:
+            # Same content is already stored; keep that copy and refresh it
+            os.utime(path)
+        except FileNotFoundError:
+            # Not stored, or swept since it was: publish this copy
+            pass
+        else:
+            _unlink(tmp_path)
+            with self._lock:
+                self.deduplicated += 1
+            return name
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.writes += 1
+            self.files += 1
+            if self._usage is not None:
+                self._usage += size
+                if self._usage > self.max_bytes:
+                    # Sweep now rather than at the next interval
+                    _wake.set()
+        return name
+
+    def _sweep_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd = os.open(os.path.join(self.root, '.sweep.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _scan(self):
+        entries = []
+        for shard in _scandir(self.root):
+            if not (shard.is_dir() and _SHARD.match(shard.name)):
+                continue
+            for sub in _scandir(shard.path):
+                if not (sub.is_dir() and _SHARD.match(sub.name)):
+                    continue
+                for entry in _scandir(sub.path):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def sweep(self, now=None):
+        """
+        Remove files unused for the TTL, then the least recently used ones
+        until the store is back under its quota, and abandoned temp files.
+
+        Only one process sweeps a store at a time; others skip the round.
+
+        Returns:
+            dict: Files removed and what is left, or None if skipped
+        """
+        fd = self._sweep_lock()
+        if fd is None:
+            return None
+        try:
+            now = time.time() if now is None else now
+            entries = self._scan()
+            expired = evicted = 0
+            kept = []
+            for mtime, size, path in entries:
+                if now - mtime > self.ttl_seconds:
+                    expired += _unlink(path)
+                else:
+                    kept.append((mtime, size, path))
+
+            total = sum(size for _, size, _ in kept)
+            files = len(kept)
+            if total > self.max_bytes:
+                kept.sort()
+                for _, size, path in kept:
+                    if total <= self.max_bytes * _LOW_WATER:
+                        break
+                    if _unlink(path):
+                        evicted += 1
+                        files -= 1
+                        total -= size
+
+            for entry in _scandir(self._tmp_dir):
+                try:
+                    if now - entry.stat().st_mtime > _STALE_TEMP_SECONDS:
+                        _unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+            with self._lock:
+                self._usage = total
+                self.files = files
+                self.expired += expired
+                self.evicted += evicted
+            if expired or evicted:
+                logger.info("Swept %s store: %d expired, %d evicted, %d bytes left",
+                            self.name, expired, evicted, total)
+            return {'expired': expired, 'evicted': evicted, 'files': files, 'bytes': total}
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': self.files,
+                'bytes': self._usage,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'writes': self.writes,
+                'deduplicated': self.deduplicated,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+
+class _BytesChunks:
+    """Read bytes in chunks without copying them into a BytesIO first."""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._offset = 0
+
+    def read(self, size):
+        chunk = self._view[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        return chunk
+
+
+def _scandir(path):
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except FileNotFoundError:
+        return []
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+upload_store = ContentStore('uploads', UPLOAD_FOLDER, UPLOAD_STORE_MAX_BYTES, UPLOAD_STORE_TTL_SECONDS)
+processed_store = ContentStore('processed', PROCESSED_FOLDER, PROCESSED_STORE_MAX_BYTES,
+                               PROCESSED_STORE_TTL_SECONDS)
+stores = {store.name: store for store in (upload_store, processed_store)}
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def _sweep_loop():
+    while True:
+        _wake.clear()
+        for store in stores.values():
+            try:
+                store.sweep()
+            except Exception as e:
+                logger.error(f"Sweeping the {store.name} store failed: {str(e)}")
+        # Sleep until the next round, or until a write pushes a store over its quota
+        _wake.wait(STORAGE_SWEEP_INTERVAL_SECONDS)
+
+
+def start_sweeper():
+    """Start this process's sweeper thread; it sweeps every store once right away."""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_loop, name='storage-sweeper', daemon=True)
+            _sweeper.start()
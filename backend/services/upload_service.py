@@ -0,0 +1,66 @@
+import io
+import logging
+import os
+from contextlib import contextmanager
+from config import UPLOAD_MODE
+from services.metrics_service import time_stage
+from services.storage_service import filename_extension, upload_store
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_upload(file):
+    """
+    Turn an uploaded FileStorage into a source the services can read.
+
+    Returns:
+        The upload's seekable stream in 'memory' mode, or the path it was
+        saved to in 'disk' mode. Saved uploads are named by content hash, so
+        concurrent uploads with the same file name cannot clash.
+    """
+    if UPLOAD_MODE == 'disk':
+        with time_stage('upload_save'):
+            file.stream.seek(0)
+            name = upload_store.put_stream(file.stream, filename_extension(file.filename))
+            input_path = upload_store.path_for(name)
+            logger.info("Saved upload to %s", input_path)
+        return input_path
+
+    file.stream.seek(0)
+    return file.stream
+
+
+@contextmanager
+def open_source(source):
+    """
+    Open an image source for binary reading.
+
+    Args:
+        source: File path, bytes, or a seekable binary stream. Streams are
+            rewound but left open for the caller that owns them.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    else:
+        source.seek(0)
+        yield source
+
+
+def read_source(source):
+    """Return the full contents of an image source as bytes."""
+    if isinstance(source, bytes):
+        return source
+    with open_source(source) as f:
+        return f.read()
+
+
+def write_output(output, data):
+    """Write bytes to an output path or a writable stream."""
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            f.write(data)
+    else:
+        output.write(data)
@@ -0,0 +1,115 @@
+import base64
+import io
+import logging
+from PIL import Image, ImageOps
+from config import (GROQ_IMAGE_MAX_SIDE, GROQ_IMAGE_MAX_BYTES, GROQ_IMAGE_QUALITY,
+                    SEGMIND_IMAGE_MAX_SIDE, SEGMIND_IMAGE_MAX_BYTES, SEGMIND_IMAGE_QUALITY)
+from services.metrics_service import time_stage
+from services.upload_service import read_source
+
+logger = logging.getLogger(__name__)
+
+# Size limits and JPEG quality for each upstream API that receives images
+UPSTREAM_TARGETS = {
+    'groq': {'max_side': GROQ_IMAGE_MAX_SIDE, 'max_bytes': GROQ_IMAGE_MAX_BYTES, 'quality': GROQ_IMAGE_QUALITY},
+    'segmind': {'max_side': SEGMIND_IMAGE_MAX_SIDE, 'max_bytes': SEGMIND_IMAGE_MAX_BYTES, 'quality': SEGMIND_IMAGE_QUALITY},
+}
+
+# Formats the upstream APIs accept as-is when no resizing is needed
+_PASSTHROUGH_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+# Lowest quality tried before shrinking further to meet a byte limit
+_MIN_QUALITY = 60
+
+
+def _to_rgb(img):
+    if img.mode == 'RGB':
+        return img
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Flatten transparency onto white, as screenshots are usually drawn on it
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _encode_within(img, max_bytes, quality):
+    """Encode as JPEG, lowering quality and then size until it fits in max_bytes."""
+    while True:
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=quality, optimize=True)
+        if buf.tell() <= max_bytes or min(img.size) <= 64:
+            return buf.getvalue(), quality
+        if quality > _MIN_QUALITY:
+            quality = max(_MIN_QUALITY, quality - 10)
+        else:
+            img = img.resize((max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.LANCZOS)
+
+
+def prepare_upstream_image(source, target):
+    """
+    Shrink an image to what an upstream API needs before it is sent.
+
+    Images already within the target's limits in a format the API accepts are
+    sent unchanged with their real MIME type. Anything larger is decoded
+    (JPEGs in draft mode, so the DCT does most of the downscaling), rotated
+    upright, resized so its long side fits max_side and re-encoded as JPEG.
+    Re-encoding also leaves the EXIF block behind.
+
+    Args:
+        source: Image as a path, bytes or seekable stream
+        target: Key of UPSTREAM_TARGETS
+
+    Returns:
+        tuple: (data, mimetype, stats) where stats holds the original and sent
+        byte counts and pixel sizes, 'bytes_saved' and 'reencoded'
+    """
+    limits = UPSTREAM_TARGETS[target]
+    max_side = limits['max_side']
+    data = read_source(source)
+
+    try:
+        with time_stage('upstream_prepare'), Image.open(io.BytesIO(data)) as img:
+            fmt = img.format
+            original_size = img.size
+            orientation = img.getexif().get(0x0112, 1)
+
+            if (fmt in _PASSTHROUGH_FORMATS and max(original_size) <= max_side
+                    and len(data) <= limits['max_bytes'] and orientation == 1):
+                sent, mimetype, sent_size = data, Image.MIME[fmt], original_size
+            else:
+                if fmt == 'JPEG':
+                    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the target
+                    scale = max_side / max(original_size)
+                    img.draft('RGB', (int(img.width * scale) + 1, int(img.height * scale) + 1))
+                small = ImageOps.exif_transpose(img)
+                small.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+                small = _to_rgb(small)
+                sent, quality = _encode_within(small, limits['max_bytes'], limits['quality'])
+                mimetype, sent_size = 'image/jpeg', small.size
+                logger.debug("Re-encoded %s %s for %s at quality %d", fmt, original_size, target, quality)
+
+    except Exception as e:
+        # Let the upstream API decide what to do with a file we cannot decode
+        logger.warning("Could not preprocess image for %s (%s), sending original", target, str(e))
+        sent, mimetype, original_size, sent_size = data, 'image/jpeg', None, None
+
+    stats = {
+        'original_bytes': len(data),
+        'sent_bytes': len(sent),
+        'bytes_saved': len(data) - len(sent),
+        'original_size': original_size,
+        'sent_size': sent_size,
+        'reencoded': sent is not data,
+    }
+    logger.info("Prepared image for %s: %d -> %d bytes (%d saved), %s -> %s",
+                target, stats['original_bytes'], stats['sent_bytes'], stats['bytes_saved'],
+                original_size, sent_size)
+    return sent, mimetype, stats
+
+
+def upstream_data_url(source, target):
+    """Return the prepared image for target as a base64 data URL, with its stats."""
+    data, mimetype, stats = prepare_upstream_image(source, target)
+    return f"data:{mimetype};base64,{base64.b64encode(data).decode('utf-8')}", stats
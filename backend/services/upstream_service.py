@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import (UPSTREAM_TIMEOUTS, UPSTREAM_RETRIES, UPSTREAM_POOL_SIZE, UPSTREAM_ASYNC_SHARDS,
+                    UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Responses worth another attempt: rate limiting and transient gateway errors
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Full-jitter backoff: sleep a random time up to base * 2**attempt, capped
+_BACKOFF_BASE = 0.25
+_BACKOFF_CAP = 4.0
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `threshold` failures in a row the circuit opens and calls fail fast.
+    Once `reset_seconds` have passed a single trial call is let through
+    (half-open); its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        return self.acquire() is not None
+
+    def acquire(self):
+        """
+        Admit a call: 'closed' for a normal call, 'trial' for the single
+        half-open trial, or None if the call must fail fast. The caller of
+        a trial owns it until it records a result or calls end_trial().
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return None
+            self._trial_running = True
+            return 'trial'
+
+    def end_trial(self):
+        """Give up a trial that ended without a verdict, e.g. it was cancelled; the next call tries again."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class Upstream:
+    """
+    One upstream service: pooled keep-alive session, timeouts, retries,
+    circuit breaker, and latency and error counters.
+    """
+
+    def __init__(self, name, timeout, retries=UPSTREAM_RETRIES, pool_size=UPSTREAM_POOL_SIZE,
+                 breaker_threshold=UPSTREAM_BREAKER_THRESHOLD, breaker_reset_seconds=UPSTREAM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+        self._session = None
+        self._session_pid = None
+        self._async_clients = []
+        self._async_loop = None
+        self._async_turn = 0
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'rejected': 0, 'errors': {}, 'status': {}}
+        self._latency = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+    @property
+    def session(self):
+        # Pooled sockets must not be shared with a forked worker
+        with self._lock:
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session, self._session_pid = session, os.getpid()
+            return self._session
+
+    @property
+    def async_client(self):
+        """
+        Pooled httpx client for the ASGI mode, bound to the running event loop.
+
+        Requests rotate over UPSTREAM_ASYNC_SHARDS clients: httpx looks at
+        every connection of a pool on each request, so several small pools
+        stay cheap where one large pool would not under high concurrency.
+        """
+        loop = asyncio.get_running_loop()
+        if not self._async_clients or self._async_loop is not loop:
+            connect_timeout, read_timeout = self.timeout
+            # Like the requests pool: unbounded connections, a bounded keep-alive set
+            self._async_clients = [
+                httpx.AsyncClient(
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size),
+                )
+                for _ in range(UPSTREAM_ASYNC_SHARDS)
+            ]
+            self._async_loop = loop
+        self._async_turn = (self._async_turn + 1) % len(self._async_clients)
+        return self._async_clients[self._async_turn]
+
+    async def aclose(self):
+        for client in self._async_clients:
+            await client.aclose()
+        self._async_clients, self._async_loop = [], None
+
+    def _observe(self, seconds, status=None, error=None):
+        with self._lock:
+            self._counters['requests'] += 1
+            if status is not None:
+                key = str(status)
+                self._counters['status'][key] = self._counters['status'].get(key, 0) + 1
+            if error is not None:
+                self._counters['errors'][error] = self._counters['errors'].get(error, 0) + 1
+            self._latency['count'] += 1
+            self._latency['sum'] += seconds
+            self._latency['max'] = max(self._latency['max'], seconds)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            self._latency['buckets'][bucket] += 1
+
+    def _admit(self):
+        """Whether this call is the half-open trial; raises UpstreamUnavailable if the circuit is open."""
+        admitted = self.breaker.acquire()
+        if admitted is None:
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+        return admitted == 'trial'
+
+    def _backoff_delay(self, attempt, response=None):
+        delay = random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2 ** attempt))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), _BACKOFF_CAP))
+        with self._lock:
+            self._counters['retries'] += 1
+        return delay
+
+    def _backoff(self, attempt, response=None):
+        time.sleep(self._backoff_delay(attempt, response))
+
+    def _finish(self, response):
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        """
+        Send a request through the pooled session.
+
+        Connection errors, timeouts and RETRY_STATUSES are retried with
+        jittered backoff when the call is idempotent. Connection failures are
+        retried either way, since the request never reached the server.
+
+        Returns:
+            requests.Response: The last response, whatever its status
+
+        Raises:
+            UpstreamUnavailable: The circuit breaker is open
+            requests.RequestException: All attempts failed without a response
+        """
+        trial = self._admit()
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self._send(method, url, idempotent, kwargs)
+        except BaseException:
+            # Failures are recorded where they happen; anything else, such as
+            # an interrupt, must not leave the half-open trial taken forever
+            if trial:
+                self.breaker.end_trial()
+            raise
+
+    def _send(self, method, url, idempotent, kwargs):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                # ConnectTimeout is a ConnectionError; ReadTimeout is not
+                self._observe(time.perf_counter() - start, error='connection')
+                if last_attempt or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    self.breaker.record_failure()
+                    raise
+                self._backoff(attempt)
+                continue
+            except requests.Timeout:
+                self._observe(time.perf_counter() - start, error='timeout')
+                if last_attempt or not idempotent:
+                    self.breaker.record_failure()
+                    raise
+                self._backoff(attempt)
+                continue
+            except requests.RequestException as e:
+                # e.g. a body cut off mid-transfer or a redirect loop; not worth retrying
+                self._observe(time.perf_counter() - start, error=type(e).__name__)
+                self.breaker.record_failure()
+                raise
+
+            self._observe(time.perf_counter() - start, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and idempotent and not last_attempt:
+                response.close()
+                self._backoff(attempt, response)
+                continue
+
+            return self._finish(response)
+
+    def post(self, url, idempotent=True, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    async def arequest(self, method, url, idempotent=True, **kwargs):
+        """
+        Async counterpart of request(), sent through the httpx client.
+
+        Same retry, breaker and counter rules; waits between attempts do
+        not block the event loop.
+
+        Returns:
+            httpx.Response: The last response, whatever its status
+
+        Raises:
+            UpstreamUnavailable: The circuit breaker is open
+            httpx.HTTPError: All attempts failed without a response
+        """
+        trial = self._admit()
+        try:
+            return await self._asend(method, url, idempotent, kwargs)
+        except BaseException:
+            # Includes cancellation: a cancelled trial must not keep the circuit open
+            if trial:
+                self.breaker.end_trial()
+            raise
+
+    async def _asend(self, method, url, idempotent, kwargs):
+        client = self.async_client
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Never reached the server, so even non-idempotent calls can go again
+                self._observe(time.perf_counter() - start, error='connection')
+                if last_attempt:
+                    self.breaker.record_failure()
+                    raise
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                # RemoteProtocolError is what a keep-alive connection closed by the server raises
+                self._observe(time.perf_counter() - start,
+                              error='timeout' if isinstance(e, httpx.TimeoutException) else 'connection')
+                if last_attempt or not idempotent:
+                    self.breaker.record_failure()
+                    raise
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+            except httpx.HTTPError as e:
+                # e.g. DecodingError or TooManyRedirects; not worth retrying
+                self._observe(time.perf_counter() - start, error=type(e).__name__)
+                self.breaker.record_failure()
+                raise
+
+            self._observe(time.perf_counter() - start, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and idempotent and not last_attempt:
+                await asyncio.sleep(self._backoff_delay(attempt, response))
+                continue
+
+            return self._finish(response)
+
+    async def apost(self, url, idempotent=True, **kwargs):
+        return await self.arequest('POST', url, idempotent=idempotent, **kwargs)
+
+    @contextmanager
+    def guard(self):
+        """
+        Apply the circuit breaker and counters to a call made by another
+        client, such as an SDK with its own connection pool and retries.
+        """
+        trial = self._admit()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            # SDK status errors carry the HTTP status; a 4xx means the upstream is up
+            status = getattr(e, 'status_code', None)
+            self._observe(time.perf_counter() - start, status=status,
+                          error=None if status else type(e).__name__)
+            if status is not None and status < 500:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or interrupted: no verdict on the upstream
+            if trial:
+                self.breaker.end_trial()
+            raise
+        self._observe(time.perf_counter() - start, status=200)
+        self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            latency = dict(self._latency, buckets=dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'],
+                                                           self._latency['buckets'])))
+            counters = {key: (dict(value) if isinstance(value, dict) else value)
+                        for key, value in self._counters.items()}
+        return dict(counters, state=self.breaker.state, times_opened=self.breaker.times_opened,
+                    latency_seconds=latency)
+
+
+upstreams = {name: Upstream(name, timeout) for name, timeout in UPSTREAM_TIMEOUTS.items()}
@@ -1,79 +1,190 @@
+import asyncio
 import logging
 import os
-import base64
-import requests
 import json
-from groq import Groq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from groq import AsyncGroq, Groq
+from config import UPSTREAM_ASYNC_SHARDS, UPSTREAM_RETRIES, UPSTREAM_TIMEOUTS
+from services.async_service import run_blocking
+from services.upstream_image_service import upstream_data_url
+from services.upstream_service import upstreams
 
 logger = logging.getLogger(__name__)
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "YOUR_GROQ_API_KEY")
+VISION_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
 
-def encode_image(image_path):
-    """Encode image to base64 string"""
+# Comprehensive analysis modes: 'parallel' runs the description and object
+# prompts concurrently, 'fused' asks for both in a single completion
+COMPREHENSIVE_MODES = ('parallel', 'fused')
+DEFAULT_COMPREHENSIVE_MODE = os.getenv("VISION_COMPREHENSIVE_MODE", "parallel")
+
+DESCRIPTION_PROMPT = "Provide a concise, professional description of this image in 2-3 sentences. Focus on the main subject, setting, and any notable details."
+OBJECTS_PROMPT = "List all the objects you can detect in this image. Return the response as a JSON array of objects with 'object' and 'confidence' fields. For example: [{'object': 'person', 'confidence': 'high'}, {'object': 'car', 'confidence': 'medium'}]. Only include objects that are clearly visible and identifiable."
+FUSED_PROMPT = "Describe this image and list the objects in it. Return a JSON object with two fields: 'description', a concise, professional description in 2-3 sentences focusing on the main subject, setting, and any notable details; and 'objects', an array of objects with 'object' and 'confidence' fields, for example [{'object': 'person', 'confidence': 'high'}]. Only include objects that are clearly visible and identifiable."
+
+# Completion parameters per prompt
+DESCRIPTION_PARAMS = {'max_tokens': 200, 'temperature': 0.3}
+OBJECTS_PARAMS = {'max_tokens': 300, 'temperature': 0.2, 'response_format': {"type": "json_object"}}
+FUSED_PARAMS = {'max_tokens': 500, 'temperature': 0.2, 'response_format': {"type": "json_object"}}
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = []
+_async_clients_loop = None
+_async_turn = 0
+
+# Runs the two model calls of a comprehensive analysis side by side
+_vision_executor = ThreadPoolExecutor(max_workers=int(os.getenv("VISION_WORKERS", 8)),
+                                      thread_name_prefix="vision")
+
+def get_groq_client():
+    """
+    Return the process-wide Groq client.
+
+    The client keeps an HTTP connection pool, so reusing it saves a TLS
+    handshake per call. It is safe to share between threads. Timeouts and
+    retries follow the shared upstream settings for Groq.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Groq(**_groq_client_options())
+    return _client
+
+def _groq_client_options():
+    connect_timeout, read_timeout = UPSTREAM_TIMEOUTS['groq']
+    return {
+        'api_key': GROQ_API_KEY,
+        'timeout': httpx.Timeout(read_timeout, connect=connect_timeout),
+        'max_retries': UPSTREAM_RETRIES,
+    }
+
+def get_async_groq_client():
+    """
+    Return an AsyncGroq client for the running event loop (ASGI mode).
+
+    Calls rotate over UPSTREAM_ASYNC_SHARDS clients, each with its own
+    connection pool, like the other upstreams. The pools belong to the loop
+    that made them, so new clients are made if the loop changes.
+    """
+    global _async_clients, _async_clients_loop, _async_turn
+    loop = asyncio.get_running_loop()
+    if not _async_clients or _async_clients_loop is not loop:
+        _async_clients = [AsyncGroq(**_groq_client_options()) for _ in range(UPSTREAM_ASYNC_SHARDS)]
+        _async_clients_loop = loop
+    _async_turn = (_async_turn + 1) % len(_async_clients)
+    return _async_clients[_async_turn]
+
+async def close_async_groq_clients():
+    global _async_clients, _async_clients_loop
+    for client in _async_clients:
+        await client.close()
+    _async_clients, _async_clients_loop = [], None
+
+def _api_key_configured():
+    return bool(GROQ_API_KEY) and GROQ_API_KEY != "YOUR_GROQ_API_KEY"
+
+def _vision_messages(prompt, image_url):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text", 
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url,
+                    },
+                },
+            ],
+        }
+    ]
+
+def _vision_completion(prompt, image_url, **params):
+    """Send one prompt with the encoded image and return the message text."""
+    with upstreams['groq'].guard():
+        chat_completion = get_groq_client().chat.completions.create(
+            messages=_vision_messages(prompt, image_url),
+            model=VISION_MODEL,
+            **params
+        )
+    return chat_completion.choices[0].message.content
+
+async def _vision_completion_async(prompt, image_url, **params):
+    """Async counterpart of _vision_completion, for the ASGI mode."""
+    with upstreams['groq'].guard():
+        chat_completion = await get_async_groq_client().chat.completions.create(
+            messages=_vision_messages(prompt, image_url),
+            model=VISION_MODEL,
+            **params
+        )
+    return chat_completion.choices[0].message.content
+
+def _vision_completion_stream(prompt, image_url, **params):
+    """Send one prompt with the encoded image and yield the message text as it is generated."""
+    with upstreams['groq'].guard():
+        stream = get_groq_client().chat.completions.create(
+            messages=_vision_messages(prompt, image_url),
+            model=VISION_MODEL,
+            stream=True,
+            **params
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Hand the connection back to the pool if the client went away
+            stream.close()
+
+def encode_image(source):
+    """Encode image (path, bytes or stream) as a data URL, downscaled for the vision model"""
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        image_url, _ = upstream_data_url(source, 'groq')
+        return image_url
     except Exception as e:
         logger.error(f"Error encoding image: {str(e)}")
         return None
 
-def analyze_image_description(image_path):
+def analyze_image_description(source):
     """
     Generate a short description of the image using Groq vision.
     
     Args:
-        image_path: Path to the image file
+        source: Image as a path, bytes or seekable stream
         
     Returns:
         dict: Contains description and success status
     """
     logger.info("Starting image description analysis")
     
-    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY":
+    if not _api_key_configured():
         logger.error("Groq API key not configured properly")
         return {
             'success': False,
             'error': 'Groq API key not configured'
         }
 
-    try:
-        # Encode the image
-        base64_image = encode_image(image_path)
-        if not base64_image:
-            return {
-                'success': False,
-                'error': 'Failed to encode image'
-            }
-
-        # Create Groq client
-        client = Groq(api_key=GROQ_API_KEY)
-        
-        # Create the chat completion request
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": "Provide a concise, professional description of this image in 2-3 sentences. Focus on the main subject, setting, and any notable details."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            max_tokens=200,
-            temperature=0.3
-        )
+    # Encode the image
+    image_url = encode_image(source)
+    if not image_url:
+        return {
+            'success': False,
+            'error': 'Failed to encode image'
+        }
+
+    return _describe_encoded(image_url)
 
-        description = chat_completion.choices[0].message.content
+def _describe_encoded(image_url):
+    try:
+        description = _vision_completion(DESCRIPTION_PROMPT, image_url, **DESCRIPTION_PARAMS)
         
         logger.info("Image description analysis completed successfully")
         return {
@@ -88,124 +199,39 @@ def analyze_image_description(image_path):
             'error': f'Analysis failed: {str(e)}'
         }
 
-def detect_objects_in_image(image_path):
+def detect_objects_in_image(source):
     """
     Detect objects in the image using Groq vision.
     
     Args:
-        image_path: Path to the image file
+        source: Image as a path, bytes or seekable stream
         
     Returns:
         dict: Contains detected objects and success status
     """
     logger.info("Starting object detection analysis")
     
-    if not GROQ_API_KEY or GROQ_API_KEY == "YOUR_GROQ_API_KEY":
+    if not _api_key_configured():
         logger.error("Groq API key not configured properly")
         return {
             'success': False,
             'error': 'Groq API key not configured'
         }
 
-    try:
-        # Encode the image
-        base64_image = encode_image(image_path)
-        if not base64_image:
-            return {
-                'success': False,
-                'error': 'Failed to encode image'
-            }
-
-        # Create Groq client
-        client = Groq(api_key=GROQ_API_KEY)
-        
-        # Create the chat completion request
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": "List all the objects you can detect in this image. Return the response as a JSON array of objects with 'object' and 'confidence' fields. For example: [{'object': 'person', 'confidence': 'high'}, {'object': 'car', 'confidence': 'medium'}]. Only include objects that are clearly visible and identifiable."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            max_tokens=300,
-            temperature=0.2,
-            response_format={"type": "json_object"}
-        )
+    # Encode the image
+    image_url = encode_image(source)
+    if not image_url:
+        return {
+            'success': False,
+            'error': 'Failed to encode image'
+        }
 
-        response_content = chat_completion.choices[0].message.content
-        
-        # Parse the JSON response
-        try:
-            # Clean the response if it contains markdown formatting
-            if '```json' in response_content:
-                response_content = response_content.split('```json')[1].split('```')[0]
-            elif '```' in response_content:
-                response_content = response_content.split('```')[1].split('```')[0]
-            
-            # Find first { and last } to handle any remaining text
-            json_start = response_content.find('{')
-            json_end = response_content.rfind('}') + 1
-            clean_json = response_content[json_start:json_end]
-            
-            parsed_response = json.loads(clean_json)
-            
-            # Extract objects array
-            if 'objects' in parsed_response:
-                objects = parsed_response['objects']
-            elif isinstance(parsed_response, list):
-                objects = parsed_response
-            else:
-                # If the response is a different format, try to extract objects
-                objects = []
-                for key, value in parsed_response.items():
-                    if isinstance(value, dict) and 'object' in value:
-                        objects.append(value)
-                    elif isinstance(value, str):
-                        objects.append({'object': key, 'confidence': value})
-            
-            logger.info(f"Object detection completed. Found {len(objects)} objects")
-            return {
-                'success': True,
-                'objects': objects,
-                'object_count': len(objects)
-            }
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {str(e)}")
-            # Fallback: try to extract objects from text
-            objects = []
-            lines = response_content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith('{') and not line.startswith('}'):
-                    # Try to extract object name
-                    if ':' in line:
-                        obj_name = line.split(':')[0].strip()
-                        confidence = 'medium'
-                        if 'high' in line.lower():
-                            confidence = 'high'
-                        elif 'low' in line.lower():
-                            confidence = 'low'
-                        objects.append({'object': obj_name, 'confidence': confidence})
-            
-            return {
-                'success': True,
-                'objects': objects,
-                'object_count': len(objects),
-                'note': 'Parsed from text response'
-            }
+    return _detect_objects_encoded(image_url)
+
+def _detect_objects_encoded(image_url):
+    try:
+        response_content = _vision_completion(OBJECTS_PROMPT, image_url, **OBJECTS_PARAMS)
+        return _parse_objects_response(response_content)
 
     except Exception as e:
         logger.error(f"Object detection analysis failed: {str(e)}")
@@ -214,25 +240,147 @@ def detect_objects_in_image(image_path):
             'error': f'Analysis failed: {str(e)}'
         }
 
-def analyze_image_comprehensive(image_path):
+def _objects_from_parsed(parsed_response):
+    # Extract objects array
+    if isinstance(parsed_response, list):
+        return parsed_response
+    if 'objects' in parsed_response:
+        return parsed_response['objects']
+    # If the response is a different format, try to extract objects
+    objects = []
+    for key, value in parsed_response.items():
+        if isinstance(value, dict) and 'object' in value:
+            objects.append(value)
+        elif isinstance(value, str):
+            objects.append({'object': key, 'confidence': value})
+    return objects
+
+def _parse_objects_response(response_content):
+    """Turn the model's object list (JSON, possibly fenced, or plain text) into a result dict."""
+    # Parse the JSON response
+    try:
+        # Clean the response if it contains markdown formatting
+        if '```json' in response_content:
+            response_content = response_content.split('```json')[1].split('```')[0]
+        elif '```' in response_content:
+            response_content = response_content.split('```')[1].split('```')[0]
+        
+        # Find first { and last } to handle any remaining text
+        json_start = response_content.find('{')
+        json_end = response_content.rfind('}') + 1
+        clean_json = response_content[json_start:json_end]
+        
+        objects = _objects_from_parsed(json.loads(clean_json))
+        
+        logger.info(f"Object detection completed. Found {len(objects)} objects")
+        return {
+            'success': True,
+            'objects': objects,
+            'object_count': len(objects)
+        }
+        
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse JSON response: {str(e)}")
+        # Fallback: try to extract objects from text
+        objects = []
+        lines = response_content.split('\n')
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('{') and not line.startswith('}'):
+                # Try to extract object name
+                if ':' in line:
+                    obj_name = line.split(':')[0].strip()
+                    confidence = 'medium'
+                    if 'high' in line.lower():
+                        confidence = 'high'
+                    elif 'low' in line.lower():
+                        confidence = 'low'
+                    objects.append({'object': obj_name, 'confidence': confidence})
+        
+        return {
+            'success': True,
+            'objects': objects,
+            'object_count': len(objects),
+            'note': 'Parsed from text response'
+        }
+
+def _fused_analysis_encoded(image_url):
+    """
+    Ask for the description and the object list in one completion.
+
+    Returns:
+        tuple: (description_result, objects_result) shaped like the results of
+        the separate description and object detection calls
+    """
+    try:
+        response_content = _vision_completion(FUSED_PROMPT, image_url, **FUSED_PARAMS)
+        return _parse_fused_response(response_content)
+
+    except Exception as e:
+        logger.error(f"Fused image analysis failed: {str(e)}")
+        error = {'success': False, 'error': f'Analysis failed: {str(e)}'}
+        return error, error
+
+def _parse_fused_response(response_content):
+    json_start = response_content.find('{')
+    json_end = response_content.rfind('}') + 1
+    parsed_response = json.loads(response_content[json_start:json_end])
+    if not isinstance(parsed_response, dict):
+        raise ValueError("Expected a JSON object")
+
+    description = str(parsed_response.pop('description', '')).strip()
+    objects = _objects_from_parsed(parsed_response)
+    logger.info(f"Fused analysis completed. Found {len(objects)} objects")
+    return (
+        {'success': bool(description), 'description': description,
+         'error': None if description else 'No description in response'},
+        {'success': True, 'objects': objects, 'object_count': len(objects)},
+    )
+
+def analyze_image_comprehensive(source, mode=None):
     """
     Perform comprehensive image analysis including description and object detection.
+
+    The image is encoded once. In 'parallel' mode the description and object
+    prompts run concurrently on the shared client, so latency is that of the
+    slower call rather than the sum of both; 'fused' sends a single request
+    that returns both.
     
     Args:
-        image_path: Path to the image file
+        source: Image as a path, bytes or seekable stream
+        mode: One of COMPREHENSIVE_MODES, defaults to VISION_COMPREHENSIVE_MODE
         
     Returns:
         dict: Contains both description and object detection results
     """
-    logger.info("Starting comprehensive image analysis")
-    
-    # Get image description
-    description_result = analyze_image_description(image_path)
-    
-    # Get object detection
-    objects_result = detect_objects_in_image(image_path)
+    mode = mode or DEFAULT_COMPREHENSIVE_MODE
+    logger.info("Starting comprehensive image analysis (mode=%s)", mode)
+
+    if not _api_key_configured():
+        logger.error("Groq API key not configured properly")
+        description_result = objects_result = {
+            'success': False,
+            'error': 'Groq API key not configured'
+        }
+    elif not (image_url := encode_image(source)):
+        description_result = objects_result = {
+            'success': False,
+            'error': 'Failed to encode image'
+        }
+    elif mode == 'fused':
+        description_result, objects_result = _fused_analysis_encoded(image_url)
+    else:
+        # Run the object prompt on the pool while this thread runs the description
+        objects_future = _vision_executor.submit(_detect_objects_encoded, image_url)
+        description_result = _describe_encoded(image_url)
+        objects_result = objects_future.result()
     
-    # Combine results
+    result = _combine_results(description_result, objects_result)
+    logger.info("Comprehensive image analysis completed")
+    return result
+
+def _combine_results(description_result, objects_result):
+    """Merge the description and object results into the comprehensive result dict."""
     result = {
         'success': description_result['success'] and objects_result['success'],
         'description': description_result.get('description', ''),
@@ -246,6 +394,168 @@ def analyze_image_comprehensive(image_path):
     
     if not objects_result['success']:
         result['errors'].append(f"Object detection failed: {objects_result.get('error', 'Unknown error')}")
-    
+    return result
+
+def stream_image_analysis(source, with_objects=False):
+    """
+    Analyze an image and yield progress events while it runs.
+
+    The description is streamed token by token from Groq. With with_objects
+    the object prompt runs concurrently on the pool and its result is sent
+    as soon as it is ready, as in the 'parallel' comprehensive mode.
+
+    Args:
+        source: Image as a path, bytes or seekable stream
+        with_objects: Also detect objects (comprehensive analysis)
+
+    Yields:
+        tuple: (event, data) pairs: 'encoded' with the upstream image stats,
+        'description_delta' with a piece of text, 'description' and
+        'objects' with their results, and finally 'result' with the dict
+        analyze_image_description or analyze_image_comprehensive would return
+    """
+    logger.info("Starting streamed image analysis (objects=%s)", with_objects)
+
+    if not _api_key_configured():
+        logger.error("Groq API key not configured properly")
+        error = {'success': False, 'error': 'Groq API key not configured'}
+        yield 'result', _combine_results(error, error) if with_objects else error
+        return
+
+    try:
+        image_url, stats = upstream_data_url(source, 'groq')
+    except Exception as e:
+        logger.error(f"Error encoding image: {str(e)}")
+        error = {'success': False, 'error': 'Failed to encode image'}
+        yield 'result', _combine_results(error, error) if with_objects else error
+        return
+    yield 'encoded', stats
+
+    objects_future = _vision_executor.submit(_detect_objects_encoded, image_url) if with_objects else None
+    objects_result = None
+    try:
+        pieces = []
+        try:
+            for piece in _vision_completion_stream(DESCRIPTION_PROMPT, image_url, **DESCRIPTION_PARAMS):
+                pieces.append(piece)
+                yield 'description_delta', {'text': piece}
+                if objects_future is not None and objects_result is None and objects_future.done():
+                    objects_result = objects_future.result()
+                    yield 'objects', objects_result
+            description_result = {'success': True, 'description': ''.join(pieces).strip()}
+            logger.info("Streamed image description completed successfully")
+        except Exception as e:
+            logger.error(f"Image description analysis failed: {str(e)}")
+            description_result = {'success': False, 'error': f'Analysis failed: {str(e)}'}
+        yield 'description', description_result
+
+        if objects_future is None:
+            yield 'result', description_result
+            return
+        if objects_result is None:
+            objects_result = objects_future.result()
+            yield 'objects', objects_result
+        yield 'result', _combine_results(description_result, objects_result)
+    finally:
+        if objects_future is not None:
+            objects_future.cancel()
+
+async def _encode_image_async(source):
+    return await run_blocking(encode_image, source)
+
+async def _describe_encoded_async(image_url):
+    try:
+        description = await _vision_completion_async(DESCRIPTION_PROMPT, image_url, **DESCRIPTION_PARAMS)
+        logger.info("Image description analysis completed successfully")
+        return {
+            'success': True,
+            'description': description.strip()
+        }
+
+    except Exception as e:
+        logger.error(f"Image description analysis failed: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Analysis failed: {str(e)}'
+        }
+
+async def _detect_objects_encoded_async(image_url):
+    try:
+        response_content = await _vision_completion_async(OBJECTS_PROMPT, image_url, **OBJECTS_PARAMS)
+        return _parse_objects_response(response_content)
+
+    except Exception as e:
+        logger.error(f"Object detection analysis failed: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Analysis failed: {str(e)}'
+        }
+
+async def _fused_analysis_encoded_async(image_url):
+    try:
+        response_content = await _vision_completion_async(FUSED_PROMPT, image_url, **FUSED_PARAMS)
+        return _parse_fused_response(response_content)
+
+    except Exception as e:
+        logger.error(f"Fused image analysis failed: {str(e)}")
+        error = {'success': False, 'error': f'Analysis failed: {str(e)}'}
+        return error, error
+
+async def analyze_image_description_async(source):
+    """Async counterpart of analyze_image_description; encoding runs on the blocking executor."""
+    logger.info("Starting image description analysis")
+
+    if not _api_key_configured():
+        logger.error("Groq API key not configured properly")
+        return {'success': False, 'error': 'Groq API key not configured'}
+
+    image_url = await _encode_image_async(source)
+    if not image_url:
+        return {'success': False, 'error': 'Failed to encode image'}
+
+    return await _describe_encoded_async(image_url)
+
+async def detect_objects_in_image_async(source):
+    """Async counterpart of detect_objects_in_image; encoding runs on the blocking executor."""
+    logger.info("Starting object detection analysis")
+
+    if not _api_key_configured():
+        logger.error("Groq API key not configured properly")
+        return {'success': False, 'error': 'Groq API key not configured'}
+
+    image_url = await _encode_image_async(source)
+    if not image_url:
+        return {'success': False, 'error': 'Failed to encode image'}
+
+    return await _detect_objects_encoded_async(image_url)
+
+async def analyze_image_comprehensive_async(source, mode=None):
+    """
+    Async counterpart of analyze_image_comprehensive.
+
+    In 'parallel' mode both prompts are awaited together on the event loop
+    instead of occupying a pool thread each.
+    """
+    mode = mode or DEFAULT_COMPREHENSIVE_MODE
+    logger.info("Starting comprehensive image analysis (mode=%s)", mode)
+
+    if not _api_key_configured():
+        logger.error("Groq API key not configured properly")
+        description_result = objects_result = {
+            'success': False,
+            'error': 'Groq API key not configured'
+        }
+    elif not (image_url := await _encode_image_async(source)):
+        description_result = objects_result = {
+            'success': False,
+            'error': 'Failed to encode image'
+        }
+    elif mode == 'fused':
+        description_result, objects_result = await _fused_analysis_encoded_async(image_url)
+    else:
+        description_result, objects_result = await asyncio.gather(
+            _describe_encoded_async(image_url), _detect_objects_encoded_async(image_url))
+
+    result = _combine_results(description_result, objects_result)
     logger.info("Comprehensive image analysis completed")
-    return result 
\ No newline at end of file
+    return result
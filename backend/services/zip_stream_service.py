@@ -0,0 +1,48 @@
+import io
+import time
+import zipfile
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, compress_type=zipfile.ZIP_STORED):
+    """
+    Build a ZIP archive incrementally while its entries are produced.
+
+    Because the sink cannot seek, zipfile writes each member's sizes and CRC
+    in a data descriptor after its data, so every member can be sent as soon
+    as it is added. Only one member is held in memory at a time.
+
+    Args:
+        entries: Iterable of (name, data) pairs, consumed lazily
+        compress_type: Images are already compressed, so members are stored
+
+    Yields:
+        bytes: Consecutive chunks of the archive
+    """
+    sink = _ChunkBuffer()
+    with zipfile.ZipFile(sink, 'w', compress_type) as zf:
+        for name, data in entries:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = compress_type
+            zf.writestr(info, data)
+            yield sink.drain()
+    # Central directory written on close
+    yield sink.drain()
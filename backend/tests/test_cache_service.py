@@ -0,0 +1,34 @@
+import sqlite3
+from services.cache_service import ResultCache
+
+
+def _summed(cache):
+    with sqlite3.connect(cache.path) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+
+def test_running_byte_total_matches_stored_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / 'results.sqlite3'), max_bytes=1000, ttl_seconds=3600)
+    cache.set('op', 'a', b'x' * 300)
+    cache.set('op', 'b', b'x' * 300)
+    cache.set('op', 'a', b'x' * 100)  # replaced
+    assert cache.stats()['bytes'] == _summed(cache) == 400
+
+    for key in 'cdefg':
+        cache.set('op', key, b'x' * 300)  # over the cap: oldest entries are evicted
+    stats = cache.stats()
+    assert stats['bytes'] == _summed(cache) <= 1000
+    assert stats['operations']['op']['evictions'] > 0
+
+    cache.ttl_seconds = -1
+    assert cache.get('op', 'g') is None  # expired entries are deleted on read
+    assert cache.stats()['bytes'] == _summed(cache)
+
+
+def test_running_total_initialised_from_existing_entries(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE results (key TEXT PRIMARY KEY, op TEXT NOT NULL, kind TEXT NOT NULL, "
+                     "blob BLOB, meta TEXT, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        conn.execute("INSERT INTO results VALUES ('k', 'op', 'bytes', x'00', NULL, 123, 0, 0)")
+    assert ResultCache(path, max_bytes=1000, ttl_seconds=3600).stats()['bytes'] == 123
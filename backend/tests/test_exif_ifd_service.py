@@ -0,0 +1,41 @@
+import io
+import struct
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+from services.exif_ifd_service import scrub_jpeg_exif, tag_ids_for_names
+from services.jpeg_segment_service import APP1, iter_jpeg_segments
+
+GPS_IFD = 0x8825
+
+
+def _exif_segment(exif):
+    payload = exif.tobytes()
+    if not payload.startswith(b'Exif'):
+        payload = b'Exif\x00\x00' + payload
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def test_scrub_drops_later_exif_segments():
+    first = Image.Exif()
+    first[0x010F] = 'Canon'
+    first[0x0132] = '2024:06:01 09:14:03'
+    second = Image.Exif()
+    second[0x0110] = 'EOS R5'
+    second.get_ifd(GPS_IFD).update({1: 'N', 2: (IFDRational(48), IFDRational(51), IFDRational(2988, 100))})
+
+    output = io.BytesIO()
+    Image.new('RGB', (16, 16)).save(output, 'JPEG', exif=first.tobytes())
+    data = output.getvalue()
+    data = data[:2] + _exif_segment(first) + _exif_segment(second) + data[2:].replace(_exif_segment(first), b'', 1)
+
+    clean, removed = scrub_jpeg_exif(data, tag_ids_for_names(['DateTime']))
+
+    exif_segments = [clean[start:end] for marker, start, end in iter_jpeg_segments(clean)
+                     if marker == APP1 and clean[start + 4:start + 10] == b'Exif\x00\x00']
+    assert removed == 1
+    assert len(exif_segments) == 1
+    assert b'EOS R5' not in clean
+    with Image.open(io.BytesIO(clean)) as img:
+        exif = img.getexif()
+        assert exif.get(0x010F) == 'Canon'
+        assert 0x0132 not in exif
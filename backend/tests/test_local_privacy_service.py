@@ -0,0 +1,18 @@
+import io
+from PIL import Image
+from services.local_privacy_service import redact_image
+
+
+def test_redaction_keeps_transparency():
+    img = Image.new('RGBA', (320, 240), (255, 0, 0, 0))
+    img.paste((40, 90, 160, 255), (80, 60, 240, 180))
+    source = io.BytesIO()
+    img.save(source, 'PNG')
+
+    encoded, report = redact_image(source.getvalue())
+
+    assert report['format'] == 'PNG'
+    with Image.open(io.BytesIO(encoded)) as result:
+        assert result.mode == 'RGBA'
+        assert result.getpixel((5, 5))[3] == 0
+        assert result.getpixel((160, 120)) == (40, 90, 160, 255)
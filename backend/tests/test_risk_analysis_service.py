@@ -0,0 +1,31 @@
+import json
+from services.risk_analysis_service import _risk_request, risk_fingerprint
+
+
+def _prompt(metadata):
+    return _risk_request(metadata)['messages'][1]['content']
+
+
+def test_llm_prompt_carries_fingerprint_not_values():
+    alice = {
+        'GPSInfo': {'GPSLatitude': [48.0, 51.0, 29.88], 'GPSLongitude': [2.0, 17.0, 40.2]},
+        'DateTimeOriginal': '2024:06:01 09:14:03',
+        'Make': 'Canon',
+        'Model': 'EOS R5',
+    }
+    bob = {
+        'GPSInfo': {'GPSLatitude': [40.0, 44.0, 54.36], 'GPSLongitude': [73.0, 59.0, 8.5]},
+        'DateTimeOriginal': '2019:12:25 18:40:11',
+        'Make': 'Apple',
+        'Model': 'iPhone 13',
+    }
+    assert risk_fingerprint(alice) == risk_fingerprint(bob)
+
+    prompt = _prompt(alice)
+    assert prompt == _prompt(bob)
+    for metadata in (alice, bob):
+        for value in ('29.88', '54.36', metadata['DateTimeOriginal'], metadata['Make'], metadata['Model']):
+            assert value not in prompt
+
+    summary = json.loads(prompt[prompt.index('{'):])
+    assert summary == {'GPS': 'subsecond', 'date_fields': ['DateTimeOriginal'], 'device_fields': ['Make', 'Model']}
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+from services.single_flight_service import AsyncSingleFlight, SingleFlight
+
+
+def test_leader_result_is_not_shared_with_followers():
+    flight = SingleFlight(mode='thread')
+    release = threading.Event()
+    results = []
+
+    def compute():
+        release.wait()
+        return {'risks': []}
+
+    def call():
+        result = flight.do('key', compute)
+        result['risks'].append(threading.get_ident())
+        results.append(result)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4
+    assert all(len(result['risks']) == 1 for result in results)
+
+
+def test_async_leader_result_is_not_shared_with_followers():
+    flight = AsyncSingleFlight(mode='thread')
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return {'risks': []}
+
+    async def call(n):
+        result = await flight.do('key', compute)
+        result['risks'].append(n)
+        return result
+
+    async def main():
+        return await asyncio.gather(*(call(n) for n in range(4)))
+
+    results = asyncio.run(main())
+    assert [result['risks'] for result in results] == [[0], [1], [2], [3]]
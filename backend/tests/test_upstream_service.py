@@ -0,0 +1,108 @@
+import asyncio
+import os
+import httpx
+import pytest
+import requests
+from services.upstream_service import CircuitBreaker, Upstream, UpstreamUnavailable
+
+
+class _FailingSession:
+    def __init__(self, error):
+        self.error = error
+
+    def request(self, method, url, **kwargs):
+        raise self.error
+
+
+def _half_open_upstream(error):
+    upstream = Upstream('test', (1, 1), retries=0, breaker_threshold=1, breaker_reset_seconds=0)
+    upstream._session, upstream._session_pid = _FailingSession(error), os.getpid()
+    upstream.breaker.record_failure()
+    assert upstream.breaker.state == 'half_open'
+    return upstream
+
+
+def test_breaker_admits_one_trial_when_half_open():
+    breaker = CircuitBreaker(threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.acquire() == 'trial'
+    assert breaker.acquire() is None
+    breaker.end_trial()
+    assert breaker.acquire() == 'trial'
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError('truncated'),
+                                   requests.exceptions.ContentDecodingError('bad gzip'),
+                                   requests.exceptions.TooManyRedirects('loop')])
+def test_failed_trial_reopens_circuit(error):
+    upstream = _half_open_upstream(error)
+    with pytest.raises(type(error)):
+        upstream.request('GET', 'http://upstream.invalid/')
+    assert upstream.breaker.times_opened == 2
+    # Reset time is zero, so the next call is a new trial rather than stuck
+    assert upstream.breaker.allow()
+
+
+def test_interrupted_trial_frees_the_next_one():
+    upstream = _half_open_upstream(KeyboardInterrupt())
+    with pytest.raises(KeyboardInterrupt):
+        upstream.request('GET', 'http://upstream.invalid/')
+    assert upstream.breaker.allow()
+
+
+def test_guard_frees_trial_on_cancellation():
+    upstream = _half_open_upstream(None)
+    with pytest.raises(GeneratorExit):
+        with upstream.guard():
+            raise GeneratorExit
+    assert upstream.breaker.allow()
+    # The second trial is now running, so a concurrent call fails fast
+    with pytest.raises(UpstreamUnavailable):
+        with upstream.guard():
+            pass
+
+
+
+def _run_async_trial(handler, cancel_after=None):
+    """One arequest through a mock transport while the circuit is half-open; returns the upstream."""
+    upstream = _half_open_upstream(None)
+
+    async def call():
+        upstream._async_clients = [httpx.AsyncClient(transport=httpx.MockTransport(handler))]
+        upstream._async_loop = asyncio.get_running_loop()
+        task = asyncio.create_task(upstream.arequest('GET', 'http://upstream.invalid/'))
+        if cancel_after is not None:
+            await asyncio.sleep(cancel_after)
+            task.cancel()
+        try:
+            await task
+        finally:
+            await upstream.aclose()
+
+    return upstream, call
+
+
+@pytest.mark.parametrize('error', [httpx.RemoteProtocolError('Server disconnected'),
+                                   httpx.DecodingError('bad gzip'), httpx.TooManyRedirects('loop')])
+def test_failed_async_trial_reopens_circuit(error):
+    def handler(request):
+        raise error
+
+    upstream, call = _run_async_trial(handler)
+    with pytest.raises(type(error)):
+        asyncio.run(call())
+    assert upstream.breaker.times_opened == 2
+    assert upstream.breaker.allow()
+
+
+def test_cancelled_async_trial_frees_the_next_one():
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    upstream, call = _run_async_trial(handler, cancel_after=0.01)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(call())
+    assert upstream.breaker.times_opened == 1
+    assert upstream.breaker.allow()
@@ -3,16 +3,92 @@
 import React, { useState } from "react";
 import { motion } from "framer-motion";
 
+// Analysis types served as server-sent events, so text shows up as it is generated
+const STREAMING_TYPES = ["description", "comprehensive"];
+
+const STAGE_LABELS = {
+  received: "Preparing image...",
+  encoded: "Describing...",
+  description_delta: "Describing...",
+  description: "Finishing...",
+  objects: "Describing...",
+};
+
+// Read a text/event-stream response, calling onEvent(event, data) per event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
 const VisionAnalysis = ({ selectedFile, onAnalysisComplete }) => {
   const [loading, setLoading] = useState(false);
+  const [stage, setStage] = useState(null);
   const [analysisType, setAnalysisType] = useState("comprehensive");
   const [visionResults, setVisionResults] = useState(null);
   const [error, setError] = useState(null);
 
+  const handleStreamEvent = (event, data) => {
+    switch (event) {
+      case "description_delta":
+        setVisionResults((prev) => ({
+          ...prev,
+          description: (prev?.description || "") + data.text,
+        }));
+        break;
+      case "objects":
+        if (data.success) {
+          setVisionResults((prev) => ({
+            ...prev,
+            objects: data.objects,
+            object_count: data.object_count,
+          }));
+        }
+        break;
+      case "result":
+        if (!data.success) {
+          throw new Error(data.errors?.join("; ") || "Vision analysis failed");
+        }
+        setVisionResults(data);
+        if (onAnalysisComplete) {
+          onAnalysisComplete(data);
+        }
+        break;
+      case "error":
+        throw new Error(data.error || "Vision analysis failed");
+      default:
+        break;
+    }
+    if (STAGE_LABELS[event]) {
+      setStage(STAGE_LABELS[event]);
+    }
+  };
+
   const handleVisionAnalysis = async () => {
     if (!selectedFile) return;
 
     setLoading(true);
+    setStage("Uploading...");
     setError(null);
     setVisionResults(null);
 
@@ -34,7 +110,8 @@ const VisionAnalysis = ({ selectedFile, onAnalysisComplete }) => {
           break;
       }
 
-      const response = await fetch(endpoint, {
+      const streaming = STREAMING_TYPES.includes(analysisType);
+      const response = await fetch(streaming ? `${endpoint}/stream` : endpoint, {
         method: "POST",
         body: formData,
       });
@@ -44,6 +121,11 @@ const VisionAnalysis = ({ selectedFile, onAnalysisComplete }) => {
         throw new Error(errorData.error || "Vision analysis failed");
       }
 
+      if (streaming) {
+        await readEventStream(response, handleStreamEvent);
+        return;
+      }
+
       const data = await response.json();
       setVisionResults(data);
 
@@ -55,6 +137,7 @@ const VisionAnalysis = ({ selectedFile, onAnalysisComplete }) => {
       setError(error.message);
     } finally {
       setLoading(false);
+      setStage(null);
     }
   };
 
@@ -143,7 +226,7 @@ const VisionAnalysis = ({ selectedFile, onAnalysisComplete }) => {
         {loading ? (
           <span className="flex items-center justify-center gap-2">
             <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-white"></div>
-            Analyzing...
+            {stage || "Analyzing..."}
           </span>
         ) : (
           `Analyze Image (${analysisType})`